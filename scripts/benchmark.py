@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+"""
+Script de benchmark reproducible y sin red para extracción, pooling y escritura de embeddings
+
+Construye localmente un modelo tipo BERT con pesos aleatorios y su tokenizer, mide
+tokenización, forward pass, pooling, extracción del vocabulario, get_embedding y cada
+formato de salida de EmbeddingWriter para varios tamaños de lote y números de hilos, y
+guarda los resultados en JSON. Con --compare señala las regresiones frente a otro JSON.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.utils.config import Config
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+OUTPUT_FORMATS = ('float32', 'float16', 'int8_row', 'int8_dim', 'tsv', 'stream', 'memmap')
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark sin red de tokenización, inferencia, pooling y escritura de embeddings'
+    )
+
+    parser.add_argument('--output', type=str, help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--compare', type=str, help='JSON de referencia con el que comparar')
+    parser.add_argument('--results', type=str, help='Comparar este JSON en lugar de ejecutar el benchmark')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Aumento relativo de la mediana que se considera regresión (por defecto 0.10)')
+    parser.add_argument('--batch-sizes', type=str, default='8,32,128', help='Tamaños de lote separados por comas')
+    parser.add_argument('--threads', type=str, help='Hilos de PyTorch separados por comas (por defecto 1 y todos)')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeticiones de cada medida (se guarda la mediana)')
+    parser.add_argument('--vocab-size', type=int, default=4000, help='Tamaño del vocabulario del modelo sintético')
+    parser.add_argument('--hidden-size', type=int, default=128, help='Dimensión oculta del modelo sintético')
+    parser.add_argument('--layers', type=int, default=2, help='Capas del modelo sintético')
+    parser.add_argument('--texts', type=int, default=512, help='Número de textos sintéticos')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla del modelo y de los textos')
+
+    return parser.parse_args()
+
+def build_benchmark_model(directory: Path, vocab_size: int, hidden_size: int, layers: int, seed: int) -> list:
+    """
+    Crea un tokenizer WordPiece y un modelo BERT con pesos aleatorios en un directorio local
+
+    Returns:
+        list: Palabras completas del vocabulario (para generar textos)
+    """
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import BertConfig, BertModel, PreTrainedTokenizerFast
+
+    rng = random.Random(seed)
+    letters = list(string.ascii_lowercase)
+    words = SPECIAL_TOKENS + letters + [f"##{letter}" for letter in letters]
+    seen = set(words)
+    while len(words) < vocab_size:
+        word = ''.join(rng.choice(letters) for _ in range(rng.randint(2, 10)))
+        if rng.random() < 0.3:
+            word = f"##{word}"
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+
+    vocab = {word: i for i, word in enumerate(words)}
+    backend = Tokenizer(models.WordPiece(vocab, unk_token="[UNK]"))
+    backend.normalizer = normalizers.BertNormalizer()
+    backend.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    backend.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B [SEP]",
+        special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])]
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, unk_token="[UNK]", pad_token="[PAD]",
+        cls_token="[CLS]", sep_token="[SEP]", mask_token="[MASK]"
+    )
+    tokenizer.save_pretrained(directory)
+
+    torch.manual_seed(seed)
+    model_config = BertConfig(
+        vocab_size=len(words),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        intermediate_size=hidden_size * 4
+    )
+    BertModel(model_config).save_pretrained(directory)
+
+    return [word for word in words[len(SPECIAL_TOKENS):] if not word.startswith('##')]
+
+def build_texts(words: list, count: int, seed: int) -> list:
+    """Genera frases sintéticas de longitud variable"""
+    rng = random.Random(seed)
+    return [' '.join(rng.choices(words, k=rng.randint(4, 32))) for _ in range(count)]
+
+def benchmark_config(output_dir: Path) -> Config:
+    """Configuración aislada: sin caché, sin procesos de trabajo, sin reducción ni manifiesto y en fp32"""
+    config = Config()
+    config.config = copy.deepcopy(config.config)
+    overrides = {
+        'output_dir': str(output_dir),
+        'cache': {'enabled': False},
+        'parallel': {'workers': 1},
+        'inference': {'backend': 'fp32', 'verify': False},
+        'reduction': {'enabled': False},
+        'enrichment': {'enabled': False},
+        # El registro en el manifiesto (huella del contenido y deduplicación) no es escritura
+        'catalog': {'register': False, 'dedupe': False},
+        'output': {'tsv': False, 'storage': 'float32'}
+    }
+    for key, value in overrides.items():
+        if isinstance(value, dict):
+            config.config.setdefault(key, {}).update(value)
+        else:
+            config.config[key] = value
+    return config
+
+def time_call(function, repeats: int, items: int = None) -> dict:
+    """Mide una función (tras una ejecución de calentamiento) y resume los tiempos"""
+    function()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    result = {
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'repeats': repeats
+    }
+    if items:
+        result['items'] = items
+        result['items_per_s'] = items / result['median_s'] if result['median_s'] else 0.0
+    return result
+
+def run_model_benchmarks(model_manager, texts: list, batch_sizes: list, threads: list, repeats: int) -> dict:
+    """Tokenización, forward pass, pooling, extracción del vocabulario y get_embedding"""
+    import torch
+    from src.models.model_manager import mean_pool
+
+    results = {}
+    tokenizer = model_manager.tokenizer
+    vocab_size = len(model_manager.get_vocabulary_words())
+
+    for thread_count in threads:
+        torch.set_num_threads(thread_count)
+        for batch_size in batch_sizes:
+            suffix = f"bs={batch_size}/threads={thread_count}"
+            batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            logger.info(f"Midiendo inferencia con {suffix}...")
+
+            def tokenize():
+                return [tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512)
+                        for batch in batches]
+
+            inputs = tokenize()
+            with torch.no_grad():
+                hidden_states = [model_manager.model(**batch).last_hidden_state for batch in inputs]
+
+            def forward():
+                with torch.no_grad():
+                    for batch in inputs:
+                        model_manager.model(**batch)
+
+            def pool():
+                for hidden_state, batch in zip(hidden_states, inputs):
+                    mean_pool(hidden_state, batch['attention_mask'])
+
+            results[f"tokenize/{suffix}"] = time_call(tokenize, repeats, len(texts))
+            results[f"forward/{suffix}"] = time_call(forward, repeats, len(texts))
+            results[f"pooling/{suffix}"] = time_call(pool, repeats, len(texts))
+            results[f"encode_batch/{suffix}"] = time_call(
+                lambda: model_manager.encode_batch(texts, batch_size=batch_size), repeats, len(texts)
+            )
+
+            for batching in ('fixed', 'bucketed'):
+                results[f"extract_vocabulary/{batching}/{suffix}"] = time_call(
+                    lambda: model_manager.extract_vocabulary_embeddings(
+                        'contextual', batching=batching, batch_size=batch_size
+                    ),
+                    repeats,
+                    vocab_size
+                )
+
+        sample = texts[:50]
+
+        def get_embedding():
+            for text in sample:
+                model_manager.get_embedding(text)
+
+        results[f"get_embedding/threads={thread_count}"] = time_call(get_embedding, repeats, len(sample))
+
+    return results
+
+def run_writer_benchmarks(config: Config, matrix: np.ndarray, tokens: list, repeats: int) -> dict:
+    """Escritura del mismo conjunto en cada formato de salida"""
+    from src.models.embedding_writer import EmbeddingWriter
+
+    results = {}
+    chunk = 256
+    # Los mensajes de cada guardado no deben influir en las medidas
+    logging.getLogger('src.models.embedding_writer').setLevel(logging.WARNING)
+    for output_format in OUTPUT_FORMATS:
+        logger.info(f"Midiendo escritura en formato {output_format}...")
+        config.config['output']['tsv'] = output_format == 'tsv'
+        quantized = output_format in ('float16', 'int8_row', 'int8_dim')
+        config.config['output']['storage'] = output_format if quantized else 'float32'
+        writer = EmbeddingWriter(config)
+
+        if output_format == 'stream':
+            def write():
+                with writer.open_stream(matrix.shape[1], prefix='bench') as stream:
+                    for start in range(0, len(matrix), chunk):
+                        stream.write(matrix[start:start + chunk], tokens[start:start + chunk])
+        elif output_format == 'memmap':
+            def write():
+                rows = np.arange(len(matrix))
+                writer.save_stream(
+                    ((rows[start:start + chunk], matrix[start:start + chunk]) for start in range(0, len(matrix), chunk)),
+                    tokens,
+                    matrix.shape[1],
+                    prefix='bench'
+                )
+        else:
+            def write():
+                writer.save_embeddings(matrix, tokens, prefix='bench')
+
+        results[f"write/{output_format}"] = time_call(write, repeats, len(matrix))
+        for path in writer.output_dir.iterdir():
+            path.unlink()
+
+    config.config['output'].update({'tsv': False, 'storage': 'float32'})
+    return results
+
+def environment_info() -> dict:
+    """Versiones y hardware con los que se ha ejecutado el benchmark"""
+    import tokenizers
+    import torch
+    import transformers
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'transformers': transformers.__version__,
+        'tokenizers': tokenizers.__version__
+    }
+
+def run_benchmark(args) -> dict:
+    """Ejecuta el benchmark completo en un directorio temporal"""
+    from src.models.model_manager import ModelManager
+
+    batch_sizes = [int(value) for value in args.batch_sizes.split(',')]
+    threads = (
+        [int(value) for value in args.threads.split(',')]
+        if args.threads else sorted({1, os.cpu_count() or 1})
+    )
+
+    with tempfile.TemporaryDirectory(prefix='vector_explorer_bench_') as tmp:
+        model_dir = Path(tmp) / 'model'
+        logger.info("Construyendo modelo sintético...")
+        words = build_benchmark_model(model_dir, args.vocab_size, args.hidden_size, args.layers, args.seed)
+        texts = build_texts(words, args.texts, args.seed)
+
+        config = benchmark_config(Path(tmp) / 'output')
+        model_manager = ModelManager(config)
+        if not model_manager.load_model(str(model_dir), backend='fp32', verify=False):
+            raise RuntimeError("No se pudo cargar el modelo sintético")
+
+        results = run_model_benchmarks(model_manager, texts, batch_sizes, threads, args.repeats)
+
+        rng = np.random.default_rng(args.seed)
+        matrix = rng.standard_normal((args.vocab_size, args.hidden_size), dtype=np.float32)
+        tokens = model_manager.get_vocabulary_words()[:args.vocab_size]
+        results.update(run_writer_benchmarks(config, matrix, tokens, args.repeats))
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'settings': {
+            'batch_sizes': batch_sizes,
+            'threads': threads,
+            'repeats': args.repeats,
+            'vocab_size': args.vocab_size,
+            'hidden_size': args.hidden_size,
+            'layers': args.layers,
+            'texts': args.texts,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compara las medianas de dos ejecuciones
+
+    Returns:
+        list: Nombres de las medidas que empeoran más que threshold
+    """
+    if baseline.get('settings') != current.get('settings'):
+        logger.warning("⚠️ Los parámetros del benchmark difieren; la comparación puede no ser válida")
+
+    regressions = []
+    common = [name for name in current['results'] if name in baseline['results']]
+    logger.info(f"{'Medida':<50} {'Referencia':>12} {'Actual':>12} {'Cambio':>9}")
+    for name in common:
+        before = baseline['results'][name]['median_s']
+        after = current['results'][name]['median_s']
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  ❌ regresión'
+        logger.info(f"{name:<50} {before * 1000:>10.2f}ms {after * 1000:>10.2f}ms {change:>+8.1%}{flag}")
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        logger.warning(f"⚠️ Medidas de la referencia que no están en la ejecución actual: {', '.join(missing)}")
+
+    return regressions
+
+def main():
+    args = parse_args()
+
+    if args.results:
+        with open(args.results, encoding='utf-8') as f:
+            current = json.load(f)
+    else:
+        current = run_benchmark(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            logger.info(f"✅ Resultados guardados en {args.output}")
+        else:
+            print(json.dumps(current, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        if regressions:
+            logger.error(f"❌ {len(regressions)} medidas empeoran más de un {args.threshold:.0%}")
+            sys.exit(1)
+        logger.info(f"✅ Sin regresiones por encima del {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
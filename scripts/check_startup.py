@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Script para comprobar que el arranque de la aplicación sigue siendo rápido
+
+Importa main.py y los módulos de la visualización y de la consulta de vecinos en un
+proceso nuevo, comprueba que no se cargan dependencias pesadas (torch, transformers)
+y que el tiempo de importación está dentro del presupuesto.
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+# Dependencias que solo deben cargarse al empezar una extracción
+HEAVY_MODULES = ('torch', 'transformers', 'tokenizers', 'huggingface_hub')
+
+STARTUP_CODE = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+import src.utils.tensorboard
+import src.models.neighbor_index
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': elapsed,
+    'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+}}))
+"""
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Comprobar el tiempo de importación del arranque y la ausencia de dependencias pesadas'
+    )
+
+    parser.add_argument('--budget-ms', type=float, default=800, help='Tiempo máximo de importación en milisegundos')
+    parser.add_argument('--runs', type=int, default=3, help='Repeticiones (se toma el mejor tiempo)')
+    parser.add_argument('--top', type=int, default=10, help='Módulos más lentos a mostrar si se supera el presupuesto')
+
+    return parser.parse_args()
+
+def measure_startup() -> dict:
+    """Importa los módulos del arranque en un proceso nuevo"""
+    result = subprocess.run(
+        [sys.executable, '-c', STARTUP_CODE],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(top: int) -> list:
+    """Módulos con mayor tiempo de importación acumulado según python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True
+    )
+
+    timings = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        timings.append((int(parts[1]) / 1000, parts[2].strip()))
+
+    return sorted(timings, reverse=True)[:top]
+
+def main():
+    args = parse_args()
+
+    try:
+        runs = [measure_startup() for _ in range(args.runs)]
+    except subprocess.CalledProcessError as e:
+        logger.error(f"❌ Error al importar los módulos del arranque:\n{e.stderr}")
+        sys.exit(1)
+
+    best_ms = min(run['seconds'] for run in runs) * 1000
+    heavy = sorted({name for run in runs for name in run['heavy']})
+    logger.info(f"Tiempo de importación del arranque: {best_ms:.0f} ms (presupuesto: {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if heavy:
+        logger.error(f"❌ El arranque importa dependencias pesadas: {', '.join(heavy)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        logger.error("❌ El arranque supera el presupuesto de tiempo")
+        failed = True
+
+    if failed:
+        logger.info("Módulos más lentos (tiempo acumulado):")
+        for ms, module in slowest_imports(args.top):
+            logger.info(f"  {ms:8.1f} ms  {module}")
+        sys.exit(1)
+
+    logger.info("✅ Arranque dentro del presupuesto")
+
+if __name__ == "__main__":
+    main()
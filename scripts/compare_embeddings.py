@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Script para comparar dos conjuntos de embeddings guardados (p. ej. de dos modelos)
+
+Sobre el vocabulario compartido calcula el solapamiento de los k vecinos de cada token,
+el CKA lineal y la disparidad de un alineamiento ortogonal de Procrustes, y escribe un
+informe JSON con los tokens que más difieren y un TSV con las métricas de cada token.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+from src.models.embedding_comparison import compare_sets
+from src.models.embedding_reader import EmbeddingReader
+from src.models.embedding_writer import EmbeddingWriter, escape_token
+from src.models.models import AVAILABLE_MODELS
+from src.utils.config import Config
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Comparar dos conjuntos de embeddings: solapamiento de vecinos, CKA y Procrustes'
+    )
+
+    parser.add_argument('--set-a', type=str, help='Nombre del primer conjunto (ver manifest.json)')
+    parser.add_argument('--set-b', type=str, help='Nombre del segundo conjunto')
+    parser.add_argument('--model-a', type=str, help='Usa el conjunto más reciente de este modelo como primer conjunto')
+    parser.add_argument('--model-b', type=str, help='Usa el conjunto más reciente de este modelo como segundo conjunto')
+    parser.add_argument('--output-dir', type=str, help='Directorio donde están los conjuntos')
+    parser.add_argument('--output-prefix', type=str, help='Prefijo del informe (por defecto compare_{a}__{b})')
+    parser.add_argument('-k', type=int, help='Vecinos por token')
+    parser.add_argument('--queries', type=int, help='Tokens consultados para el solapamiento (muestra aleatoria)')
+    parser.add_argument('--top', type=int, help='Tokens más divergentes incluidos en el informe')
+
+    return parser.parse_args()
+
+def model_label(model_name: str) -> str:
+    """Nombre corto de un modelo según AVAILABLE_MODELS (o el propio nombre)"""
+    description = AVAILABLE_MODELS.get(model_name)
+    return description.split(' - ')[0] if description else model_name
+
+def resolve_set(writer: EmbeddingWriter, name: str, model: str) -> dict:
+    """Entrada del manifiesto del conjunto indicado por nombre o por modelo (el más reciente)"""
+    writer.list_available_embeddings()  # crea el manifiesto si aún no existe
+    entry = writer.catalog.get(name) if name else writer.catalog.latest(model)
+    if entry is None:
+        logger.error(f"No se encontró el conjunto {name or f'del modelo {model}'} en {writer.output_dir}")
+    return entry
+
+def describe(entry: dict, catalog) -> dict:
+    """Identificación de un conjunto en el informe"""
+    model = entry.get('model')
+    return {
+        'name': entry['name'],
+        'model': model,
+        'label': model_label(model) if model else catalog.display_name(entry),
+        'rows': entry['rows'],
+        'dims': entry['dims']
+    }
+
+def write_report(output_dir: Path, prefix: str, sets: tuple, result: dict, top: int) -> tuple:
+    """
+    Escribe el informe JSON (resumen y tokens más divergentes) y el TSV con las métricas de cada token
+
+    Returns:
+        tuple: (json_file, tsv_file)
+    """
+    tokens = result['tokens']
+    queries = result['queries']
+    overlap = result['overlap']
+    residuals = result['residuals']
+
+    # Menor solapamiento primero; a igualdad, mayor residuo de Procrustes
+    order = np.lexsort((-residuals[queries], overlap))[:top]
+    divergent = [
+        {
+            'token': tokens[queries[i]],
+            'neighbor_overlap': float(overlap[i]),
+            'procrustes_residual': float(residuals[queries[i]]),
+            'neighbors_a': [tokens[j] for j in result['neighbors_a'][i]],
+            'neighbors_b': [tokens[j] for j in result['neighbors_b'][i]]
+        }
+        for i in order
+    ]
+
+    report = {
+        'set_a': sets[0],
+        'set_b': sets[1],
+        'shared_tokens': len(tokens),
+        'k': result['k'],
+        'queries': len(queries),
+        'neighbor_overlap': {
+            'mean': float(overlap.mean()),
+            'median': float(np.median(overlap)),
+            'p10': float(np.percentile(overlap, 10))
+        },
+        'linear_cka': result['cka'],
+        'procrustes_disparity': result['disparity'],
+        'divergent_tokens': divergent
+    }
+
+    json_file = output_dir / f"{prefix}.json"
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    # Una fila por token compartido; el solapamiento queda vacío en los no consultados
+    overlap_by_row = np.full(len(tokens), np.nan, dtype=np.float32)
+    overlap_by_row[queries] = overlap
+    tsv_file = output_dir / f"{prefix}.tsv"
+    with open(tsv_file, 'w', encoding='utf-8') as f:
+        f.write("token\tneighbor_overlap\tprocrustes_residual\n")
+        for token, token_overlap, residual in zip(tokens, overlap_by_row, residuals):
+            overlap_text = '' if np.isnan(token_overlap) else f"{token_overlap:.6g}"
+            f.write(f"{escape_token(token)}\t{overlap_text}\t{residual:.6g}\n")
+
+    return json_file, tsv_file
+
+def main():
+    args = parse_args()
+
+    if not (args.set_a or args.model_a) or not (args.set_b or args.model_b):
+        logger.error("Indica los dos conjuntos con --set-a/--model-a y --set-b/--model-b")
+        return 1
+
+    config = Config()
+    if args.output_dir:
+        config.set_output_dir(args.output_dir)
+
+    writer = EmbeddingWriter(config)
+    entries = (resolve_set(writer, args.set_a, args.model_a), resolve_set(writer, args.set_b, args.model_b))
+    if None in entries:
+        return 1
+
+    try:
+        readers = [
+            EmbeddingReader(writer.output_dir / entry['tensor'], writer.output_dir / entry['metadata'], config)
+            for entry in entries
+        ]
+        sets = tuple(describe(entry, writer.catalog) for entry in entries)
+        logger.info(f"Comparando {sets[0]['label']} ({sets[0]['name']}) con {sets[1]['label']} ({sets[1]['name']})...")
+
+        started = time.perf_counter()
+        result = compare_sets(
+            *readers,
+            k=args.k or config.get('compare.k', 10),
+            queries=args.queries or config.get('compare.queries'),
+            chunk_rows=config.get('compare.chunk_rows', 4096),
+            seed=config.get('compare.seed', 0)
+        )
+
+        prefix = args.output_prefix or f"compare_{entries[0]['name']}__{entries[1]['name']}"
+        json_file, tsv_file = write_report(
+            writer.output_dir, prefix, sets, result, args.top or config.get('compare.top', 50)
+        )
+    except Exception as e:
+        logger.error(f"❌ Error al comparar los conjuntos: {str(e)}")
+        return 1
+
+    logger.info(f"✅ Comparación completada en {time.perf_counter() - started:.1f}s")
+    logger.info(f"   - Solapamiento medio de {result['k']} vecinos: {result['overlap'].mean():.3f}")
+    logger.info(f"   - CKA lineal: {result['cka']:.4f}")
+    logger.info(f"   - Disparidad de Procrustes: {result['disparity']:.4f}")
+    logger.info(f"   - Informe: {json_file}")
+    logger.info(f"   - Métricas por token: {tsv_file}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
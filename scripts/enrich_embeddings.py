@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Script para enriquecer los metadatos de un conjunto de embeddings ya guardado
+
+Reescribe su metadata.tsv con encabezado y, tras el token, su id en el vocabulario, su longitud
+en tokens, su tipo (special, subword o word), el grupo de un k-means por mini-lotes sobre el
+tensor y la norma del vector, para colorear y filtrar por ellos en el proyector.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from src.models.embedding_writer import EmbeddingWriter
+from src.utils.config import Config
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Añadir id, longitud, tipo, grupo y norma a los metadatos de un conjunto de embeddings'
+    )
+
+    parser.add_argument('--set', type=str, help='Nombre del conjunto (ver manifest.json)')
+    parser.add_argument('--model', type=str, help='Usa el conjunto más reciente de este modelo')
+    parser.add_argument('--output-dir', type=str, help='Directorio donde están los conjuntos')
+    parser.add_argument('--tokenizer', type=str,
+                        help='Tokenizador para id y length (por defecto, el del modelo del conjunto)')
+    parser.add_argument('--no-tokenizer', action='store_true', help='No calcular id ni length')
+    parser.add_argument('--clusters', type=int, help='Número de grupos del k-means')
+    parser.add_argument('--passes', type=int, help='Pasadas del k-means sobre el conjunto')
+
+    return parser.parse_args()
+
+def load_tokenizer(model_name: str, revision: str = None):
+    """Carga solo el tokenizador de un modelo (None si no se puede)"""
+    try:
+        # Importación diferida: transformers solo hace falta para id y length
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name, revision=revision)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cargar el tokenizador de {model_name} ({str(e)}); se omiten id y length")
+        return None
+
+def main():
+    args = parse_args()
+
+    if not (args.set or args.model):
+        logger.error("Indica el conjunto con --set o --model")
+        return 1
+
+    config = Config()
+    if args.output_dir:
+        config.set_output_dir(args.output_dir)
+    overrides = {'clusters': args.clusters, 'passes': args.passes}
+    config.config.setdefault('enrichment', {}).update({key: value for key, value in overrides.items() if value is not None})
+
+    writer = EmbeddingWriter(config)
+    writer.list_available_embeddings()  # crea el manifiesto si aún no existe
+    entry = writer.catalog.get(args.set) if args.set else writer.catalog.latest(args.model)
+    if entry is None:
+        logger.error(f"No se encontró el conjunto {args.set or f'del modelo {args.model}'} en {writer.output_dir}")
+        return 1
+
+    tokenizer = None
+    model_name = args.tokenizer or entry.get('model')
+    if not args.no_tokenizer:
+        if model_name:
+            # La revisión del conjunto solo vale para su propio modelo
+            tokenizer = load_tokenizer(model_name, None if args.tokenizer else entry.get('revision'))
+        else:
+            logger.warning("⚠️ El conjunto no tiene modelo registrado; indica --tokenizer para calcular id y length")
+
+    try:
+        started = time.perf_counter()
+        _, metadata_file, _ = writer.enrich_set(entry['name'], tokenizer)
+    except Exception as e:
+        logger.error(f"❌ Error al enriquecer el conjunto: {str(e)}")
+        return 1
+
+    logger.info(f"✅ Metadatos enriquecidos en {time.perf_counter() - started:.1f}s: {metadata_file}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
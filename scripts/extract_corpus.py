@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Script para obtener embeddings de tokens promediados sobre un corpus
+
+Pasa el corpus por el modelo en streaming y promedia el vector contextual de cada
+aparición de cada token del vocabulario, sin guardar los vectores de cada aparición.
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from src.models.model_manager import ModelManager
+from src.models.embedding_writer import EmbeddingWriter
+from src.utils.config import Config
+from src.utils.metrics import RunMetrics
+from src.utils.text_input import iter_input_batches
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Extraer embeddings de tokens promediados sobre las apariciones en un corpus'
+    )
+
+    parser.add_argument('--input-file', type=str, required=True,
+                        help="Corpus de entrada (una oración por línea, '-' para leer de stdin)")
+    parser.add_argument('--model', type=str, help='Nombre del modelo a usar')
+    parser.add_argument('--output-dir', type=str, help='Directorio de salida')
+    parser.add_argument('--output-prefix', type=str, help='Prefijo para los archivos de salida')
+    parser.add_argument('--batch-size', type=int, default=32, help='Líneas por forward pass')
+    parser.add_argument('--layer', type=int, help='Capa oculta de la que se toman los vectores (-1 es la última)')
+    parser.add_argument('--min-count', type=int, help='Apariciones mínimas para incluir un token')
+    parser.add_argument('--variance', action='store_true', default=None,
+                        help='Añade la varianza media de cada token como columna de metadatos')
+    parser.add_argument('--include-special', action='store_true', default=None,
+                        help='Incluye los tokens especiales ([CLS], [SEP]...)')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    config = Config()
+    if args.output_dir:
+        config.set_output_dir(args.output_dir)
+
+    from_stdin = args.input_file == '-'
+    if not from_stdin and not Path(args.input_file).exists():
+        logger.error(f"El archivo {args.input_file} no existe")
+        return 1
+
+    model_manager = ModelManager(config)
+    writer = EmbeddingWriter(config)
+
+    try:
+        if not model_manager.load_model(args.model):
+            return 1
+
+        metrics = RunMetrics(labels={
+            'model': model_manager.model_name,
+            'mode': 'corpus',
+            'backend': model_manager.inference_backend
+        })
+        model_manager.metrics = metrics
+        writer.metrics = metrics
+        writer.tokenizer = model_manager.tokenizer
+
+        source = sys.stdin if from_stdin else open(args.input_file, 'r', encoding='utf-8')
+        try:
+            accumulator = model_manager.accumulate_corpus_embeddings(
+                iter_input_batches(source, args.batch_size),
+                layer=args.layer,
+                include_special=args.include_special,
+                variance=args.variance
+            )
+        finally:
+            if not from_stdin:
+                source.close()
+
+        min_count = args.min_count or config.get('corpus.min_count', 1)
+        ids, means, counts, variance = accumulator.finalize(min_count)
+        if not len(ids):
+            logger.error(f"Ningún token aparece al menos {min_count} veces en el corpus")
+            return 1
+
+        # El recuento (y la varianza) de cada token viajan como columnas de metadatos
+        columns = {'count': counts.tolist()}
+        if variance is not None:
+            columns['variance'] = variance.mean(dim=1).tolist()
+
+        prefix = args.output_prefix or ('corpus' if from_stdin else f"{Path(args.input_file).stem}_corpus")
+        tensor_file, metadata_file, _ = writer.save_embeddings(
+            means,
+            model_manager.tokenizer.convert_ids_to_tokens(ids.tolist()),
+            prefix=prefix,
+            metadata_columns=columns,
+            info={
+                'model': model_manager.model_name,
+                'revision': model_manager.model_revision,
+                'backend': model_manager.inference_backend,
+                'mode': 'corpus',
+                'layer': args.layer if args.layer is not None else config.get('corpus.layer', -1)
+            }
+        )
+
+        vocab_size = len(model_manager.get_vocabulary_words())
+        logger.info(
+            f"✅ {len(ids)} de {vocab_size} tokens del vocabulario ({len(ids) / vocab_size:.1%}) "
+            f"a partir de {accumulator.occurrences} apariciones"
+        )
+        logger.info(f"   - Tensores: {tensor_file}")
+        logger.info(f"   - Metadatos: {metadata_file} (token, {', '.join(columns)})")
+
+        if config.get('metrics.enabled', True):
+            metrics.write(config, prefix)
+        return 0
+
+    except Exception as e:
+        logger.error(f"❌ Error al procesar el corpus: {str(e)}")
+        return 1
+
+if __name__ == '__main__':
+    exit(main())
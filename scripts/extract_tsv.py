@@ -3,13 +3,16 @@
 Script para extraer solo los archivos TSV sin visualización
 """
 import argparse
+import hashlib
 import logging
+import sys
 from pathlib import Path
-import numpy as np
 
-from src.models.model_manager import ModelManager
 from src.models.embedding_writer import EmbeddingWriter
+from src.models.embedding_client import EmbeddingClient
 from src.utils.config import Config
+from src.utils.metrics import RunMetrics, profile_batches
+from src.utils.text_input import iter_input_batches
 
 # Configurar logging
 logging.basicConfig(
@@ -25,25 +28,36 @@ def parse_args():
     )
     
     parser.add_argument('--text', type=str, help='Texto para generar embeddings')
-    parser.add_argument('--input-file', type=str, help='Archivo de texto de entrada (una oración por línea)')
+    parser.add_argument('--input-file', type=str, help="Archivo de texto de entrada (una oración por línea, '-' para leer de stdin)")
     parser.add_argument('--model', type=str, help='Nombre del modelo a usar')
     parser.add_argument('--output-dir', type=str, help='Directorio de salida para los archivos TSV')
     parser.add_argument('--output-prefix', type=str, help='Prefijo para los archivos de salida')
     parser.add_argument('--batch-size', type=int, default=32, help='Tamaño del batch para procesar textos')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reanuda una extracción interrumpida de --input-file desde el primer lote pendiente')
+    parser.add_argument('--server', type=str, nargs='?', const='',
+                        help='Usa el servidor de embeddings (scripts/serve_embeddings.py) en lugar de cargar el modelo; '
+                             'opcionalmente, su dirección (por defecto, server.host:server.port)')
     
     return parser.parse_args()
 
-def process_text(text: str, model_manager: ModelManager, writer: EmbeddingWriter, prefix: str = None):
+def process_text(text: str, model_manager: 'ModelManager', writer: EmbeddingWriter, prefix: str = None):
     """Procesa un texto y guarda sus embeddings"""
     try:
         # Generar embeddings
-        embeddings = model_manager.get_embeddings(text)
+        embeddings = model_manager.encode_batch([text])
         
-        # Guardar archivos
+        # Guardar archivos (una fila de metadatos por vector)
         tensor_file, metadata_file, _ = writer.save_embeddings(
-            embeddings.numpy(),
-            text.split(),  # Tokenización simple para metadatos
-            prefix=prefix
+            embeddings,
+            [text],
+            prefix=prefix,
+            info={
+                'model': model_manager.model_name,
+                'revision': model_manager.model_revision,
+                'backend': model_manager.inference_backend,
+                'mode': 'text'
+            }
         )
         
         logger.info(f"✅ Embeddings guardados en:")
@@ -55,55 +69,127 @@ def process_text(text: str, model_manager: ModelManager, writer: EmbeddingWriter
         logger.error(f"❌ Error al procesar texto: {str(e)}")
         return False
 
-def process_file(file_path: str, model_manager: ModelManager, writer: EmbeddingWriter,
-                batch_size: int = 32, prefix: str = None):
-    """Procesa un archivo de texto línea por línea"""
+def file_fingerprint(file_path: Path, sample_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Huella de un archivo de entrada: tamaño, fecha de modificación y hash del principio y del final
+
+    Se calcula en tiempo constante, sin leer el archivo entero antes del primer lote. Un cambio
+    en medio de un archivo del mismo tamaño también cambia su fecha de modificación.
+    """
+    stat = file_path.stat()
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(sample_size))
+        if stat.st_size > sample_size:
+            f.seek(max(sample_size, stat.st_size - sample_size))
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+def open_output_stream(file_path: Path, model_manager: 'ModelManager', writer: EmbeddingWriter,
+                       prefix: str, resume: bool = False):
+    """
+    Abre el conjunto de salida, o reabre el de una ejecución interrumpida si se pide reanudar
+
+    Returns:
+        EmbeddingStream o None si el progreso guardado no corresponde al modelo o a la entrada
+    """
+    dim = model_manager.get_embedding_dim('contextual')
+    info = {
+        'model': model_manager.model_name,
+        'revision': model_manager.model_revision,
+        'backend': model_manager.inference_backend,
+        'mode': 'text'
+    }
+    if file_path is None:
+        # stdin no se puede volver a leer, así que no se guarda progreso
+        return writer.open_stream(dim, prefix=prefix, info=info)
+    
+    identity = {
+        'model': model_manager.model_name,
+        'revision': model_manager.model_revision,
+        'backend': model_manager.inference_backend,
+        'input': file_fingerprint(file_path)
+    }
+    
+    if resume:
+        progress_file = writer.find_stream_checkpoint(prefix)
+        if progress_file:
+            mismatches = writer.checkpoint_mismatches(writer.load_checkpoint(progress_file), identity)
+            if mismatches:
+                logger.error(f"❌ No se puede reanudar {progress_file}: ha cambiado {', '.join(mismatches)}")
+                return None
+            stream = writer.resume_stream(progress_file)
+            logger.info(f"Reanudando {progress_file} tras {stream.rows} líneas ya procesadas")
+            return stream
+        logger.warning("⚠️ No hay progreso guardado que reanudar, se empieza desde el principio")
+    
+    return writer.open_stream(dim, prefix=prefix, checkpoint=identity, info=info)
+
+def process_file(file_path: str, model_manager: 'ModelManager', writer: EmbeddingWriter,
+                batch_size: int = 32, prefix: str = None, resume: bool = False, parallel: bool = False):
+    """
+    Procesa un archivo de texto (o stdin con '-') línea por línea, escribiendo cada lote al terminarlo
+
+    Con parallel, los lotes se reparten entre procesos de trabajo (ParallelExtractor); solo
+    es posible con el modelo cargado en este proceso, no con el cliente del servidor.
+    """
     try:
-        file_path = Path(file_path)
-        if not file_path.exists():
-            logger.error(f"El archivo {file_path} no existe")
-            return False
-            
-        # Leer líneas del archivo
-        with open(file_path, 'r', encoding='utf-8') as f:
-            texts = [line.strip() for line in f if line.strip()]
+        from_stdin = file_path == '-'
+        if from_stdin:
+            if resume:
+                logger.error("No se puede reanudar una extracción que lee de stdin")
+                return False
+        else:
+            file_path = Path(file_path)
+            if not file_path.exists():
+                logger.error(f"El archivo {file_path} no existe")
+                return False
             
-        if not texts:
-            logger.warning("El archivo está vacío")
+        prefix = prefix or ('stdin' if from_stdin else file_path.stem)
+        stream = open_output_stream(None if from_stdin else file_path, model_manager, writer, prefix, resume)
+        if stream is None:
             return False
             
-        total_lines = len(texts)
-        logger.info(f"Procesando {total_lines} líneas...")
-        
-        # Procesar por lotes
-        embeddings_list = []
-        tokens_list = []
+        source = sys.stdin if from_stdin else open(file_path, 'r', encoding='utf-8')
+        logger.info(f"Procesando {'stdin' if from_stdin else file_path} en lotes de {batch_size} líneas...")
         
-        for i in range(0, total_lines, batch_size):
-            batch = texts[i:i + batch_size]
-            batch_size_actual = len(batch)
+        try:
+            batches = iter_input_batches(source, batch_size, skip=stream.rows)
+            
+            # Procesar por lotes (un forward pass por lote)
+            if parallel:
+                # Repartir los lotes entre procesos de trabajo; los resultados llegan en orden
+                from src.models.parallel_extractor import ParallelExtractor
+                extractor = ParallelExtractor(
+                    model_manager.config, model_manager.model_name, backend=model_manager.inference_backend
+                )
+                results = extractor.iter_texts(batches, model_manager.metrics)
+            else:
+                results = ((batch, model_manager.encode_batch(batch)) for batch in batches)
+                if model_manager.config.get('metrics.profile', False):
+                    results = profile_batches(
+                        results,
+                        model_manager.config.get('metrics.profile_batches', 5),
+                        writer.output_dir / f"{prefix}_profile_trace.json"
+                    )
             
-            # Procesar cada texto en el lote
-            for text in batch:
-                embeddings = model_manager.get_embeddings(text)
-                embeddings_list.append(embeddings.numpy())
-                tokens_list.extend(text.split())
+            # Cada lote se añade a los archivos de salida en cuanto está listo
+            with stream:
+                for batch, embeddings in results:
+                    stream.write(embeddings, batch)
+                    logger.info(f"Procesados {stream.rows} textos")
                 
-            logger.info(f"Procesados {min(i + batch_size_actual, total_lines)}/{total_lines} textos")
-        
-        # Guardar resultados combinados
-        combined_embeddings = np.vstack(embeddings_list)
-        
-        prefix = prefix or file_path.stem
-        tensor_file, metadata_file, _ = writer.save_embeddings(
-            combined_embeddings,
-            tokens_list,
-            prefix=prefix
-        )
+                if not stream.rows:
+                    stream.discard()
+                    logger.warning("El archivo está vacío")
+                    return False
+        finally:
+            if not from_stdin:
+                source.close()
         
         logger.info(f"✅ Embeddings guardados en:")
-        logger.info(f"   - Tensores: {tensor_file}")
-        logger.info(f"   - Metadatos: {metadata_file}")
+        logger.info(f"   - Tensores: {stream.tensor_file}")
+        logger.info(f"   - Metadatos: {stream.metadata_file}")
         return True
         
     except Exception as e:
@@ -124,20 +210,45 @@ def main():
     if args.output_dir:
         config.set_output_dir(args.output_dir)
     
-    model_manager = ModelManager(config)
+    parallel = False
+    if args.server is not None:
+        # El modelo ya está cargado en el servidor; aquí solo se escriben los resultados
+        # (sin importar torch ni transformers)
+        model_manager = EmbeddingClient(args.server or None, config)
+    else:
+        # Importación diferida: torch y transformers solo hacen falta sin servidor
+        from src.models.model_manager import ModelManager
+        from src.models.parallel_extractor import ParallelExtractor
+        model_manager = ModelManager(config)
+        parallel = ParallelExtractor.is_enabled(config)
     writer = EmbeddingWriter(config)
     
     try:
         # Cargar modelo
-        model_manager.load_model(args.model)
+        if not model_manager.load_model(args.model):
+            return 1
+        
+        # Las métricas de la ejecución empiezan tras cargar el modelo
+        metrics = RunMetrics(labels={
+            'model': model_manager.model_name,
+            'mode': 'text' if args.text else 'file',
+            'backend': model_manager.inference_backend
+        })
+        model_manager.metrics = metrics
+        writer.metrics = metrics
+        # El cliente del servidor no tiene tokenizador: sin él, el enriquecimiento omite id y length
+        writer.tokenizer = getattr(model_manager, 'tokenizer', None)
         
         success = False
         if args.text:
             success = process_text(args.text, model_manager, writer, args.output_prefix)
         else:
             success = process_file(args.input_file, model_manager, writer, 
-                                 args.batch_size, args.output_prefix)
+                                 args.batch_size, args.output_prefix, args.resume, parallel)
             
+        model_manager.log_cache_stats()
+        if success and config.get('metrics.enabled', True):
+            metrics.write(config, args.output_prefix)
         return 0 if success else 1
         
     except Exception as e:
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Script para consultar los vecinos más cercanos en un conjunto de embeddings guardado
+"""
+import argparse
+import logging
+import sys
+import time
+
+from src.models.embedding_writer import EmbeddingWriter
+from src.models.neighbor_index import load_index
+from src.utils.config import Config
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Consultar los vecinos más cercanos (similitud coseno) de un token o un texto'
+    )
+    
+    parser.add_argument('--set', type=str, help='Nombre base del conjunto (por defecto tensor.* / metadata.tsv)')
+    parser.add_argument('--token', type=str, help='Token del conjunto a consultar')
+    parser.add_argument('--text', type=str, help='Texto libre a consultar (se codifica con el modelo)')
+    parser.add_argument('--model', type=str, help='Modelo para codificar textos libres (por defecto, el del conjunto)')
+    parser.add_argument('--output-dir', type=str, help='Directorio donde están los conjuntos')
+    parser.add_argument('-k', type=int, help='Número de vecinos')
+    parser.add_argument('--ivf', action='store_true', help='Usar un índice IVF aproximado')
+    parser.add_argument('--nprobe', type=int, help='Listas IVF a explorar por consulta')
+    
+    return parser.parse_args()
+
+def print_neighbors(query: str, results: list, elapsed: float):
+    """Muestra los resultados de una consulta"""
+    logger.info(f"Vecinos de '{query}' ({elapsed * 1000:.1f} ms):")
+    for rank, (token, score, _) in enumerate(results, start=1):
+        logger.info(f"  {rank:>3}. {token}\t{score:.4f}")
+
+def main():
+    args = parse_args()
+    
+    if not args.token and not args.text:
+        logger.error("Debes indicar --token o --text")
+        return 1
+        
+    config = Config()
+    
+    if args.output_dir:
+        config.set_output_dir(args.output_dir)
+    
+    writer = EmbeddingWriter(config)
+    tensor_file, metadata_file = writer.find_embeddings(args.set)
+    if not tensor_file:
+        logger.error(f"No se encontró el conjunto '{args.set or 'tensor'}' en {writer.output_dir}")
+        return 1
+    
+    k = args.k or config.get('neighbors.k', 10)
+    index = load_index(config, tensor_file, metadata_file, True if args.ivf else None)
+    nprobe = (args.nprobe or config.get('neighbors.nprobe', 16)) if index.centroids is not None else None
+    
+    if args.token:
+        started = time.perf_counter()
+        results = index.search_token(args.token, k, nprobe)
+        if results is None:
+            logger.error(f"El token '{args.token}' no está en el conjunto")
+            return 1
+        print_neighbors(args.token, results, time.perf_counter() - started)
+        
+    if args.text:
+        # El texto se codifica con el modelo y el modo con los que se extrajo el conjunto (según el manifiesto)
+        entry = writer.set_entry(tensor_file) or {}
+        if entry.get('mode') == 'corpus':
+            logger.error("Los conjuntos de corpus no admiten textos libres; consulta un token con --token")
+            return 1
+        model_name = entry.get('model') or args.model
+        if entry.get('model') and args.model and args.model != entry['model']:
+            logger.error(f"El conjunto se extrajo con {entry['model']}; no se puede consultar con {args.model}")
+            return 1
+        if not model_name:
+            logger.warning("⚠️ El conjunto no tiene modelo registrado; se usa el modelo por defecto (indica --model si no es el suyo)")
+        
+        # Importación diferida: solo las consultas de texto libre necesitan el modelo
+        from src.models.model_manager import ModelManager
+        model_manager = ModelManager(config)
+        if not model_manager.load_model(model_name):
+            return 1
+        
+        started = time.perf_counter()
+        try:
+            vector = model_manager.encode_query(args.text, entry)
+            results = index.search(vector, k, nprobe)
+        except ValueError as e:
+            logger.error(f"❌ {str(e)}")
+            return 1
+        print_neighbors(args.text, results, time.perf_counter() - started)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Script para mantener los modelos cargados en un servidor de embeddings local
+
+Los clientes (por ejemplo, scripts/extract_tsv.py con --server) piden embeddings por HTTP
+en localhost; las peticiones que llegan a la vez se agrupan en micro-lotes.
+"""
+import argparse
+import logging
+
+from src.models.embedding_server import EmbeddingServer
+from src.utils.config import Config
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Servidor local de embeddings con micro-lotes'
+    )
+
+    parser.add_argument('--model', type=str, help='Modelo a cargar al arrancar (por defecto, default_model)')
+    parser.add_argument('--host', type=str, help='Dirección de escucha (por defecto, server.host)')
+    parser.add_argument('--port', type=int, help='Puerto (por defecto, server.port)')
+    parser.add_argument('--batch-window-ms', type=float, help='Espera máxima para agrupar peticiones en un lote')
+    parser.add_argument('--max-batch-size', type=int, help='Máximo de textos por forward pass')
+    parser.add_argument('--max-queue', type=int, help='Peticiones en cola por modelo antes de responder 503')
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    config = Config()
+    overrides = {
+        'host': args.host,
+        'port': args.port,
+        'batch_window_ms': args.batch_window_ms,
+        'max_batch_size': args.max_batch_size,
+        'max_queue': args.max_queue
+    }
+    config.config.setdefault('server', {}).update({key: value for key, value in overrides.items() if value is not None})
+
+    server = EmbeddingServer(config)
+    try:
+        server.run(args.model)
+    except KeyboardInterrupt:
+        logger.info("Servidor detenido")
+    except Exception as e:
+        logger.error(f"❌ Error en el servidor de embeddings: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,9 +1,14 @@
+import hashlib
+import json
 import logging
+import threading
+import time
 import inquirer
-from src.models.model_manager import ModelManager
 from src.models.embedding_writer import EmbeddingWriter
+from src.models.neighbor_index import load_index
 from src.utils.tensorboard import TensorBoardManager
 from src.utils.config import Config
+from src.utils.metrics import RunMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -12,14 +17,44 @@ class CLI:
     
     def __init__(self):
         self.config = Config()
-        self.model_manager = ModelManager(self.config)
+        self._model_manager = None
+        self._model_manager_lock = threading.Lock()
         self.embedding_writer = EmbeddingWriter(self.config)
         self.tensorboard = TensorBoardManager(self.config)
+        self.neighbor_indexes = {}
     
+    @property
+    def model_manager(self):
+        """
+        Gestor de modelos, creado al usarlo por primera vez
+
+        ModelManager importa torch y transformers, que tardan varios segundos en cargar;
+        así el menú y la visualización no pagan ese coste.
+        """
+        with self._model_manager_lock:
+            if self._model_manager is None:
+                from src.models.model_manager import ModelManager
+                self._model_manager = ModelManager(self.config)
+            return self._model_manager
+
+    def _preload_default_model(self):
+        """Importa las dependencias y carga el modelo por defecto en segundo plano mientras se muestra el menú"""
+        if not self.config.get('models.preload_default', False):
+            return
+
+        def run():
+            try:
+                self.model_manager.preload_model()
+            except Exception as e:
+                logger.debug(f"No se pudo precargar el modelo por defecto: {str(e)}")
+
+        threading.Thread(target=run, name="preload-default-model", daemon=True).start()
+
     def run(self):
         """Ejecuta la interfaz interactiva"""
         logger.info("\n¡Bienvenido al explorador de embeddings!")
         logger.info("Este programa te permite extraer y visualizar embeddings de modelos.")
+        self._preload_default_model()
         
         while True:
             questions = [
@@ -28,6 +63,7 @@ class CLI:
                     choices=[
                         ('Extraer embeddings', 'extract'),
                         ('Visualizar embeddings existentes', 'visualize'),
+                        ('Consultar vecinos más cercanos', 'neighbors'),
                         ('Salir', 'exit')
                     ]
                 )
@@ -39,6 +75,8 @@ class CLI:
                 self._extract_embeddings()
             elif answers['action'] == 'visualize':
                 self._visualize_embeddings()
+            elif answers['action'] == 'neighbors':
+                self._query_neighbors()
             else:
                 logger.info("¡Hasta luego!")
                 break
@@ -65,35 +103,278 @@ class CLI:
         if not self.model_manager.load_model(model_name):
             return
 
+        # Seleccionar modo de extracción
+        modes = self.model_manager.EXTRACTION_MODES
+        questions = [
+            inquirer.List('mode',
+                message="Selecciona el modo de extracción:",
+                choices=[(desc, name) for name, desc in modes.items()],
+                default=self.config.get('extraction.mode', 'contextual')
+            ),
+            inquirer.Confirm('position',
+                message="¿Incluir el embedding de posición?",
+                default=self.config.get('extraction.static_position', False),
+                ignore=lambda answers: answers['mode'] != 'static'
+            ),
+            inquirer.Confirm('layernorm',
+                message="¿Aplicar la LayerNorm de la capa de embeddings?",
+                default=self.config.get('extraction.static_layernorm', False),
+                ignore=lambda answers: answers['mode'] != 'static'
+            ),
+            inquirer.Text('layers',
+                message="Capas a extraer (separadas por comas, -1 es la última)",
+                default=','.join(str(layer) for layer in self.config.get('extraction.layers', [-1])),
+                ignore=lambda answers: answers['mode'] != 'contextual'
+            ),
+            inquirer.Checkbox('pooling',
+                message="Estrategias de pooling:",
+                choices=[(desc, name) for name, desc in self.model_manager.POOLING_MODES.items()],
+                default=self.config.get('extraction.pooling', ['mean']),
+                ignore=lambda answers: answers['mode'] != 'contextual'
+            )
+        ]
+
+        answers = inquirer.prompt(questions)
+        if not answers:
+            return
+
         try:
             logger.info("\nExtrayendo embeddings del vocabulario completo...")
-            embeddings_matrix, vocab_words = self.model_manager.extract_vocabulary_embeddings()
-            
-            self.embedding_writer.save_batch_embeddings(
-                embeddings_matrix, 
-                vocab_words, 
-                model_name
+            mode = answers['mode']
+            options = {
+                'include_position': answers['position'],
+                'include_layernorm': answers['layernorm']
+            }
+            if mode == 'contextual':
+                options['layers'] = [int(layer) for layer in answers['layers'].split(',') if layer.strip()]
+                options['pooling'] = answers['pooling']
+            # Cada combinación de capa y pooling se guarda como un conjunto propio
+            extraction_views = self.model_manager.extraction_views(
+                mode, options.get('layers'), options.get('pooling')
+            )
+            views = [name for name, _, _ in extraction_views]
+            views = views if len(views) > 1 else None
+            # Una sola vista distinta de la de por defecto lleva su nombre, para no sustituir a esta
+            single_view = None
+            if mode == 'contextual' and not views and not self.model_manager.is_default_view(extraction_views[0]):
+                single_view = extraction_views[0][0]
+            vocab_words = self.model_manager.get_vocabulary_words()
+            checkpoint = {
+                'model': model_name,
+                'revision': self.model_manager.model_revision,
+                'backend': self.model_manager.inference_backend,
+                'input': self.model_manager.vocabulary_fingerprint(mode, **options)
+            }
+            # Cada modelo, modo y combinación de opciones tiene sus propios conjuntos, para poder
+            # compararlos sin volver a extraer; la huella corta distingue las opciones
+            options_hash = hashlib.sha256(json.dumps(checkpoint, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+            prefix = f"{self.embedding_writer.model_prefix(model_name)}_{mode}"
+            if single_view:
+                prefix = f"{prefix}_{single_view}"
+            prefix = f"{prefix}_{options_hash}"
+            resume = self._ask_resume(checkpoint, prefix)
+            if not resume and not self._confirm_overwrite(
+                [f"{prefix}_{view}" for view in views] if views else [prefix]
+            ):
+                return
+
+            # Una sola instancia de métricas para el modelo y la escritura de esta extracción
+            metrics = RunMetrics(labels={
+                'model': model_name,
+                'mode': mode,
+                'backend': self.model_manager.inference_backend
+            })
+            self.model_manager.metrics = metrics
+            self.embedding_writer.metrics = metrics
+            self.embedding_writer.tokenizer = self.model_manager.tokenizer
+
+            batches = self.model_manager.iter_vocabulary_embeddings(
+                mode,
+                start_batch=resume['batches'] if resume else 0,
+                **options
+            )
+
+            # Los lotes se escriben en disco a medida que se generan
+            self.embedding_writer.save_stream(
+                batches,
+                vocab_words,
+                self.model_manager.get_embedding_dim(mode),
+                prefix=prefix,
+                checkpoint=checkpoint,
+                resume=resume,
+                views=views,
+                info={
+                    'model': model_name,
+                    'revision': self.model_manager.model_revision,
+                    'backend': self.model_manager.inference_backend,
+                    'mode': mode,
+                    **({'view': single_view} if single_view else {}),
+                    # Con ellas los textos libres se codifican igual que el conjunto (ModelManager.encode_query)
+                    **({
+                        'include_position': options['include_position'],
+                        'include_layernorm': options['include_layernorm']
+                    } if mode == 'static' else {})
+                }
             )
             logger.info("✅ Embeddings del vocabulario completo guardados en embeddings_output/")
-            logger.info("   - tensor.tsv: Contiene los vectores de embeddings")
-            logger.info("   - metadata.tsv: Contiene los tokens correspondientes")
+            output_dir = self.embedding_writer.output_dir
+            if views:
+                # Un conjunto por vista, todos del mismo forward pass por lote
+                for view in views:
+                    logger.info(f"   - {prefix}_{view}_tensor.* / {prefix}_{view}_metadata.tsv")
+            else:
+                storage = self.config.get('output.storage', 'float32')
+                logger.info(f"   - {prefix}_tensor.npy: Contiene los vectores de embeddings ({storage})")
+                if (output_dir / f"{prefix}_tensor.bytes").exists():
+                    logger.info(f"   - {prefix}_tensor.bytes: Vectores float32 para el proyector")
+                if (output_dir / f"{prefix}_reduced_tensor.bytes").exists():
+                    logger.info(f"   - {prefix}_reduced_tensor.bytes / {prefix}_reduced_metadata.tsv: Versión reducida para el proyector")
+                if self.embedding_writer.write_tsv:
+                    logger.info(f"   - {prefix}_tensor.tsv: Contiene los vectores de embeddings en texto")
+                logger.info(f"   - {prefix}_metadata.tsv: Contiene los tokens correspondientes")
             logger.info(f"   Se procesaron {len(vocab_words)} tokens en total")
+            if self.config.get('metrics.enabled', True):
+                logger.info(f"   - {prefix}_metrics.json: Tiempos por etapa y contadores de la extracción")
+                metrics.write(self.config, prefix)
             
-            # Iniciar TensorBoard automáticamente después de la extracción
+            # Iniciar TensorBoard automáticamente después de la extracción (o reutilizar el que ya
+            # está en marcha); el proyector muestra también los conjuntos de otros modelos
             logger.info("\nIniciando visualización...")
             self.tensorboard.start_tensorboard()
-            
-            # Salir del programa
-            exit(0)
-            
+
         except Exception as e:
             logger.error(f"❌ Error al extraer embeddings del vocabulario: {str(e)}")
-            exit(1)
+
+    def _ask_resume(self, checkpoint: dict, prefix: str = None) -> dict:
+        """Ofrece reanudar una extracción interrumpida compatible; devuelve su progreso o None"""
+        writer = self.embedding_writer
+        progress = writer.load_checkpoint(writer.progress_file(prefix))
+        if not progress or progress.get('kind') != 'vocabulary':
+            return None
+
+        mismatches = writer.checkpoint_mismatches(progress, checkpoint)
+        if mismatches:
+            logger.warning(
+                f"⚠️ Hay una extracción interrumpida que no se puede reanudar "
+                f"(ha cambiado {', '.join(mismatches)}); se empezará desde el principio"
+            )
+            return None
+
+        questions = [
+            inquirer.Confirm('resume',
+                message=f"Hay una extracción interrumpida ({progress['batches']} lotes completos). ¿Reanudarla?",
+                default=True
+            )
+        ]
+        answers = inquirer.prompt(questions)
+        return progress if answers and answers['resume'] else None
+
+    def _confirm_overwrite(self, names: list) -> bool:
+        """Pregunta antes de sustituir conjuntos ya registrados con los mismos nombres"""
+        self.embedding_writer.list_available_embeddings()  # crea el manifiesto si aún no existe
+        existing = [name for name in names if self.embedding_writer.catalog.get(name)]
+        if not existing:
+            return True
+
+        answers = inquirer.prompt([
+            inquirer.Confirm('overwrite',
+                message=f"Ya existe {', '.join(existing)} con el mismo modelo y opciones. ¿Volver a extraerlo y sustituirlo?",
+                default=False
+            )
+        ])
+        return bool(answers and answers['overwrite'])
+
+    def _query_neighbors(self):
+        """Consulta los vecinos más cercanos de tokens o textos en un conjunto guardado"""
+        sets = []
+        tensor_file, metadata_file = self.embedding_writer.find_embeddings()
+        if tensor_file:
+            sets.append(("Último vocabulario extraído", (tensor_file, metadata_file)))
+        for display_name, tensor_file, metadata_file, _ in self.embedding_writer.list_available_embeddings():
+            sets.append((f"{display_name} ({tensor_file.name})", (tensor_file, metadata_file)))
+
+        if not sets:
+            logger.error("❌ No se encontraron embeddings. Extrae embeddings primero.")
+            return
+
+        answers = inquirer.prompt([
+            inquirer.List('set', message="Selecciona el conjunto de embeddings:", choices=sets)
+        ])
+        if not answers:
+            return
+
+        tensor_file, metadata_file = answers['set']
+        # Los textos libres se codifican con el modelo y el modo del conjunto (ModelManager.encode_query)
+        entry = self.embedding_writer.set_entry(tensor_file) or {}
+        set_model = entry.get('model')
+        try:
+            # El índice se construye una vez por conjunto y se reutiliza en la sesión
+            key = (tensor_file, tensor_file.stat().st_mtime)
+            if key not in self.neighbor_indexes:
+                self.neighbor_indexes[key] = load_index(self.config, tensor_file, metadata_file)
+            index = self.neighbor_indexes[key]
+        except Exception as e:
+            logger.error(f"❌ Error al cargar el conjunto: {str(e)}")
+            return
+
+        k = self.config.get('neighbors.k', 10)
+        nprobe = self.config.get('neighbors.nprobe', 16) if index.centroids is not None else None
+
+        while True:
+            answers = inquirer.prompt([
+                inquirer.Text('query', message="Token o texto a consultar (vacío para volver)")
+            ])
+            if not answers or not answers['query'].strip():
+                return
+
+            query = answers['query'].strip()
+            try:
+                started = time.perf_counter()
+                results = index.search_token(query, k, nprobe)
+                if results is None:
+                    # No es un token del conjunto: se codifica como texto libre con el modelo del conjunto
+                    if entry.get('mode') == 'corpus':
+                        logger.error(f"❌ '{query}' no es un token del conjunto (los de corpus no admiten textos libres)")
+                        continue
+                    if set_model and self.model_manager.model_name != set_model:
+                        if not self.model_manager.load_model(set_model):
+                            continue
+                    elif not self.model_manager.model and not self.model_manager.load_model():
+                        continue
+                    started = time.perf_counter()
+                    vector = self.model_manager.encode_query(query, entry)
+                    results = index.search(vector, k, nprobe)
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                logger.error(f"❌ Error en la consulta: {str(e)}")
+                continue
+
+            logger.info(f"\nVecinos de '{query}' ({elapsed * 1000:.1f} ms):")
+            for rank, (token, score, _) in enumerate(results, start=1):
+                logger.info(f"  {rank:>3}. {token}\t{score:.4f}")
 
     def _visualize_embeddings(self):
-        """Visualiza embeddings existentes en TensorBoard"""
+        """Visualiza en TensorBoard los conjuntos existentes que elija el usuario"""
         try:
-            self.tensorboard.start_tensorboard()
-            logger.info("✅ TensorBoard iniciado. Abre http://localhost:6006 en tu navegador")
+            sets = None
+            available = self.embedding_writer.list_available_embeddings()
+            if len(available) > 1:
+                max_sets = self.config.get('tensorboard.max_sets', 20)
+                choices = [
+                    (f"{display_name} ({metadata_file.name[:-len('_metadata.tsv')]})",
+                     metadata_file.name[:-len('_metadata.tsv')])
+                    for display_name, _, metadata_file, config_file in available if config_file
+                ]
+                answers = inquirer.prompt([
+                    inquirer.Checkbox('sets',
+                        message="Conjuntos que mostrar en el proyector:",
+                        choices=choices,
+                        default=[name for _, name in choices[:max_sets]]
+                    )
+                ])
+                if not answers:
+                    return
+                sets = answers['sets'] or None
+            self.tensorboard.start_tensorboard(sets=sets)
         except Exception as e:
             logger.error(f"❌ Error al iniciar TensorBoard: {str(e)}")
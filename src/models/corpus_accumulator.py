@@ -0,0 +1,48 @@
+import torch
+
+
+class CorpusAccumulator:
+    """
+    Sumas y recuentos por ID del vocabulario de los vectores contextuales de un corpus
+
+    Cada aparición de un token se suma a la fila de su ID con index_add_, así que la memoria
+    depende del tamaño del vocabulario y no del corpus. Las sumas se acumulan en float64
+    para que la media y la varianza no pierdan precisión con millones de apariciones.
+    """
+
+    def __init__(self, vocab_size: int, dim: int, variance: bool = False):
+        self.sums = torch.zeros(vocab_size, dim, dtype=torch.float64)
+        self.counts = torch.zeros(vocab_size, dtype=torch.int64)
+        self.sum_squares = torch.zeros(vocab_size, dim, dtype=torch.float64) if variance else None
+
+    def add(self, ids: torch.Tensor, vectors: torch.Tensor):
+        """Suma los vectores de un lote de apariciones a las filas de sus IDs"""
+        vectors = vectors.double()
+        self.sums.index_add_(0, ids, vectors)
+        self.counts.index_add_(0, ids, torch.ones_like(ids))
+        if self.sum_squares is not None:
+            self.sum_squares.index_add_(0, ids, vectors * vectors)
+
+    @property
+    def occurrences(self) -> int:
+        """Apariciones acumuladas en total"""
+        return int(self.counts.sum())
+
+    def finalize(self, min_count: int = 1) -> tuple:
+        """
+        Calcula la media (y la varianza) de los IDs con al menos min_count apariciones
+
+        Returns:
+            tuple: (ids, means, counts, variance) con means float32 de forma (len(ids), dim)
+                y variance por dimensión, o None si no se acumuló
+        """
+        ids = torch.nonzero(self.counts >= max(1, min_count)).squeeze(1)
+        counts = self.counts[ids]
+        means = self.sums[ids] / counts.unsqueeze(1)
+
+        variance = None
+        if self.sum_squares is not None:
+            # E[x²] - E[x]², que puede quedar ligeramente por debajo de 0 por redondeo
+            variance = (self.sum_squares[ids] / counts.unsqueeze(1) - means * means).clamp(min=0).float()
+
+        return ids, means.float(), counts, variance
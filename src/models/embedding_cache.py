@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Caché persistente en disco de embeddings, direccionada por contenido y con expulsión LRU
+
+    La conexión puede usarse desde cualquier hilo (p. ej. si el gestor de modelos se crea en
+    el hilo de precarga y se usa después en el principal); un cerrojo serializa los accesos.
+    """
+
+    def __init__(self, path: str, max_size_mb: float = 1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        # WAL permite que varios procesos de trabajo lean y escriban a la vez
+        self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self.connection.commit()
+
+        # Estimación del tamaño para no recalcular SUM(size) en cada escritura
+        self._size_estimate = self.size_bytes()
+
+    @classmethod
+    def from_config(cls, config: Config):
+        """Crea la caché a partir de config.json, o devuelve None si está desactivada"""
+        if not config.get('cache.enabled', False):
+            return None
+        return cls(
+            config.get('cache.path', 'cache/embeddings.sqlite'),
+            config.get('cache.max_size_mb', 1024)
+        )
+
+    @staticmethod
+    def make_key(model_name: str, revision: str, pooling: str, text: str) -> str:
+        """Genera la clave de un texto para un modelo, revisión y modo de pooling"""
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            '\x1f'.join((model_name, revision, pooling, text_hash)).encode('utf-8')
+        ).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Busca varias claves a la vez
+
+        Returns:
+            dict: {clave: vector float32} solo con las claves encontradas
+        """
+        with self._lock:
+            found = {}
+            # SQLite limita el número de parámetros por consulta
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype='<f4').copy()
+
+                if rows:
+                    self.connection.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time(), *(key for key, _ in rows)]
+                    )
+
+            self.connection.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def put_many(self, items: dict):
+        """Guarda varios vectores {clave: vector} y expulsa los menos usados si se supera el límite"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.ascontiguousarray(vector, dtype='<f4').tobytes()
+            rows.append((key, blob, len(blob), now))
+
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.connection.commit()
+
+            self._size_estimate += sum(row[2] for row in rows)
+            if self._size_estimate > self.max_size_bytes:
+                self._evict()
+
+    def get(self, key: str):
+        """Busca una clave; devuelve el vector o None"""
+        return self.get_many([key]).get(key)
+
+    def put(self, key: str, vector):
+        """Guarda un vector"""
+        self.put_many({key: vector})
+
+    def record(self, hits: int, misses: int):
+        """Suma aciertos y fallos registrados en otro proceso"""
+        self.hits += hits
+        self.misses += misses
+
+    def size_bytes(self) -> int:
+        """Tamaño total de los vectores almacenados"""
+        with self._lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Devuelve los contadores de la caché"""
+        with self._lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': self.size_bytes()
+        }
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def _evict(self):
+        """Elimina las entradas usadas hace más tiempo hasta respetar el tamaño máximo (con el cerrojo tomado)"""
+        total = self.size_bytes()
+        while total > self.max_size_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total -= size
+                if total <= self.max_size_bytes:
+                    break
+
+            self.connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self.connection.commit()
+
+        self._size_estimate = total
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Sufijo de marca de tiempo que EmbeddingWriter añade a los conjuntos con nombre
+TIMESTAMP_SUFFIX = re.compile(r'_\d{8}_\d{6}$')
+
+
+def file_checksum(paths: list, block_bytes: int = 16 * 1024 * 1024) -> str:
+    """Huella BLAKE2b del contenido de varios archivos, leídos por bloques"""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            while block := f.read(block_bytes):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def manifest_lock(lock_file: Path):
+    """Bloqueo exclusivo entre procesos del manifiesto (sin bloqueo si la plataforma no tiene fcntl)"""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    with open(lock_file, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingCatalog:
+    """
+    Índice (manifest.json) de los conjuntos con nombre guardados en el directorio de salida
+
+    Cada guardado registra su conjunto con el modelo, la revisión, la forma, el tipo de
+    almacenamiento, el modo de extracción, una huella del contenido y la fecha. Listar,
+    buscar el más reciente o filtrar por modelo leen solo este archivo, sin recorrer ni
+    consultar los archivos del directorio. El manifiesto se reescribe de forma atómica y con
+    bloqueo, así que varios procesos pueden guardar a la vez en el mismo directorio.
+    """
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.manifest_file = self.output_dir / MANIFEST_NAME
+        self._cache = None
+        self._cache_mtime = None
+
+    def entries(self, model: str = None) -> list:
+        """Conjuntos registrados (del más reciente al más antiguo), opcionalmente de un modelo"""
+        sets = self._read()['sets'].values()
+        if model:
+            sets = [entry for entry in sets if entry.get('model') == model]
+        return sorted(sets, key=lambda entry: entry['created'], reverse=True)
+
+    def get(self, name: str) -> dict:
+        """Entrada de un conjunto, o None si no está registrado"""
+        return self._read()['sets'].get(name)
+
+    def latest(self, model: str = None) -> dict:
+        """Conjunto más reciente (de un modelo, si se indica), o None"""
+        manifest = self._read()
+        if model is None:
+            return manifest['sets'].get(manifest.get('latest'))
+        entries = self.entries(model)
+        return entries[0] if entries else None
+
+    def find_duplicate(self, checksum: str, name: str) -> dict:
+        """Otro conjunto registrado con el mismo contenido cuyos archivos siguen existiendo"""
+        for entry in self._read()['sets'].values():
+            if entry['name'] != name and entry.get('checksum') == checksum \
+                    and (self.output_dir / entry['tensor']).exists():
+                return entry
+        return None
+
+    def register(self, entry: dict, latest: bool = True) -> dict:
+        """Añade (o sustituye) la entrada de un conjunto y, salvo latest=False, lo marca como el más reciente"""
+        entry = {'created': datetime.now().isoformat(timespec='seconds'), **entry}
+        with self._update() as manifest:
+            manifest['sets'][entry['name']] = entry
+            if latest:
+                manifest['latest'] = entry['name']
+        return entry
+
+    def touch(self, name: str, fill: dict = None):
+        """
+        Marca un conjunto ya registrado como el más reciente (p. ej. al volver a exportarlo)
+
+        Args:
+            fill: Campos con los que completar los que la entrada no tiene (modelo, revisión...)
+        """
+        with self._update() as manifest:
+            entry = manifest['sets'][name]
+            for key, value in (fill or {}).items():
+                if entry.get(key) is None:
+                    entry[key] = value
+            entry['created'] = datetime.now().isoformat(timespec='seconds')
+            manifest['latest'] = name
+
+    def remove(self, name: str):
+        """Elimina la entrada de un conjunto (sus archivos no se tocan)"""
+        with self._update() as manifest:
+            manifest['sets'].pop(name, None)
+            if manifest.get('latest') == name:
+                latest = max(manifest['sets'].values(), key=lambda entry: entry['created'], default=None)
+                manifest['latest'] = latest['name'] if latest else None
+
+    def rebuild(self, describe) -> int:
+        """
+        Reconstruye el manifiesto a partir de los conjuntos del directorio
+
+        Sirve para registrar conjuntos guardados antes de existir el manifiesto o para reparar
+        uno borrado. Es la única operación que recorre el directorio.
+
+        Args:
+            describe: Función (name) -> entrada del conjunto, o None si está incompleto
+
+        Returns:
+            int: Número de conjuntos registrados
+        """
+        config_files = sorted(self.output_dir.glob("*_projector_config.pbtxt"), key=lambda f: f.stat().st_mtime)
+        with self._update(fresh=True) as manifest:
+            for config_file in config_files:
+                name = config_file.stem.rsplit('_projector_config', maxsplit=1)[0]
+                entry = describe(name)
+                if entry is None:
+                    continue
+                entry.setdefault('created', datetime.fromtimestamp(config_file.stat().st_mtime).isoformat(timespec='seconds'))
+                manifest['sets'][name] = entry
+                manifest['latest'] = name
+            count = len(manifest['sets'])
+        logger.info(f"Manifiesto {self.manifest_file} reconstruido con {count} conjuntos")
+        return count
+
+    def exists(self) -> bool:
+        return self.manifest_file.exists()
+
+    @staticmethod
+    def display_name(entry: dict) -> str:
+        """Modelo del conjunto o, si no se registró (conjuntos anteriores al manifiesto), su nombre sin la marca de tiempo"""
+        return entry.get('model') or TIMESTAMP_SUFFIX.sub('', entry['name'])
+
+    def _read(self) -> dict:
+        """Lee el manifiesto (se reutiliza mientras no cambie en disco)"""
+        try:
+            mtime = self.manifest_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {'version': MANIFEST_VERSION, 'latest': None, 'sets': {}}
+        if self._cache is None or mtime != self._cache_mtime:
+            with open(self.manifest_file, encoding='utf-8') as f:
+                self._cache = json.load(f)
+            self._cache_mtime = mtime
+        return self._cache
+
+    @contextmanager
+    def _update(self, fresh: bool = False):
+        """Lee, modifica y reescribe el manifiesto de forma atómica bajo el bloqueo"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with manifest_lock(self.output_dir / f"{MANIFEST_NAME}.lock"):
+            self._cache = None
+            manifest = {'version': MANIFEST_VERSION, 'latest': None, 'sets': {}} if fresh else self._read()
+            yield manifest
+            tmp_file = self.manifest_file.with_name(f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.manifest_file)
+            self._cache = None
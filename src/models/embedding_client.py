@@ -0,0 +1,124 @@
+import http.client
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+import numpy as np
+
+from src.models.embedding_server import decode_matrix
+from src.utils.config import Config
+from src.utils.metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingClient:
+    """
+    Cliente del servidor de embeddings (scripts/serve_embeddings.py)
+
+    Ofrece la parte de la interfaz de ModelManager que usan los scripts para codificar textos
+    (load_model, encode_batch, get_embedding_dim, model_name...), de modo que pueden usar el
+    modelo ya cargado en el servidor en lugar de cargar su propia copia. No importa torch.
+    """
+
+    def __init__(self, url: str = None, config: Config = None):
+        self.config = config or Config()
+        url = url or f"http://{self.config.get('server.host', '127.0.0.1')}:{self.config.get('server.port', 8765)}"
+        parts = urlsplit(url if '//' in url else f"http://{url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = self.config.get('server.client_timeout', 60)
+        self.retries = self.config.get('server.client_retries', 5)
+        self.model_name = None
+        self.model_revision = None
+        self.inference_backend = None
+        self.dim = None
+        self.metrics = RunMetrics()
+        self._connection = None
+
+    def load_model(self, model_name: str = None) -> bool:
+        """Pide al servidor el modelo (lo carga si aún no lo tiene) y guarda su dimensión y revisión"""
+        try:
+            info = self._embed([], model_name)
+        except Exception as e:
+            logger.error(f"❌ Error al conectar con el servidor de embeddings en {self.host}:{self.port}: {str(e)}")
+            return False
+
+        self.model_name = info['model']
+        self.model_revision = info['revision']
+        self.inference_backend = info['backend']
+        self.dim = info['dim']
+        logger.info(f"✅ Usando el modelo {self.model_name} del servidor {self.host}:{self.port}")
+        return True
+
+    def get_embedding_dim(self, mode: str = None) -> int:
+        """Dimensión de los embeddings del modelo del servidor"""
+        return self.dim
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Obtiene el embedding de un texto"""
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts: list[str], batch_size: int = None) -> np.ndarray:
+        """
+        Obtiene los embeddings de varios textos
+
+        El servidor agrupa esta petición con las de otros clientes; batch_size se ignora.
+
+        Returns:
+            np.ndarray: Matriz float32 de forma (len(texts), dim)
+        """
+        with self.metrics.stage('request'):
+            info = self._embed(texts, self.model_name)
+        self.metrics.add('rows', len(texts))
+        return decode_matrix(info['embeddings'], info['dim'])
+
+    def health(self) -> dict:
+        """Estado del servidor: modelos cargados, cola y estadísticas de los micro-lotes"""
+        return self._request('GET', '/health')
+
+    def log_cache_stats(self):
+        """La caché de embeddings vive en el servidor"""
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def _embed(self, texts: list, model_name: str = None) -> dict:
+        payload = {'texts': texts}
+        if model_name:
+            payload['model'] = model_name
+        return self._request('POST', '/embed', payload)
+
+    def _request(self, method: str, path: str, payload: dict = None) -> dict:
+        """
+        Envía una petición reutilizando la conexión
+
+        Si el servidor está saturado (503) se espera lo indicado en Retry-After y se reintenta,
+        igual que si la conexión se ha cerrado; tras server.client_retries intentos se lanza el error.
+        """
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+        for attempt in range(self.retries + 1):
+            try:
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self._connection.request(method, path, body=body, headers=headers)
+                response = self._connection.getresponse()
+                data = json.loads(response.read() or b'{}')
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(2 ** attempt * 0.1, 5))
+                continue
+
+            if response.status == 503 and attempt < self.retries:
+                # Backpressure: la cola del servidor está llena
+                time.sleep(float(response.getheader('Retry-After', 1)))
+                continue
+            if response.status != 200:
+                raise RuntimeError(f"El servidor respondió {response.status}: {data.get('error', '')}")
+            return data
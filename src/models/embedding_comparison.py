@@ -0,0 +1,220 @@
+import logging
+import numpy as np
+
+from src.models.embedding_reader import EmbeddingReader
+from src.models.neighbor_index import normalize_rows, top_k
+
+logger = logging.getLogger(__name__)
+
+
+def shared_rows(tokens_a: list, tokens_b: list) -> tuple:
+    """
+    Filas de los tokens que aparecen en los dos conjuntos (la primera aparición de cada uno)
+
+    Returns:
+        tuple: (filas en a, filas en b, tokens compartidos) en el orden del conjunto a
+    """
+    rows_b = {}
+    for row, token in enumerate(tokens_b):
+        rows_b.setdefault(token, row)
+
+    seen = set()
+    shared_a, shared_b, tokens = [], [], []
+    for row, token in enumerate(tokens_a):
+        if token in rows_b and token not in seen:
+            seen.add(token)
+            shared_a.append(row)
+            shared_b.append(rows_b[token])
+            tokens.append(token)
+    return np.array(shared_a, dtype=np.int64), np.array(shared_b, dtype=np.int64), tokens
+
+
+def iter_row_blocks(reader: EmbeddingReader, rows: np.ndarray, chunk_rows: int):
+    """Recorre las filas indicadas por bloques; genera (inicio, bloque float32)"""
+    for start in range(0, len(rows), chunk_rows):
+        yield start, reader.take(rows[start:start + chunk_rows])
+
+
+def nearest_neighbors(reader: EmbeddingReader, rows: np.ndarray, queries: np.ndarray, k: int,
+                      chunk_rows: int = 4096) -> np.ndarray:
+    """
+    k vecinos más cercanos (coseno) de cada consulta entre las filas indicadas, excluyéndose a sí misma
+
+    Las consultas se procesan por bloques contra bloques de filas leídos del mapa de memoria,
+    así que la memoria es de unos pocos bloques y de una matriz de puntuaciones bloque x bloque,
+    no de la matriz completa ni de la matriz de similitudes N x N.
+
+    Args:
+        reader: Conjunto de embeddings
+        rows: Filas del conjunto que forman el espacio de búsqueda (p. ej. el vocabulario compartido)
+        queries: Posiciones dentro de rows de los tokens consultados
+        k: Número de vecinos
+        chunk_rows: Filas por bloque
+
+    Returns:
+        np.ndarray: Posiciones dentro de rows de los vecinos, forma (len(queries), k)
+    """
+    k = min(k, len(rows) - 1)
+    neighbors = np.empty((len(queries), k), dtype=np.int64)
+
+    for query_start in range(0, len(queries), chunk_rows):
+        query_positions = queries[query_start:query_start + chunk_rows]
+        query = normalize_rows(reader.take(rows[query_positions]))
+        best_rows = []
+        best_scores = []
+        for start, block in iter_row_blocks(reader, rows, chunk_rows):
+            scores = query @ normalize_rows(block).T
+            # La propia consulta no cuenta como vecino
+            own = (query_positions >= start) & (query_positions < start + len(block))
+            scores[np.flatnonzero(own), query_positions[own] - start] = -np.inf
+            local = top_k(scores, k)
+            best_rows.append(local + start)
+            best_scores.append(np.take_along_axis(scores, local, axis=1))
+
+        candidates = np.concatenate(best_rows, axis=1)
+        order = top_k(np.concatenate(best_scores, axis=1), k)
+        neighbors[query_start:query_start + len(query_positions)] = np.take_along_axis(candidates, order, axis=1)
+
+    return neighbors
+
+
+def neighbor_overlap(neighbors_a: np.ndarray, neighbors_b: np.ndarray, chunk_rows: int = 4096) -> np.ndarray:
+    """Fracción de los k vecinos de cada token que coinciden en los dos conjuntos"""
+    overlap = np.empty(len(neighbors_a), dtype=np.float32)
+    k = neighbors_a.shape[1]
+    for start in range(0, len(neighbors_a), chunk_rows):
+        a = neighbors_a[start:start + chunk_rows]
+        b = neighbors_b[start:start + chunk_rows]
+        # Comparación k x k por token; los vecinos de cada lista son distintos entre sí
+        overlap[start:start + len(a)] = (a[:, :, np.newaxis] == b[:, np.newaxis, :]).any(axis=2).sum(axis=1) / k
+    return overlap
+
+
+def cross_statistics(reader_a: EmbeddingReader, rows_a: np.ndarray, reader_b: EmbeddingReader,
+                     rows_b: np.ndarray, chunk_rows: int = 65536) -> dict:
+    """
+    Medias y matrices de covarianza (propias y cruzada) de los dos conjuntos, en una pasada por bloques
+
+    Solo se guardan matrices dim x dim, sea cual sea el tamaño del vocabulario.
+    """
+    dim_a = reader_a.shape[1]
+    dim_b = reader_b.shape[1]
+    sum_a = np.zeros(dim_a)
+    sum_b = np.zeros(dim_b)
+    gram_a = np.zeros((dim_a, dim_a))
+    gram_b = np.zeros((dim_b, dim_b))
+    cross = np.zeros((dim_a, dim_b))
+
+    for start in range(0, len(rows_a), chunk_rows):
+        a = reader_a.take(rows_a[start:start + chunk_rows]).astype(np.float64)
+        b = reader_b.take(rows_b[start:start + chunk_rows]).astype(np.float64)
+        sum_a += a.sum(axis=0)
+        sum_b += b.sum(axis=0)
+        gram_a += a.T @ a
+        gram_b += b.T @ b
+        cross += a.T @ b
+
+    n = len(rows_a)
+    mean_a = sum_a / n
+    mean_b = sum_b / n
+    return {
+        'n': n,
+        'mean_a': mean_a,
+        'mean_b': mean_b,
+        'cov_a': gram_a - n * np.outer(mean_a, mean_a),
+        'cov_b': gram_b - n * np.outer(mean_b, mean_b),
+        'cross': cross - n * np.outer(mean_a, mean_b)
+    }
+
+
+def linear_cka(stats: dict) -> float:
+    """CKA lineal (Kornblith et al., 2019) a partir de las covarianzas centradas"""
+    denominator = np.linalg.norm(stats['cov_a']) * np.linalg.norm(stats['cov_b'])
+    return float(np.linalg.norm(stats['cross']) ** 2 / denominator) if denominator > 0 else 0.0
+
+
+def procrustes_alignment(stats: dict) -> dict:
+    """
+    Alineamiento ortogonal de Procrustes del conjunto a sobre el b
+
+    Ambos conjuntos se centran y se escalan a norma de Frobenius 1. La rotación es U Vᵀ de la
+    SVD de la covarianza cruzada; si las dimensiones difieren es semiortogonal (equivale a
+    rellenar con ceros la dimensión menor). La disparidad, 1 - (Σ valores singulares)², es la
+    misma que la de scipy.spatial.procrustes: 0 si los conjuntos coinciden salvo rotación y escala.
+
+    Returns:
+        dict: rotation, scale (escala óptima), scale_a / scale_b (normas de los conjuntos
+            centrados) y disparity
+    """
+    scale_a = np.sqrt(max(np.trace(stats['cov_a']), 1e-30))
+    scale_b = np.sqrt(max(np.trace(stats['cov_b']), 1e-30))
+    u, singular_values, vt = np.linalg.svd(stats['cross'] / (scale_a * scale_b), full_matrices=False)
+    scale = float(singular_values.sum())
+    return {
+        'rotation': u @ vt,
+        'scale': scale,
+        'scale_a': scale_a,
+        'scale_b': scale_b,
+        'disparity': max(0.0, 1.0 - scale ** 2)
+    }
+
+
+def procrustes_residuals(reader_a: EmbeddingReader, rows_a: np.ndarray, reader_b: EmbeddingReader,
+                         rows_b: np.ndarray, stats: dict, alignment: dict, chunk_rows: int = 65536) -> np.ndarray:
+    """Error cuadrático de cada token tras el alineamiento (con la misma dimensión, su suma es la disparidad)"""
+    residuals = np.empty(len(rows_a), dtype=np.float64)
+    rotation = alignment['scale'] * alignment['rotation'] / alignment['scale_a']
+    for start in range(0, len(rows_a), chunk_rows):
+        a = reader_a.take(rows_a[start:start + chunk_rows]).astype(np.float64) - stats['mean_a']
+        b = (reader_b.take(rows_b[start:start + chunk_rows]).astype(np.float64) - stats['mean_b']) / alignment['scale_b']
+        difference = a @ rotation - b
+        residuals[start:start + len(a)] = np.einsum('ij,ij->i', difference, difference)
+    return residuals
+
+
+def compare_sets(reader_a: EmbeddingReader, reader_b: EmbeddingReader, k: int = 10, queries: int = None,
+                 chunk_rows: int = 4096, seed: int = 0) -> dict:
+    """
+    Compara dos conjuntos de embeddings sobre su vocabulario compartido
+
+    Args:
+        reader_a / reader_b: Conjuntos a comparar (con metadatos)
+        k: Vecinos por token para el solapamiento
+        queries: Tokens consultados para el solapamiento (muestra aleatoria; None: todos).
+            Los vecinos se buscan siempre en todo el vocabulario compartido
+        chunk_rows: Filas por bloque
+        seed: Semilla de la muestra de consultas
+
+    Returns:
+        dict: tokens compartidos, posiciones consultadas, vecinos en cada conjunto,
+            solapamiento por consulta, residuo de Procrustes por token, CKA y disparidad
+    """
+    rows_a, rows_b, tokens = shared_rows(reader_a.tokens, reader_b.tokens)
+    if len(tokens) <= k:
+        raise ValueError(f"Solo hay {len(tokens)} tokens compartidos; hacen falta más de k={k}")
+    logger.info(f"{len(tokens)} tokens compartidos ({reader_a.shape[1]} y {reader_b.shape[1]} dimensiones)")
+
+    stats = cross_statistics(reader_a, rows_a, reader_b, rows_b, chunk_rows * 16)
+    cka = linear_cka(stats)
+    alignment = procrustes_alignment(stats)
+    residuals = procrustes_residuals(reader_a, rows_a, reader_b, rows_b, stats, alignment, chunk_rows * 16)
+    logger.info(f"CKA lineal {cka:.4f}, disparidad de Procrustes {alignment['disparity']:.4f}")
+
+    positions = np.arange(len(tokens))
+    if queries and queries < len(tokens):
+        positions = np.sort(np.random.default_rng(seed).choice(len(tokens), size=queries, replace=False))
+    logger.info(f"Buscando los {k} vecinos de {len(positions)} tokens en cada conjunto...")
+    neighbors_a = nearest_neighbors(reader_a, rows_a, positions, k, chunk_rows)
+    neighbors_b = nearest_neighbors(reader_b, rows_b, positions, k, chunk_rows)
+
+    return {
+        'tokens': tokens,
+        'queries': positions,
+        'neighbors_a': neighbors_a,
+        'neighbors_b': neighbors_b,
+        'overlap': neighbor_overlap(neighbors_a, neighbors_b, chunk_rows),
+        'residuals': residuals,
+        'cka': cka,
+        'disparity': alignment['disparity'],
+        'k': neighbors_a.shape[1]
+    }
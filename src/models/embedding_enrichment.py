@@ -0,0 +1,131 @@
+import logging
+import time
+import numpy as np
+
+from src.models.embedding_reader import EmbeddingReader
+from src.models.neighbor_index import normalize_rows
+from src.utils.tokens import token_kinds
+
+logger = logging.getLogger(__name__)
+
+# Columnas que añade la etapa de enriquecimiento (tras la del token)
+ENRICHMENT_COLUMNS = ('id', 'length', 'kind', 'cluster', 'norm')
+
+
+def minibatch_kmeans(reader: EmbeddingReader, n_clusters: int, batch_rows: int = 4096, passes: int = 3,
+                     chunk_rows: int = 65536, seed: int = 0) -> np.ndarray:
+    """
+    k-means esférico por mini-lotes (Sculley, 2010) recorriendo el tensor guardado por bloques
+
+    Cada pasada lee el conjunto en orden, bloque a bloque, y baraja las filas de cada bloque
+    en mini-lotes de batch_rows. Cada mini-lote se asigna de una vez (producto matricial con
+    los centroides) y cada centroide se mueve hacia la media de sus filas con una tasa de
+    aprendizaje 1/n, siendo n las filas que ha recibido hasta entonces. La memoria es la de un
+    bloque y los centroides, sea cual sea el tamaño del conjunto.
+
+    Args:
+        reader: Conjunto de embeddings
+        n_clusters: Número de grupos
+        batch_rows: Filas por mini-lote
+        passes: Pasadas sobre el conjunto
+        chunk_rows: Filas leídas del mapa de memoria por bloque
+        seed: Semilla de la inicialización y del barajado
+
+    Returns:
+        np.ndarray: Centroides normalizados [n_clusters, dim]
+    """
+    n = len(reader)
+    n_clusters = min(n_clusters, n)
+    rng = np.random.default_rng(seed)
+
+    # Inicialización con filas distintas elegidas al azar
+    centroids = normalize_rows(reader.take(np.sort(rng.choice(n, size=n_clusters, replace=False))))
+    counts = np.zeros(n_clusters, dtype=np.int64)
+
+    for _ in range(passes):
+        for _, chunk in reader.iter_chunks(chunk_rows):
+            chunk = normalize_rows(chunk)[rng.permutation(len(chunk))]
+            for start in range(0, len(chunk), batch_rows):
+                batch = chunk[start:start + batch_rows]
+                assignment = np.argmax(batch @ centroids.T, axis=1)
+                batch_counts = np.bincount(assignment, minlength=n_clusters)
+                # Sumas por grupo como producto de la matriz de pertenencia (más rápido que np.add.at)
+                membership = np.zeros((n_clusters, len(batch)), dtype=np.float32)
+                membership[assignment, np.arange(len(batch))] = 1.0
+                sums = membership @ batch
+
+                # Equivale a aplicar la actualización de cada fila con tasa 1/n en secuencia
+                counts += batch_counts
+                updated = batch_counts > 0
+                rate = batch_counts[updated] / counts[updated]
+                means = sums[updated] / batch_counts[updated, np.newaxis]
+                centroids[updated] += rate[:, np.newaxis] * (means - centroids[updated])
+                centroids = normalize_rows(centroids)
+
+    return centroids
+
+
+def assign_clusters(reader: EmbeddingReader, centroids: np.ndarray, chunk_rows: int = 65536) -> tuple:
+    """
+    Grupo (centroide más cercano por coseno) y norma L2 de cada fila, en una pasada por bloques
+
+    Returns:
+        tuple: (clusters int32, normas float32)
+    """
+    n = len(reader)
+    clusters = np.empty(n, dtype=np.int32)
+    norms = np.empty(n, dtype=np.float32)
+    for start, chunk in reader.iter_chunks(chunk_rows):
+        norms[start:start + len(chunk)] = np.linalg.norm(chunk, axis=1)
+        clusters[start:start + len(chunk)] = np.argmax(normalize_rows(chunk) @ centroids.T, axis=1)
+    return clusters, norms
+
+
+def token_columns(tokens: list, tokenizer=None) -> dict:
+    """
+    Columnas de metadatos que dependen del token: id, length y kind
+
+    id es el del vocabulario del tokenizador (-1 si la fila no es un token del vocabulario, p. ej.
+    una frase) y length el número de tokens en que se divide el texto de la fila, sin los
+    especiales que añade el tokenizador. Sin tokenizador solo se calcula kind.
+    """
+    kinds = token_kinds(tokens)
+    if tokenizer is None:
+        return {'kind': kinds}
+
+    # Los tokens especiales propios del tokenizador, aunque no sigan el patrón habitual
+    kinds[np.isin(np.array(tokens, dtype=object), list(tokenizer.all_special_tokens))] = 'special'
+    vocab = tokenizer.get_vocab()
+    encoded = tokenizer(list(tokens), add_special_tokens=False)['input_ids']
+    return {
+        'id': np.array([vocab.get(token, -1) for token in tokens], dtype=np.int64),
+        'length': np.array([len(ids) for ids in encoded], dtype=np.int32),
+        'kind': kinds
+    }
+
+
+def enrichment_columns(reader: EmbeddingReader, tokenizer=None, n_clusters: int = 32, batch_rows: int = 4096,
+                       passes: int = 3, chunk_rows: int = 65536, seed: int = 0) -> dict:
+    """
+    Columnas de metadatos enriquecidos de un conjunto: id, length, kind, cluster y norm
+
+    Los grupos y las normas se calculan de forma vectorizada sobre el tensor binario, por
+    bloques; el conjunto no se carga entero en memoria.
+
+    Returns:
+        dict: {columna: valores por fila} en el orden de ENRICHMENT_COLUMNS
+    """
+    started = time.perf_counter()
+    columns = token_columns(reader.tokens, tokenizer)
+
+    centroids = minibatch_kmeans(reader, n_clusters, batch_rows, passes, chunk_rows, seed)
+    clusters, norms = assign_clusters(reader, centroids, chunk_rows)
+    columns['cluster'] = clusters
+    columns['norm'] = norms
+
+    sizes = np.bincount(clusters, minlength=len(centroids))
+    logger.info(
+        f"{len(centroids)} grupos de {reader.shape[0]} filas en {time.perf_counter() - started:.1f}s "
+        f"(tamaño mínimo {sizes.min()}, máximo {sizes.max()})"
+    )
+    return {name: columns[name] for name in ENRICHMENT_COLUMNS if name in columns}
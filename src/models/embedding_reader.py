@@ -0,0 +1,260 @@
+import logging
+import os
+from pathlib import Path
+import numpy as np
+
+from src.models.quantization import open_stored_matrix
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def read_metadata(metadata_file: Path, rows: int = None) -> tuple[list[str], dict]:
+    """
+    Lee un archivo de metadatos
+
+    Los archivos de una columna no tienen encabezado; los de varias columnas (el token y otros
+    campos separados por tabuladores) llevan encabezado, como exige el proyector. Los tokens
+    tienen los tabuladores escapados, así que un tabulador en la primera línea indica encabezado.
+
+    Las versiones anteriores escribían también un encabezado "token" en los archivos de una
+    columna. Se reconoce cuando el archivo tiene una línea más que filas el tensor (rows, o las
+    del tensor del mismo conjunto si no se indica), para no confundirlo con el token "token".
+
+    Returns:
+        tuple: (tokens, columns) con las demás columnas como {nombre: lista de valores}
+    """
+    with open(metadata_file, encoding='utf-8') as f:
+        lines = [line.rstrip('\n') for line in f]
+    if not lines or '\t' not in lines[0]:
+        if lines and lines[0] == 'token':
+            rows = rows if rows is not None else _tensor_rows(Path(metadata_file))
+            if rows is not None and len(lines) == rows + 1:
+                return lines[1:], {}
+        return lines, {}
+
+    header = lines[0].split('\t')
+    rows = [line.split('\t') for line in lines[1:]]
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(header[1:], start=1)}
+    return [row[0] for row in rows], columns
+
+
+def _tensor_rows(metadata_file: Path) -> int:
+    """Filas del tensor del mismo conjunto que un archivo de metadatos (None si no tiene .npy ni .tsv)"""
+    if not metadata_file.name.endswith('_metadata.tsv'):
+        return None
+    tensor_file = metadata_file.with_name(metadata_file.name[:-len('_metadata.tsv')] + '_tensor.npy')
+    if tensor_file.exists():
+        return np.load(tensor_file, mmap_mode='r').shape[0]
+    if tensor_file.with_suffix('.tsv').exists():
+        return tsv_shape(tensor_file.with_suffix('.tsv'))[0]
+    return None
+
+
+def read_metadata_tokens(metadata_file: Path) -> list[str]:
+    """Lee los tokens de un archivo de metadatos"""
+    return read_metadata(metadata_file)[0]
+
+
+def tsv_shape(tsv_file: Path, block_bytes: int = 16 * 1024 * 1024) -> tuple:
+    """Filas y columnas de un tensor TSV, contando saltos de línea por bloques (sin convertir números)"""
+    rows = 0
+    last = b'\n'
+    with open(tsv_file, 'rb') as f:
+        first_line = f.readline()
+        dim = len(first_line.split(b'\t')) if first_line.strip() else 0
+        f.seek(0)
+        while block := f.read(block_bytes):
+            rows += block.count(b'\n')
+            last = block[-1:]
+    # La última fila puede no terminar en salto de línea
+    return rows + (last != b'\n'), dim
+
+
+def stored_tensor_info(tensor_file: Path, metadata_file: Path = None) -> tuple:
+    """
+    Forma y tipo almacenado de un tensor guardado, leyendo solo cabeceras (sin convertir ni cargar datos)
+
+    Returns:
+        tuple: (shape, dtype) con el dtype del .npy (float16/int8 si está cuantizado)
+    """
+    tensor_file = Path(tensor_file)
+    npy_file = tensor_file.with_suffix('.npy')
+    if npy_file.exists():
+        data = np.load(npy_file, mmap_mode='r')
+        return data.shape, data.dtype
+
+    bytes_file = tensor_file.with_suffix('.bytes')
+    if bytes_file.exists() and metadata_file is not None:
+        rows = len(read_metadata_tokens(metadata_file))
+        return (rows, bytes_file.stat().st_size // 4 // rows if rows else 0), np.dtype('<f4')
+
+    return tsv_shape(tensor_file.with_suffix('.tsv')), np.dtype('<f4')
+
+
+def parse_tsv_matrix(tsv_file: Path, out: np.ndarray = None, chunk_rows: int = 8192) -> np.ndarray:
+    """
+    Convierte un tensor TSV a float32 por bloques de filas
+
+    Cada bloque se parsea con el lector en C de np.loadtxt y se copia en out, así que la
+    memoria adicional es la de un bloque, no la de todo el archivo como con np.loadtxt.
+
+    Args:
+        tsv_file: Tensor TSV (una fila por línea, valores separados por tabuladores)
+        out: Destino [filas, dim] (p. ej. un .npy mapeado en memoria); si no se indica, se crea en memoria
+        chunk_rows: Filas por bloque
+
+    Returns:
+        np.ndarray: out con todas las filas
+    """
+    if out is None:
+        out = np.empty(tsv_shape(tsv_file), dtype=np.float32)
+
+    rows, dim = out.shape
+    with open(tsv_file, 'r', encoding='utf-8') as f:
+        for start in range(0, rows, chunk_rows):
+            expected = min(chunk_rows, rows - start)
+            block = np.loadtxt(f, delimiter='\t', dtype=np.float32, max_rows=expected, ndmin=2)
+            if block.shape != (expected, dim):
+                raise ValueError(
+                    f"{tsv_file}: bloque desde la fila {start + 1} con forma {block.shape} "
+                    f"(se esperaba {(expected, dim)})"
+                )
+            out[start:start + expected] = block
+    return out
+
+
+class EmbeddingReader:
+    """
+    Acceso de solo lectura a un conjunto de embeddings guardado por EmbeddingWriter
+
+    El tensor se abre sin copiarlo: el .npy como mapa de memoria (los float16/int8 se
+    descuantizan solo en las filas pedidas) y el .bytes del proyector como mapa float32.
+    Los conjuntos antiguos que solo tienen tensor.tsv se parsean por bloques y, si
+    reader.convert_tsv está activado, se convierten una sola vez a .npy junto al TSV,
+    de modo que las siguientes aperturas ya son mapas de memoria.
+
+    Los accesos por rango (read_rows, iter_chunks) y por subconjunto de filas (take)
+    solo leen las páginas del archivo que contienen esas filas.
+    """
+
+    def __init__(self, tensor_file: Path, metadata_file: Path = None, config: Config = None):
+        self.config = config or Config()
+        self.tensor_file = Path(tensor_file)
+        self.metadata_file = Path(metadata_file) if metadata_file else None
+        self._matrix = None
+        self._metadata = None
+
+    @property
+    def matrix(self):
+        """Matriz [filas, dim] del conjunto (memmap, QuantizedMatrix o array en memoria)"""
+        if self._matrix is None:
+            self._matrix = self._open()
+        return self._matrix
+
+    @property
+    def shape(self) -> tuple:
+        return self.matrix.shape
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def tokens(self) -> list[str]:
+        """Token de cada fila (del archivo de metadatos)"""
+        return self._read_metadata()[0]
+
+    @property
+    def columns(self) -> dict:
+        """Columnas adicionales de los metadatos {nombre: valores}"""
+        return self._read_metadata()[1]
+
+    def read_rows(self, start: int, stop: int) -> np.ndarray:
+        """Filas [start, stop) como array float32 en memoria"""
+        return np.array(self.matrix[start:stop], dtype=np.float32)
+
+    def iter_chunks(self, chunk_rows: int = 65536):
+        """Recorre el conjunto por bloques de filas; genera (inicio, bloque float32)"""
+        for start in range(0, len(self), chunk_rows):
+            yield start, self.read_rows(start, start + chunk_rows)
+
+    def take(self, rows) -> np.ndarray:
+        """
+        Filas indicadas (en el orden pedido) como array float32 en memoria
+
+        Los índices se leen ordenados para recorrer el mapa de memoria hacia delante y
+        tocar cada página una sola vez.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind='stable')
+        block = np.asarray(self.matrix[rows[order]], dtype=np.float32)
+        result = np.empty_like(block)
+        result[order] = block
+        return result
+
+    def rows_for_tokens(self, tokens: list) -> tuple:
+        """
+        Filas de los tokens indicados (la primera aparición de cada uno)
+
+        Returns:
+            tuple: (filas encontradas, tokens que no están en el conjunto)
+        """
+        token_rows = {}
+        for row, token in enumerate(self.tokens):
+            token_rows.setdefault(token, row)
+
+        rows = [token_rows[token] for token in tokens if token in token_rows]
+        missing = [token for token in tokens if token not in token_rows]
+        return np.array(rows, dtype=np.int64), missing
+
+    def close(self):
+        """Libera el mapa de memoria"""
+        self._matrix = None
+
+    def _read_metadata(self) -> tuple:
+        if self._metadata is None:
+            if self.metadata_file is None:
+                raise ValueError(f"El conjunto {self.tensor_file.name} no tiene archivo de metadatos")
+            self._metadata = read_metadata(self.metadata_file)
+        return self._metadata
+
+    def _open(self):
+        """Abre la mejor representación disponible: .npy, .bytes o, en último caso, .tsv"""
+        npy_file = self.tensor_file.with_suffix('.npy')
+        if npy_file.exists():
+            return open_stored_matrix(npy_file)
+
+        bytes_file = self.tensor_file.with_suffix('.bytes')
+        if bytes_file.exists() and self.metadata_file is not None:
+            # El .bytes no guarda la forma: el número de filas sale de los metadatos
+            rows = len(self.tokens)
+            dim = bytes_file.stat().st_size // 4 // rows if rows else 0
+            return np.memmap(bytes_file, dtype='<f4', mode='r', shape=(rows, dim))
+
+        tsv_file = self.tensor_file.with_suffix('.tsv')
+        if not tsv_file.exists():
+            raise FileNotFoundError(f"No se encontró el tensor {self.tensor_file}")
+        return self._open_tsv(tsv_file, npy_file)
+
+    def _open_tsv(self, tsv_file: Path, npy_file: Path):
+        """Parsea un tensor TSV por bloques y, si está activado, lo convierte a .npy"""
+        shape = tsv_shape(tsv_file)
+        chunk_rows = self.config.get('reader.chunk_rows', 8192)
+
+        if not self.config.get('reader.convert_tsv', True):
+            logger.info(f"Leyendo {tsv_file.name} ({shape[0]}x{shape[1]})...")
+            return parse_tsv_matrix(tsv_file, chunk_rows=chunk_rows)
+
+        logger.info(f"Convirtiendo {tsv_file.name} ({shape[0]}x{shape[1]}) a {npy_file.name}...")
+        tmp_file = npy_file.with_name(f"{npy_file.stem}.tmp.npy")
+        try:
+            target = np.lib.format.open_memmap(tmp_file, mode='w+', dtype='<f4', shape=shape)
+            parse_tsv_matrix(tsv_file, target, chunk_rows)
+            target.flush()
+            del target
+            os.replace(tmp_file, npy_file)
+        except BaseException:
+            if tmp_file.exists():
+                tmp_file.unlink()
+            raise
+        return open_stored_matrix(npy_file)
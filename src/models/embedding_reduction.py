@@ -0,0 +1,169 @@
+import logging
+import numpy as np
+
+from src.utils.tokens import token_kinds
+
+logger = logging.getLogger(__name__)
+
+
+def sample_rows(tokens: list, max_points: int, strategy: str = 'stratified', seed: int = 0) -> np.ndarray:
+    """
+    Elige como mucho max_points filas de un conjunto
+
+    Args:
+        tokens: Tokens del conjunto (una entrada por fila)
+        max_points: Número máximo de filas
+        strategy: 'random' (muestreo uniforme) o 'stratified' (cuota proporcional por tipo
+            de token, con al menos una fila por tipo para no perder los tokens especiales)
+        seed: Semilla del muestreo
+
+    Returns:
+        np.ndarray: Índices de fila seleccionados, en orden creciente
+    """
+    n = len(tokens)
+    if n <= max_points:
+        return np.arange(n)
+
+    rng = np.random.default_rng(seed)
+    if strategy == 'random':
+        return np.sort(rng.choice(n, size=max_points, replace=False))
+    if strategy != 'stratified':
+        raise ValueError(f"Estrategia de muestreo desconocida: {strategy}")
+
+    _, groups, counts = np.unique(token_kinds(tokens), return_inverse=True, return_counts=True)
+
+    # Cuotas proporcionales; el resto se reparte por mayor parte fraccionaria
+    exact = counts * max_points / n
+    quotas = np.minimum(np.maximum(np.floor(exact).astype(np.int64), 1), counts)
+    for group in np.argsort(-(exact - np.floor(exact))):
+        if quotas.sum() >= max_points:
+            break
+        if quotas[group] < counts[group]:
+            quotas[group] += 1
+
+    rows = [
+        rng.choice(np.flatnonzero(groups == group), size=quota, replace=False)
+        for group, quota in enumerate(quotas)
+    ]
+    return np.sort(np.concatenate(rows))
+
+
+def _column_stats(matrix: np.ndarray, chunk_rows: int) -> tuple:
+    """Media de las columnas y varianza total, en una pasada por bloques"""
+    n, dim = matrix.shape
+    total = np.zeros(dim, dtype=np.float64)
+    squares = 0.0
+    for start in range(0, n, chunk_rows):
+        chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float64)
+        total += chunk.sum(axis=0)
+        squares += np.einsum('ij,ij->', chunk, chunk)
+
+    mean = total / n
+    return mean, squares / n - mean @ mean
+
+
+def _gram_product(matrix: np.ndarray, mean: np.ndarray, basis: np.ndarray, chunk_rows: int) -> np.ndarray:
+    """Calcula (X - media)^T (X - media) @ basis por bloques, sin materializar la matriz centrada"""
+    product = np.zeros_like(basis)
+    for start in range(0, len(matrix), chunk_rows):
+        chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float64) - mean
+        product += chunk.T @ (chunk @ basis)
+    return product
+
+
+def randomized_pca(matrix: np.ndarray, n_components: int, chunk_rows: int = 65536,
+                   oversample: int = 10, power_iterations: int = 4, seed: int = 0) -> tuple:
+    """
+    PCA aleatorizado por bloques (iteración de subespacio sobre la matriz de Gram)
+
+    Cada iteración es una pasada por bloques sobre la matriz, que puede estar mapeada en
+    memoria; solo se guardan en memoria matrices de dim x (n_components + oversample).
+
+    Returns:
+        tuple: (media, componentes [n_components, dim], fracción de varianza explicada por componente)
+    """
+    n, dim = matrix.shape
+    mean, total_variance = _column_stats(matrix, chunk_rows)
+
+    width = min(n_components + oversample, dim)
+    basis = np.random.default_rng(seed).standard_normal((dim, width))
+    for _ in range(power_iterations + 1):
+        basis, _ = np.linalg.qr(_gram_product(matrix, mean, basis, chunk_rows))
+
+    # Rayleigh-Ritz: descomposición exacta en el subespacio encontrado
+    eigenvalues, eigenvectors = np.linalg.eigh(basis.T @ _gram_product(matrix, mean, basis, chunk_rows))
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    components = (basis @ eigenvectors[:, order]).T
+
+    return mean, components, eigenvalues[order] / n / max(total_variance, 1e-12)
+
+
+def incremental_pca(matrix: np.ndarray, n_components: int, chunk_rows: int = 65536) -> tuple:
+    """
+    PCA exacto acumulando la matriz de covarianza por bloques en una sola pasada
+
+    Adecuado cuando la dimensión es moderada (la covarianza ocupa dim x dim).
+
+    Returns:
+        tuple: (media, componentes [n_components, dim], fracción de varianza explicada por componente)
+    """
+    n, dim = matrix.shape
+    total = np.zeros(dim, dtype=np.float64)
+    gram = np.zeros((dim, dim), dtype=np.float64)
+    for start in range(0, n, chunk_rows):
+        chunk = np.asarray(matrix[start:start + chunk_rows], dtype=np.float64)
+        total += chunk.sum(axis=0)
+        gram += chunk.T @ chunk
+
+    mean = total / n
+    covariance = gram / n - np.outer(mean, mean)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+
+    return mean, eigenvectors[:, order].T, eigenvalues[order] / max(np.trace(covariance), 1e-12)
+
+
+PCA_METHODS = {
+    'randomized': randomized_pca,
+    'incremental': incremental_pca
+}
+
+
+def reduce_matrix(matrix: np.ndarray, tokens: list, max_points: int = None, n_components: int = None,
+                  sampling: str = 'stratified', method: str = 'randomized',
+                  chunk_rows: int = 65536, seed: int = 0) -> tuple:
+    """
+    Submuestrea filas y proyecta sobre las componentes principales
+
+    El PCA se ajusta sobre todas las filas (por bloques) y solo se proyectan las muestreadas.
+
+    Args:
+        matrix: Matriz [N, dim] (array o memmap)
+        tokens: Token de cada fila
+        max_points: Número máximo de filas (None: todas)
+        n_components: Componentes principales (None o >= dim: sin PCA)
+        sampling: 'stratified' o 'random'
+        method: 'randomized' o 'incremental'
+        chunk_rows: Filas por bloque
+        seed: Semilla del muestreo y del PCA aleatorizado
+
+    Returns:
+        tuple: (matriz reducida float32, índices de fila seleccionados)
+    """
+    n, dim = matrix.shape
+    rows = sample_rows(tokens, max_points, sampling, seed) if max_points else np.arange(n)
+
+    if not n_components or n_components >= dim:
+        return np.ascontiguousarray(matrix[rows], dtype='<f4'), rows
+
+    if method not in PCA_METHODS:
+        raise ValueError(f"Método de PCA desconocido: {method}")
+    options = {'seed': seed} if method == 'randomized' else {}
+    mean, components, explained = PCA_METHODS[method](matrix, n_components, chunk_rows, **options)
+    logger.info(f"PCA ({method}): {n_components} componentes explican el {explained.sum():.1%} de la varianza")
+
+    reduced = np.empty((len(rows), n_components), dtype='<f4')
+    for start in range(0, len(rows), chunk_rows):
+        chunk = np.asarray(matrix[rows[start:start + chunk_rows]], dtype=np.float64) - mean
+        reduced[start:start + len(chunk)] = chunk @ components.T
+    return reduced, rows
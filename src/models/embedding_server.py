@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+import numpy as np
+
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def encode_matrix(embeddings: np.ndarray) -> str:
+    """Codifica una matriz como float32 little-endian en base64 (más compacto que una lista JSON)"""
+    return base64.b64encode(np.ascontiguousarray(embeddings, dtype='<f4').tobytes()).decode('ascii')
+
+
+def decode_matrix(data: str, dim: int) -> np.ndarray:
+    """Inverso de encode_matrix"""
+    return np.frombuffer(base64.b64decode(data), dtype='<f4').reshape(-1, dim)
+
+
+class EmbeddingServer:
+    """
+    Servidor HTTP local (asyncio) que mantiene los modelos cargados y agrupa peticiones en micro-lotes
+
+    Las peticiones de cada modelo entran en una cola acotada (server.max_queue). Un bucle por
+    modelo toma la primera petición pendiente, espera hasta server.batch_window_ms a que lleguen
+    más (hasta server.max_batch_size textos) y hace un solo forward pass para todas. Si la cola
+    está llena, la petición se rechaza con 503 y Retry-After para que el cliente reintente.
+
+    Endpoints:
+        POST /embed   {"texts": [...], "model": opcional} -> {"model", "revision", "backend", "dim",
+                      "count", "embeddings": float32 little-endian en base64}
+        GET  /health  Modelos cargados, peticiones en cola y estadísticas de los micro-lotes
+    """
+
+    def __init__(self, config: Config = None, model_manager=None):
+        self.config = config or Config()
+        # Si no se indica, el gestor se crea en el hilo del modelo al arrancar (así la importación
+        # de torch y la apertura de la caché no bloquean el bucle de eventos)
+        self.model_manager = model_manager
+        self.host = self.config.get('server.host', '127.0.0.1')
+        self.port = self.config.get('server.port', 8765)
+        self.batch_window = self.config.get('server.batch_window_ms', 5) / 1000
+        self.max_batch_size = self.config.get('server.max_batch_size', 64)
+        self.max_queue = self.config.get('server.max_queue', 256)
+        self.max_request_bytes = self.config.get('server.max_request_mb', 16) * 1024 * 1024
+        self.stats = {'requests': 0, 'rejected': 0, 'batches': 0, 'texts': 0}
+        self._queues = {}
+        self._batchers = []
+        # Un solo hilo para el modelo: los micro-lotes se ejecutan de uno en uno
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-model")
+
+    async def serve(self, preload: str = None):
+        """Carga el modelo indicado (o el de config.json) y atiende peticiones hasta que se cancele"""
+        loop = asyncio.get_running_loop()
+        if self.model_manager is None:
+            self.model_manager = await loop.run_in_executor(self._executor, self._create_model_manager)
+        model_name = preload or self.config.get_default_model()
+        if not await loop.run_in_executor(self._executor, self.model_manager.load_model, model_name):
+            raise RuntimeError(f"No se pudo cargar el modelo {model_name}")
+
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(
+            f"✅ Servidor de embeddings en http://{self.host}:{self.port} "
+            f"(ventana {self.batch_window * 1000:.0f} ms, lotes de hasta {self.max_batch_size} textos, "
+            f"cola de {self.max_queue} peticiones)"
+        )
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self._batchers:
+                task.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, preload: str = None):
+        """Ejecuta el servidor en un bucle de eventos propio"""
+        asyncio.run(self.serve(preload))
+
+    async def embed(self, texts: list, model_name: str = None) -> tuple:
+        """
+        Encola una petición y espera a su micro-lote
+
+        Returns:
+            tuple: (embeddings, info) con la matriz de la petición y el modelo que la calculó
+
+        Raises:
+            asyncio.QueueFull: Si la cola del modelo está llena
+        """
+        model_name = model_name or self.model_manager.model_name or self.config.get_default_model()
+        future = asyncio.get_running_loop().create_future()
+        self._queue_for(model_name).put_nowait((texts, future))
+        return await future
+
+    def _queue_for(self, model_name: str) -> asyncio.Queue:
+        """Cola del modelo, con su bucle de micro-lotes (se crea con la primera petición)"""
+        if model_name not in self._queues:
+            self._queues[model_name] = asyncio.Queue(maxsize=self.max_queue)
+            self._batchers.append(asyncio.create_task(self._batch_loop(model_name, self._queues[model_name])))
+        return self._queues[model_name]
+
+    async def _batch_loop(self, model_name: str, queue: asyncio.Queue):
+        """Agrupa las peticiones que llegan dentro de la ventana y las resuelve con un forward pass"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + self.batch_window
+            while count < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings, info = await loop.run_in_executor(self._executor, self._encode, model_name, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['texts'] += len(texts)
+            start = 0
+            for item_texts, future in batch:
+                # El cliente puede haberse desconectado mientras esperaba
+                if not future.done():
+                    future.set_result((embeddings[start:start + len(item_texts)], info))
+                start += len(item_texts)
+
+    def _create_model_manager(self):
+        # Importación diferida: torch solo se carga al arrancar el servidor
+        from src.models.model_manager import ModelManager
+        return ModelManager(self.config)
+
+    def _encode(self, model_name: str, texts: list) -> tuple:
+        """Codifica un micro-lote en el hilo del modelo (cambia de modelo si hace falta)"""
+        manager = self.model_manager
+        if manager.model_name != model_name and not manager.load_model(model_name):
+            raise RuntimeError(f"No se pudo cargar el modelo {model_name}")
+
+        embeddings = manager.encode_batch(texts, batch_size=self.max_batch_size)
+        return embeddings, {
+            'model': manager.model_name,
+            'revision': manager.model_revision,
+            'backend': manager.inference_backend,
+            'dim': manager.model.config.hidden_size
+        }
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atiende las peticiones HTTP/1.1 de una conexión (con keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > self.max_request_bytes:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        {'error': 'petición demasiado grande'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload, extra_headers = await self._dispatch(method, urlsplit(target).path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, extra_headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # Conexión cerrada a mitad de petición o línea de petición mal formada
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        """Devuelve (estado, respuesta JSON, cabeceras adicionales) de una petición"""
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {
+                'status': 'ok',
+                'models': self.model_manager.registry.loaded_models(),
+                'queued': sum(queue.qsize() for queue in self._queues.values()),
+                **self.stats,
+                'mean_batch_size': self.stats['texts'] / self.stats['batches'] if self.stats['batches'] else 0.0
+            }, {}
+
+        if method != 'POST' or path != '/embed':
+            return HTTPStatus.NOT_FOUND, {'error': f"ruta desconocida: {method} {path}"}, {}
+
+        try:
+            request = json.loads(body or b'{}')
+            texts = request.get('texts', [])
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("'texts' debe ser una lista de cadenas")
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}, {}
+
+        self.stats['requests'] += 1
+        try:
+            embeddings, info = await self.embed(texts, request.get('model'))
+        except asyncio.QueueFull:
+            # Backpressure: el cliente debe esperar y reintentar
+            self.stats['rejected'] += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'cola llena'}, {'Retry-After': '1'}
+        except Exception as e:
+            logger.error(f"❌ Error al calcular embeddings: {str(e)}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}, {}
+
+        return HTTPStatus.OK, {**info, 'count': len(embeddings), 'embeddings': encode_matrix(embeddings)}, {}
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict,
+                       extra_headers: dict = None, keep_alive: bool = True):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive' if keep_alive else 'close',
+            **(extra_headers or {})
+        }
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode('latin1') + b'\r\n' + body)
+        await writer.drain()
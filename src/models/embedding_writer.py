@@ -3,12 +3,54 @@ from pathlib import Path
 import logging
 from datetime import datetime
 import os
-import torch
+import sys
+import json
+import re
+import struct
 
+from src.models.embedding_reduction import reduce_matrix
+from src.models.embedding_catalog import EmbeddingCatalog, file_checksum
+from src.models.embedding_enrichment import enrichment_columns
+from src.models.embedding_reader import EmbeddingReader, stored_tensor_info
+from src.models.quantization import (
+    STORAGE_MODES, QuantizedMatrix, cosine_drift, dimension_scales, quantization_file,
+    quantize_chunk, scales_file
+)
 from src.utils.config import Config
+from src.utils.metrics import RunMetrics
+from src.utils.tensorboard import projector_embedding_entry
 
 logger = logging.getLogger(__name__)
 
+
+def is_torch_tensor(value) -> bool:
+    """Indica si value es un tensor de torch, sin importar torch si aún no está cargado"""
+    torch = sys.modules.get('torch')
+    return torch is not None and isinstance(value, torch.Tensor)
+
+
+def as_float32_array(embeddings) -> np.ndarray:
+    """
+    Convierte embeddings a un array float32 little-endian contiguo, sin copiar si ya lo son
+
+    Los tensores de torch en CPU comparten su buffer con el array resultante.
+    """
+    if is_torch_tensor(embeddings):
+        # float() y contiguous() no copian si el tensor ya es float32 contiguo
+        embeddings = embeddings.detach().cpu().float().contiguous().numpy()
+    return np.ascontiguousarray(embeddings, dtype='<f4')
+
+
+def escape_token(token: str) -> str:
+    """Escapa tabuladores y saltos de línea para mantener una fila de metadatos por token"""
+    return token.replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def format_metadata_value(value) -> str:
+    """Formatea un valor de una columna de metadatos (los reales con 6 cifras significativas)"""
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    return escape_token(str(value))
+
 class EmbeddingWriter:
     """Gestiona la escritura de embeddings y metadatos"""
     
@@ -16,128 +58,866 @@ class EmbeddingWriter:
         self.config = config
         self.output_dir = Path(config.get_output_dir())
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.write_tsv = config.get('output.tsv', False)
+        self.metrics = RunMetrics()
+        self.catalog = EmbeddingCatalog(self.output_dir)
+        # Tokenizador del modelo para las columnas id y length de enrich_metadata (opcional)
+        self.tokenizer = None
         
-    def save_embeddings(self, embeddings: np.ndarray, tokens: list, prefix: str = None) -> tuple:
+    @staticmethod
+    def model_prefix(model_name: str) -> str:
+        """Prefijo de archivo para los conjuntos de un modelo ('org/modelo' -> 'org--modelo')"""
+        return re.sub(r'[^\w.-]+', '-', model_name.strip('/').replace('/', '--'))
+
+    def save_embeddings(self, embeddings, tokens: list, prefix: str = None, metadata_columns: dict = None,
+                        info: dict = None) -> tuple:
         """
-        Guarda los embeddings y tokens en archivos TSV
-        
+        Guarda los embeddings en formato binario y los tokens en un archivo TSV
+
         Args:
-            embeddings: Array de embeddings
+            embeddings: Array o tensor de embeddings
             tokens: Lista de tokens correspondientes
             prefix: Prefijo opcional para los archivos
-            
+            metadata_columns: Columnas adicionales de metadatos {nombre: valores por fila}
+            info: Origen del conjunto para el manifiesto (model, revision, backend, mode...)
+
         Returns:
-            tuple: (tensor_file, metadata_file, config_file)
+            tuple: (tensor_file, metadata_file, config_file); si el contenido es idéntico a un
+                conjunto ya registrado, los de ese conjunto
         """
         # Generar timestamp para archivos únicos
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_prefix = f"{prefix}_{timestamp}" if prefix else timestamp
-        
+
         # Preparar archivos
-        tensor_file = self.output_dir / f"{file_prefix}_tensor.tsv"
         metadata_file = self.output_dir / f"{file_prefix}_metadata.tsv"
         config_file = self.output_dir / f"{file_prefix}_projector_config.pbtxt"
-        
+
         # Guardar embeddings
-        logger.info(f"Guardando embeddings en {tensor_file}...")
-        np.savetxt(tensor_file, embeddings, delimiter='\t')
-        
+        with self.metrics.stage('host_copy'):
+            array = as_float32_array(embeddings)
+        logger.info(f"Guardando embeddings en {self.output_dir / file_prefix}_tensor.*...")
+        tensor_file = projector_file = self._write_tensor(array, f"{file_prefix}_tensor")
+
         # Guardar tokens
         logger.info(f"Guardando tokens en {metadata_file}...")
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            f.write("token\n")  # Encabezado
-            for token in tokens:
-                f.write(f"{token}\n")
-        
-        # Crear configuración para TensorBoard
+        self._write_metadata(metadata_file, tokens, metadata_columns)
+
+        # Reducir y cuantizar según config.json
+        reduced = self._finalize_set(tensor_file, metadata_file)
+
+        # Crear configuración para TensorBoard (el .bytes puede no existir aún si el tensor está cuantizado)
         logger.info(f"Creando configuración en {config_file}...")
+        self._write_projector_config(config_file, *(reduced or (projector_file, metadata_file, array.shape)))
+
+        return self._set_files(self.register_set(file_prefix, info))
+
+    def open_stream(self, dim: int, prefix: str = None, checkpoint: dict = None,
+                    info: dict = None) -> 'EmbeddingStream':
+        """
+        Abre un conjunto de embeddings para escribirlo de forma incremental
+
+        Args:
+            dim: Dimensión de los embeddings
+            prefix: Prefijo opcional para los archivos
+            checkpoint: Identidad de la extracción (modelo, revisión, huella de la entrada);
+                si se indica, el progreso se guarda tras cada lote para poder reanudar
+            info: Origen del conjunto para el manifiesto (model, revision, backend, mode...)
+
+        Returns:
+            EmbeddingStream: Escritor incremental; se cierra con close() o con un bloque with
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_prefix = f"{prefix}_{timestamp}" if prefix else timestamp
+        return EmbeddingStream(self, file_prefix, dim, checkpoint, info=info)
+
+    def resume_stream(self, progress_file: Path) -> 'EmbeddingStream':
+        """
+        Reabre un conjunto escrito con open_stream a partir de su archivo de progreso
+
+        Los archivos se recortan a las filas confirmadas y la escritura continúa tras ellas.
+        """
+        progress = self.load_checkpoint(progress_file)
+        file_prefix = Path(progress_file).name.rsplit('_progress.json', maxsplit=1)[0]
+        return EmbeddingStream(self, file_prefix, progress['dim'], progress['identity'], progress, progress.get('info'))
+
+    def _write_projector_config(self, config_file: Path, tensor_file: Path, metadata_file: Path, shape: tuple,
+                                tensor_name: str = "embeddings"):
+        """Escribe el projector_config.pbtxt de un conjunto"""
         with open(config_file, 'w', encoding='utf-8') as f:
-            f.write('embeddings {\n')
-            f.write('  tensor_name: "embeddings"\n')
-            f.write(f'  tensor_path: "{tensor_file.name}"\n')
-            f.write(f'  metadata_path: "{metadata_file.name}"\n')
-            f.write('}\n')
-            
-        return tensor_file, metadata_file, config_file
-        
-    def get_latest_embeddings(self) -> tuple:
+            f.write(projector_embedding_entry(
+                tensor_name,
+                tensor_file.name,
+                metadata_file.name,
+                shape if tensor_file.suffix == '.bytes' else None
+            ))
+
+    def _finalize_set(self, tensor_file: Path, metadata_file: Path) -> tuple:
         """
-        Obtiene los archivos de embeddings más recientes
-        
+        Reduce y cuantiza un conjunto recién escrito
+
+        Returns:
+            tuple: (tensor_file, metadata_file, shape) del conjunto reducido que debe cargar
+                el proyector, o None si carga el conjunto completo
+        """
+        if self.config.get('enrichment.enabled', False):
+            # Antes de reducir, para que el conjunto reducido herede las columnas
+            self.enrich_metadata(tensor_file, metadata_file)
+        reduced = self.reduce_embeddings(tensor_file, metadata_file)
+        report = self.quantize_embeddings(tensor_file)
+        if report and tensor_file.suffix == '.bytes' and tensor_file.exists():
+            # El .npy compacto es la copia de referencia. Si el proyector carga el conjunto
+            # completo, TensorBoardManager regenera el .bytes float32 solo al visualizarlo
+            tensor_file.unlink()
+        return reduced
+
+    def enrich_metadata(self, tensor_file: Path, metadata_file: Path, tokenizer=None) -> dict:
+        """
+        Reescribe los metadatos de un conjunto con columnas para colorear y filtrar en el proyector
+
+        Añade tras el token su id en el vocabulario, su longitud en tokens, su tipo (special,
+        subword o word), el grupo de un k-means por mini-lotes sobre el tensor y la norma del
+        vector, según enrichment.*. Las columnas que ya tuviera el archivo (p. ej. recuentos)
+        se conservan. Sin tokenizador (el indicado o self.tokenizer) se omiten id y length.
+
+        Returns:
+            dict: Columnas añadidas {nombre: valores por fila}
+        """
+        reader = EmbeddingReader(tensor_file, metadata_file, self.config)
+        tokens, columns = reader.tokens, reader.columns
+        logger.info(f"Enriqueciendo los metadatos de {tensor_file.name}...")
+        with self.metrics.stage('enrich'):
+            enriched = enrichment_columns(
+                reader,
+                tokenizer or self.tokenizer,
+                n_clusters=self.config.get('enrichment.clusters', 32),
+                batch_rows=self.config.get('enrichment.batch_rows', 4096),
+                passes=self.config.get('enrichment.passes', 3),
+                chunk_rows=self.config.get('enrichment.chunk_rows', 65536),
+                seed=self.config.get('enrichment.seed', 0)
+            )
+        del reader
+
+        # Se escribe aparte y se sustituye, para no dejar un archivo a medias si algo falla
+        tmp_file = metadata_file.with_name(f"{metadata_file.name}.tmp")
+        self._write_metadata(tmp_file, tokens, {
+            **{name: values for name, values in columns.items() if name not in enriched},
+            **enriched
+        })
+        os.replace(tmp_file, metadata_file)
+        return enriched
+
+    def enrich_set(self, name: str, tokenizer=None) -> tuple:
+        """
+        Enriquece los metadatos de un conjunto ya registrado y actualiza su entrada del manifiesto
+
+        Si el conjunto tiene versión reducida, se regenera para que herede las columnas.
+
+        Returns:
+            tuple: (tensor_file, metadata_file, config_file)
+        """
+        entry = self.catalog.get(name)
+        if entry is None:
+            raise ValueError(f"El conjunto {name} no está registrado en {self.catalog.manifest_file}")
+        tensor_file, metadata_file, _ = self._entry_files(entry)
+
+        self.enrich_metadata(tensor_file, metadata_file, tokenizer)
+        if (self.output_dir / f"{name}_reduced_metadata.tsv").exists():
+            self.reduce_embeddings(tensor_file, metadata_file)
+
+        # La huella cambia con los metadatos; el resto de la entrada (y la fecha) se conserva
+        self.catalog.register(self._describe_set(name, entry), latest=False)
+        return self._entry_files(entry)
+
+    def quantize_embeddings(self, tensor_file: Path) -> dict:
+        """
+        Convierte el .npy float32 de un conjunto al formato compacto de output.storage
+
+        La conversión se hace por bloques sobre el archivo mapeado en memoria. En los modos
+        int8 las escalas se guardan en {stem}_scales.npy (una por fila o una por dimensión).
+        El error de reconstrucción (1 - coseno frente a float32) se guarda en
+        {stem}_quantization.json para elegir el formato más barato que no altere los vecinos.
+
+        Returns:
+            dict: Formato, tamaños y error de reconstrucción, o None si se guarda en float32
+        """
+        mode = self.config.get('output.storage', 'float32')
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Formato de almacenamiento desconocido: {mode}")
+
+        npy_file = tensor_file.with_suffix('.npy')
+        if mode == 'float32':
+            # Evitar que escalas de una cuantización anterior se apliquen al nuevo float32
+            for path in (scales_file(npy_file), quantization_file(npy_file)):
+                if path.exists():
+                    path.unlink()
+            return None
+
+        chunk_rows = self.config.get('output.chunk_rows', 65536)
+        # Si el tensor ya estaba cuantizado, se parte de su versión descuantizada
+        source = EmbeddingReader(tensor_file, config=self.config).matrix
+        dim_scales = dimension_scales(source, chunk_rows) if mode == 'int8_dim' else None
+        row_scales = np.empty((len(source), 1), dtype='<f4') if mode == 'int8_row' else None
+
+        tmp_file = npy_file.with_name(f"{npy_file.stem}.tmp.npy")
+        target = np.lib.format.open_memmap(
+            tmp_file, mode='w+', dtype='<f2' if mode == 'float16' else 'i1', shape=source.shape
+        )
+        drift_sum = 0.0
+        drift_max = 0.0
+        with self.metrics.stage('quantize'):
+            for start in range(0, len(source), chunk_rows):
+                chunk = np.asarray(source[start:start + chunk_rows])
+                data, scales = quantize_chunk(chunk, mode, dim_scales)
+                target[start:start + len(chunk)] = data
+                if row_scales is not None:
+                    row_scales[start:start + len(chunk)] = scales
+
+                restored = QuantizedMatrix(data, scales if scales is not None else dim_scales)[:]
+                drift = cosine_drift(chunk, restored)
+                drift_sum += drift.sum()
+                drift_max = max(drift_max, float(drift.max(initial=0.0)))
+
+        shape = source.shape
+        target.flush()
+        del target, source
+        os.replace(tmp_file, npy_file)
+
+        scales = row_scales if row_scales is not None else dim_scales
+        if scales is not None:
+            np.save(scales_file(npy_file), scales)
+        elif scales_file(npy_file).exists():
+            scales_file(npy_file).unlink()
+
+        report = {
+            'storage': mode,
+            'shape': list(shape),
+            'float32_bytes': shape[0] * shape[1] * 4,
+            'stored_bytes': npy_file.stat().st_size + (scales.nbytes if scales is not None else 0),
+            'cosine_drift_mean': drift_sum / shape[0] if shape[0] else 0.0,
+            'cosine_drift_max': drift_max
+        }
+        with open(quantization_file(npy_file), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.metrics.add('bytes_written', report['stored_bytes'])
+
+        logger.info(
+            f"Tensor guardado en {mode}: {report['stored_bytes'] / 2**20:.1f} MiB "
+            f"(float32: {report['float32_bytes'] / 2**20:.1f} MiB), "
+            f"deriva coseno media {report['cosine_drift_mean']:.2e}"
+        )
+        return report
+
+    def reduce_embeddings(self, tensor_file: Path, metadata_file: Path) -> tuple:
+        """
+        Genera una versión reducida de un conjunto para que el proyector siga siendo interactivo
+
+        Según config.json (reduction.*), submuestrea las filas hasta reduction.max_points y
+        proyecta sobre reduction.pca_components componentes principales. La matriz completa
+        se recorre por bloques desde el .npy mapeado en memoria. El resultado se guarda junto
+        al conjunto como reduced_tensor.* / reduced_metadata.tsv (con el mismo prefijo).
+
+        Returns:
+            tuple: (tensor_file, metadata_file, shape) del conjunto reducido, o None si no hace falta
+        """
+        base = tensor_file.stem[:-len('tensor')]
+        reduced_stem = f"{base}reduced_tensor"
+        reduced_metadata = self.output_dir / f"{base}reduced_metadata.tsv"
+
+        reader = EmbeddingReader(tensor_file, metadata_file, self.config)
+        matrix = reader.matrix
+        max_points = self.config.get('reduction.max_points', 50000)
+        n_components = self.config.get('reduction.pca_components')
+        needs_sampling = bool(max_points) and len(matrix) > max_points
+        needs_pca = bool(n_components) and n_components < matrix.shape[1]
+
+        if not self.config.get('reduction.enabled', True) or not (needs_sampling or needs_pca):
+            # Evitar que una reducción antigua quede desincronizada con el conjunto completo
+            for path in [self.output_dir / f"{reduced_stem}.{suffix}" for suffix in ('npy', 'bytes', 'tsv')]:
+                if path.exists():
+                    path.unlink()
+            if reduced_metadata.exists():
+                reduced_metadata.unlink()
+            return None
+
+        logger.info(f"Reduciendo {tensor_file.name} para el proyector...")
+        tokens, columns = reader.tokens, reader.columns
+        with self.metrics.stage('reduce'):
+            reduced, rows = reduce_matrix(
+                matrix,
+                tokens,
+                max_points=max_points if needs_sampling else None,
+                n_components=n_components if needs_pca else None,
+                sampling=self.config.get('reduction.sampling', 'stratified'),
+                method=self.config.get('reduction.pca_method', 'randomized'),
+                chunk_rows=self.config.get('reduction.chunk_rows', 65536),
+                seed=self.config.get('reduction.seed', 0)
+            )
+        original_shape = matrix.shape
+        del matrix, reader
+
+        reduced_file = self._write_tensor(reduced, reduced_stem)
+        self._write_metadata(
+            reduced_metadata,
+            [tokens[row] for row in rows],
+            {name: [values[row] for row in rows] for name, values in columns.items()}
+        )
+        logger.info(
+            f"✅ Conjunto reducido de {original_shape[0]}x{original_shape[1]} a {reduced.shape[0]}x{reduced.shape[1]}"
+        )
+
+        return reduced_file, reduced_metadata, reduced.shape
+
+    def _write_tensor(self, array: np.ndarray, stem: str) -> Path:
+        """
+        Escribe un array float32 como .npy y como bytes float32 little-endian para el proyector
+
+        Returns:
+            Path: Archivo .bytes que debe usar el proyector
+        """
+        npy_file = self.output_dir / f"{stem}.npy"
+        bytes_file = self.output_dir / f"{stem}.bytes"
+        tsv_file = self.output_dir / f"{stem}.tsv"
+
+        # np.save y tofile escriben el buffer contiguo directamente, sin copias intermedias
+        with self.metrics.stage('write'):
+            np.save(npy_file, array)
+            array.tofile(bytes_file)
+        self.metrics.add('bytes_written', npy_file.stat().st_size + bytes_file.stat().st_size)
+        self._export_tsv(array, tsv_file)
+
+        return bytes_file
+
+    def _export_tsv(self, array: np.ndarray, tsv_file: Path, chunk_rows: int = 8192):
+        """Exporta el tensor a TSV por bloques si está activado; si no, elimina un TSV obsoleto"""
+        if not self.write_tsv:
+            if tsv_file.exists():
+                # Evitar que un TSV antiguo quede desincronizado con el binario
+                tsv_file.unlink()
+            return
+
+        with self.metrics.stage('write_tsv'), open(tsv_file, 'w', encoding='utf-8') as f:
+            for start in range(0, len(array), chunk_rows):
+                np.savetxt(f, array[start:start + chunk_rows], delimiter='\t')
+        self.metrics.add('bytes_written', tsv_file.stat().st_size)
+
+    def _write_metadata(self, metadata_file: Path, tokens: list, columns: dict = None):
+        """
+        Escribe una fila por token
+
+        Sin columnas adicionales el archivo tiene una sola columna y no lleva encabezado; con
+        columnas (p. ej. recuentos), la primera línea es el encabezado, como exige el proyector.
+        """
+        with self.metrics.stage('write_metadata'), open(metadata_file, 'w', encoding='utf-8') as f:
+            if not columns:
+                for token in tokens:
+                    f.write(f"{escape_token(str(token))}\n")
+            else:
+                f.write('\t'.join(['token', *columns]) + '\n')
+                for i, token in enumerate(tokens):
+                    values = [format_metadata_value(values[i]) for values in columns.values()]
+                    f.write('\t'.join([escape_token(str(token)), *values]) + '\n')
+        self.metrics.add('bytes_written', metadata_file.stat().st_size)
+
+    def find_embeddings(self, base_name: str = None) -> tuple:
+        """
+        Localiza los archivos de un conjunto guardado
+
+        Args:
+            base_name: Nombre base del conjunto (None para tensor.* / metadata.tsv)
+
+        Returns:
+            tuple: (tensor_file, metadata_file) o (None, None)
+        """
+        tensor_file = self._find_tensor_file(base_name)
+        metadata_file = self.output_dir / (f"{base_name}_metadata.tsv" if base_name else "metadata.tsv")
+        if tensor_file and metadata_file.exists():
+            return tensor_file, metadata_file
+        return None, None
+
+    def set_entry(self, tensor_file: Path) -> dict:
+        """Entrada del manifiesto del conjunto al que pertenece un archivo de tensor, o None si no está registrado"""
+        stem = Path(tensor_file).stem
+        if not stem.endswith('_tensor'):
+            return None
+        self._ensure_catalog()
+        return self.catalog.get(stem[:-len('_tensor')])
+
+    def _find_tensor_file(self, base_name: str) -> Path:
+        """Devuelve el archivo de tensor de un conjunto (binario o TSV) o None"""
+        prefix = f"{base_name}_" if base_name else ""
+        for suffix in ('bytes', 'npy', 'tsv'):
+            tensor_file = self.output_dir / f"{prefix}tensor.{suffix}"
+            if tensor_file.exists():
+                return tensor_file
+        return None
+
+    def get_latest_embeddings(self, model: str = None) -> tuple:
+        """
+        Obtiene los archivos de embeddings más recientes (según el manifiesto)
+
+        Args:
+            model: Limita la búsqueda a los conjuntos de un modelo
+
         Returns:
             tuple: (tensor_file, metadata_file, config_file) o (None, None, None)
         """
         try:
-            # Buscar archivos de configuración
-            config_files = list(self.output_dir.glob("*_projector_config.pbtxt"))
-            if not config_files:
-                return None, None, None
-                
-            # Ordenar por fecha de modificación
-            latest_config = max(config_files, key=lambda f: f.stat().st_mtime)
-            base_name = latest_config.stem.rsplit('_projector_config', maxsplit=1)[0]
-            
-            tensor_file = self.output_dir / f"{base_name}_tensor.tsv"
-            metadata_file = self.output_dir / f"{base_name}_metadata.tsv"
-            
-            if tensor_file.exists() and metadata_file.exists():
-                return tensor_file, metadata_file, latest_config
-                
+            self._ensure_catalog()
+            entry = self.catalog.latest(model)
+            if entry:
+                return self._entry_files(entry)
         except Exception as e:
             logger.error(f"Error al buscar embeddings recientes: {str(e)}")
-            
+
         return None, None, None
-        
-    def list_available_embeddings(self) -> list:
+
+    def list_available_embeddings(self, model: str = None) -> list:
         """
-        Lista todos los conjuntos de embeddings disponibles
-        
+        Lista los conjuntos de embeddings registrados en el manifiesto, del más reciente al más antiguo
+
+        Args:
+            model: Limita la lista a los conjuntos de un modelo
+
         Returns:
-            list: Lista de tuplas (nombre_base, tensor_file, metadata_file, config_file)
+            list: Lista de tuplas (modelo, tensor_file, metadata_file, config_file)
         """
         try:
-            results = []
-            config_files = list(self.output_dir.glob("*_projector_config.pbtxt"))
-            
-            for config_file in config_files:
-                base_name = config_file.stem.rsplit('_projector_config', maxsplit=1)[0]
-                tensor_file = self.output_dir / f"{base_name}_tensor.tsv"
-                metadata_file = self.output_dir / f"{base_name}_metadata.tsv"
-                
-                if tensor_file.exists() and metadata_file.exists():
-                    # Si el nombre tiene timestamp, lo extraemos para mostrar solo el modelo
-                    display_name = base_name.split('_')[0] if '_' in base_name else base_name
-                    results.append((
-                        display_name,
-                        tensor_file,
-                        metadata_file,
-                        config_file
-                    ))
-            
-            return sorted(results, key=lambda x: x[1].stat().st_mtime, reverse=True)
-            
+            self._ensure_catalog()
+            return [
+                (self.catalog.display_name(entry), *self._entry_files(entry))
+                for entry in self.catalog.entries(model)
+            ]
         except Exception as e:
             logger.error(f"Error al listar embeddings: {str(e)}")
             return []
+
+    def register_set(self, name: str, info: dict = None) -> str:
+        """
+        Registra un conjunto recién guardado en el manifiesto
+
+        Si catalog.dedupe está activado y otro conjunto registrado tiene el mismo contenido
+        (tensor y metadatos), se eliminan los archivos del nuevo y se reutiliza el existente.
+        Con catalog.register desactivado el conjunto se guarda sin registrarse.
+
+        Returns:
+            str: Nombre del conjunto que queda registrado con ese contenido
+        """
+        if not self.config.get('catalog.register', True):
+            return name
+
+        # En un directorio con conjuntos anteriores al manifiesto, estos se registran primero
+        self._ensure_catalog()
+        entry = self._describe_set(name, info)
+        if entry is None:
+            return name
+
+        if self.config.get('catalog.dedupe', True):
+            duplicate = self.catalog.find_duplicate(entry['checksum'], name)
+            if duplicate:
+                self._remove_set_files(name)
+                self.catalog.touch(duplicate['name'], {
+                    key: value for key, value in entry.items() if key not in ('name', 'tensor', 'metadata', 'config')
+                })
+                logger.info(f"♻️ El conjunto {name} es idéntico a {duplicate['name']}; se reutiliza el existente")
+                return duplicate['name']
+
+        self.catalog.register(entry)
+        return name
+
+    def _describe_set(self, name: str, info: dict = None) -> dict:
+        """Entrada del manifiesto de un conjunto guardado, o None si le faltan archivos"""
+        tensor_file = self._find_tensor_file(name)
+        metadata_file = self.output_dir / f"{name}_metadata.tsv"
+        if not tensor_file or not metadata_file.exists():
+            return None
+        config_file = self.output_dir / f"{name}_projector_config.pbtxt"
+
+        shape, dtype = stored_tensor_info(tensor_file, metadata_file)
+        npy_file = tensor_file.with_suffix('.npy')
+        content = [npy_file if npy_file.exists() else tensor_file, metadata_file]
+        if scales_file(npy_file).exists():
+            content.insert(1, scales_file(npy_file))
+
+        info = dict(info or {})
+        return {
+            'name': name,
+            'model': info.pop('model', None),
+            'revision': info.pop('revision', None),
+            'mode': info.pop('mode', None),
+            **info,
+            'rows': shape[0],
+            'dims': shape[1],
+            'dtype': np.dtype(dtype).name,
+            'checksum': file_checksum(content),
+            'tensor': tensor_file.name,
+            'metadata': metadata_file.name,
+            'config': config_file.name if config_file.exists() else None
+        }
+
+    def _ensure_catalog(self):
+        """Crea el manifiesto a partir del directorio si aún no existe (conjuntos anteriores a él)"""
+        if not self.catalog.exists():
+            self.catalog.rebuild(self._describe_set)
+
+    def _entry_files(self, entry: dict) -> tuple:
+        """(tensor_file, metadata_file, config_file) de una entrada del manifiesto"""
+        return (
+            self.output_dir / entry['tensor'],
+            self.output_dir / entry['metadata'],
+            self.output_dir / entry['config'] if entry.get('config') else None
+        )
+
+    def _set_files(self, name: str) -> tuple:
+        """(tensor_file, metadata_file, config_file) de un conjunto con nombre"""
+        return (
+            self._find_tensor_file(name),
+            self.output_dir / f"{name}_metadata.tsv",
+            self.output_dir / f"{name}_projector_config.pbtxt"
+        )
+
+    def _remove_set_files(self, name: str):
+        """Elimina los archivos de un conjunto con nombre (tensor, reducido, metadatos y configuración)"""
+        paths = [self.output_dir / f"{name}_{suffix}" for suffix in (
+            'metadata.tsv', 'reduced_metadata.tsv', 'projector_config.pbtxt', 'progress.json'
+        )]
+        for stem in (f"{name}_tensor", f"{name}_reduced_tensor"):
+            paths += [self.output_dir / f"{stem}.{suffix}" for suffix in ('npy', 'bytes', 'tsv')]
+            paths += [scales_file(self.output_dir / f"{stem}.npy"), quantization_file(self.output_dir / f"{stem}.npy")]
+        for path in paths:
+            if path.exists():
+                path.unlink()
         
-    def save_batch_embeddings(self, embeddings_list: list, texts: list, model_name: str):
-        """Guarda un conjunto de embeddings y sus metadatos para TensorBoard"""
+    def save_stream(self, batches, tokens: list, dim: int, prefix: str = None,
+                    checkpoint: dict = None, resume: dict = None, views: list = None, info: dict = None):
+        """
+        Escribe embeddings generados lote a lote en archivos binarios preasignados
+
+        Cada lote se copia directamente en un .npy y un .bytes mapeados en memoria,
+        por lo que el consumo de memoria es de un lote, sea cual sea el vocabulario.
+
+        Args:
+            batches: Iterable de (rows, embeddings) con la posición de cada fila
+            tokens: Lista de tokens (una fila de metadatos por fila del tensor)
+            dim: Dimensión de los embeddings
+            prefix: Prefijo opcional para los archivos (por defecto tensor.* / metadata.tsv)
+            checkpoint: Identidad de la extracción (modelo, revisión, huella de la entrada);
+                si se indica, el progreso se guarda periódicamente para poder reanudar
+            resume: Progreso guardado (load_checkpoint) de una extracción interrumpida;
+                batches debe empezar en el primer lote pendiente
+            views: Nombres de las vistas si cada lote trae un dict {vista: embeddings}
+                (ModelManager.extraction_views); cada vista se guarda como un conjunto propio
+                con el prefijo {prefix}_{vista}, con su projector_config.pbtxt
+            info: Origen del conjunto para el manifiesto (model, revision, backend, mode...);
+                solo se registran los conjuntos con nombre (con prefijo o vistas)
+
+        Returns:
+            Path: Archivo de tensor que debe usar el proyector, o dict {vista: archivo} con views
+        """
+        view_prefixes = {
+            view: (f"{prefix}_{view}" if prefix else view) if view else prefix
+            for view in (views or [None])
+        }
+        progress_file = self.progress_file(prefix)
+        shape = (len(tokens), dim)
+
+        maps = {}
+        for view, view_prefix in view_prefixes.items():
+            stem = f"{view_prefix}_tensor" if view_prefix else "tensor"
+            if resume:
+                npy_map = np.load(self.output_dir / f"{stem}.npy", mmap_mode='r+')
+                bytes_map = np.memmap(self.output_dir / f"{stem}.bytes", dtype='<f4', mode='r+', shape=shape)
+                if npy_map.shape != shape:
+                    raise ValueError(f"El archivo parcial tiene forma {npy_map.shape}, se esperaba {shape}")
+            else:
+                npy_map = np.lib.format.open_memmap(self.output_dir / f"{stem}.npy", mode='w+', dtype='<f4', shape=shape)
+                bytes_map = np.memmap(self.output_dir / f"{stem}.bytes", dtype='<f4', mode='w+', shape=shape)
+            maps[view] = (stem, npy_map, bytes_map)
+        batches_done = resume['batches'] if resume else 0
+
+        checkpoint_every = self.config.get('extraction.checkpoint_every', 50)
+
+        def flush():
+            for _, npy_map, bytes_map in maps.values():
+                npy_map.flush()
+                bytes_map.flush()
+
+        def save_progress():
+            flush()
+            self._save_progress(progress_file, {
+                'kind': 'vocabulary',
+                'identity': checkpoint,
+                'batches': batches_done
+            })
+
         try:
-            if isinstance(embeddings_list[0], torch.Tensor):
-                embeddings_array = torch.stack(embeddings_list).detach().cpu().numpy()
+            for rows, embeddings in batches:
+                for view, (_, npy_map, bytes_map) in maps.items():
+                    with self.metrics.stage('host_copy'):
+                        array = as_float32_array(embeddings if view is None else embeddings[view])
+                    with self.metrics.stage('write'):
+                        npy_map[rows] = array
+                        bytes_map[rows] = array
+                    self.metrics.add('bytes_written', 2 * array.nbytes)
+                batches_done += 1
+
+                if checkpoint and batches_done % checkpoint_every == 0:
+                    save_progress()
+
+            flush()
+            for stem, npy_map, _ in maps.values():
+                self._export_tsv(npy_map, self.output_dir / f"{stem}.tsv")
+        except BaseException:
+            # Interrupción (error, Ctrl-C): guardar hasta el último lote completo
+            if checkpoint:
+                save_progress()
+                logger.warning(f"⚠️ Progreso guardado en {progress_file} ({batches_done} lotes completos)")
+            raise
+        finally:
+            del maps
+
+        tensor_files = {}
+        for view, view_prefix in view_prefixes.items():
+            stem = f"{view_prefix}_tensor" if view_prefix else "tensor"
+            metadata_file = self.output_dir / (f"{view_prefix}_metadata.tsv" if view_prefix else "metadata.tsv")
+            self._write_metadata(metadata_file, tokens)
+            reduced = self._finalize_set(self.output_dir / f"{stem}.bytes", metadata_file)
+            if view_prefix:
+                # Los conjuntos con nombre (y cada vista) llevan su propia configuración, igual que save_embeddings
+                self._write_projector_config(
+                    self.output_dir / f"{view_prefix}_projector_config.pbtxt",
+                    *(reduced or (self.output_dir / f"{stem}.bytes", metadata_file, shape)),
+                    tensor_name=view or "embeddings"
+                )
+                view_prefix = self.register_set(view_prefix, {**(info or {}), **({'view': view} if view else {})})
+            tensor_files[view] = self._find_tensor_file(view_prefix)
+        if progress_file.exists():
+            progress_file.unlink()
+
+        return tensor_files if views else tensor_files[None]
+
+    def progress_file(self, prefix: str = None) -> Path:
+        """Ruta del archivo de progreso de un conjunto"""
+        return self.output_dir / (f"{prefix}_progress.json" if prefix else "progress.json")
+
+    def load_checkpoint(self, progress_file: Path) -> dict:
+        """Lee un archivo de progreso; devuelve None si no existe"""
+        progress_file = Path(progress_file)
+        if not progress_file.exists():
+            return None
+        with open(progress_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    def find_stream_checkpoint(self, prefix: str = None) -> Path:
+        """Busca el archivo de progreso más reciente de un conjunto escrito con open_stream"""
+        pattern = f"{prefix}_*_progress.json" if prefix else "*_progress.json"
+        candidates = list(self.output_dir.glob(pattern))
+        if not candidates:
+            return None
+        return max(candidates, key=lambda f: f.stat().st_mtime)
+
+    @staticmethod
+    def checkpoint_mismatches(progress: dict, checkpoint: dict) -> list:
+        """Devuelve los campos de identidad (modelo, revisión, entrada...) que han cambiado"""
+        saved = progress.get('identity') or {}
+        return [key for key, value in checkpoint.items() if saved.get(key) != value]
+
+    def _save_progress(self, progress_file: Path, progress: dict):
+        """Escribe el archivo de progreso de forma atómica"""
+        progress['updated'] = datetime.now().isoformat(timespec='seconds')
+        tmp_file = progress_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(progress, f, indent=2)
+        os.replace(tmp_file, progress_file)
+
+    def save_batch_embeddings(self, embeddings_list, texts: list, model_name: str) -> tuple:
+        """
+        Guarda un conjunto de embeddings y sus metadatos para TensorBoard
+
+        El conjunto lleva el prefijo del modelo y una marca de tiempo, así que no sustituye a
+        los anteriores y el proyector puede mostrarlo junto a los de otros modelos.
+
+        Returns:
+            tuple: (tensor_file, metadata_file, config_file), o None si falla
+        """
+        try:
+            if is_torch_tensor(embeddings_list) or isinstance(embeddings_list, np.ndarray):
+                embeddings_array = as_float32_array(embeddings_list)
+            elif is_torch_tensor(embeddings_list[0]):
+                # Si los elementos son tensores, torch ya está importado
+                import torch
+                embeddings_array = as_float32_array(torch.stack(embeddings_list))
             else:
-                embeddings_array = np.stack(embeddings_list)
+                embeddings_array = as_float32_array(np.stack(embeddings_list))
                 
-            # Guardar embeddings
-            np.savetxt(
-                self.output_dir / "tensor.tsv",
+            return self.save_embeddings(
                 embeddings_array,
-                delimiter='\t'
+                texts,
+                prefix=self.model_prefix(model_name),
+                info={'model': model_name}
             )
-            
-            # Guardar metadatos
-            with open(self.output_dir / "metadata.tsv", 'w', encoding='utf-8') as f:
-                f.write('\n'.join(texts))
                 
         except Exception as e:
             logger.error(f"Error al guardar embeddings por lote: {str(e)}")
+            return None
+
+
+NPY_HEADER_SIZE = 128
+
+
+def npy_header(shape: tuple, dtype: str = '<f4') -> bytes:
+    """Cabecera .npy (versión 1.0) de tamaño fijo, para poder reescribirla al conocer el número de filas"""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (dtype, tuple(shape))
+    body_size = NPY_HEADER_SIZE - 10
+    return (
+        b'\x93NUMPY\x01\x00'
+        + struct.pack('<H', body_size)
+        + header.ljust(body_size - 1).encode('latin1')
+        + b'\n'
+    )
+
+
+class EmbeddingStream:
+    """Escribe un conjunto de embeddings por lotes, sin conocer de antemano el número de filas"""
+
+    def __init__(self, writer: EmbeddingWriter, file_prefix: str, dim: int,
+                 checkpoint: dict = None, progress: dict = None, info: dict = None):
+        self.writer = writer
+        self.file_prefix = file_prefix
+        self.dim = dim
+        self.rows = progress['rows'] if progress else 0
+        self.checkpoint = checkpoint
+        self.info = info
+
+        output_dir = writer.output_dir
+        self.npy_file = output_dir / f"{file_prefix}_tensor.npy"
+        self.tensor_file = output_dir / f"{file_prefix}_tensor.bytes"
+        self.tsv_file = output_dir / f"{file_prefix}_tensor.tsv"
+        self.metadata_file = output_dir / f"{file_prefix}_metadata.tsv"
+        self.config_file = output_dir / f"{file_prefix}_projector_config.pbtxt"
+        self.progress_file = output_dir / f"{file_prefix}_progress.json"
+
+        if progress:
+            # Descartar lo escrito después del último progreso confirmado
+            data_size = self.rows * dim * 4
+            os.truncate(self.npy_file, NPY_HEADER_SIZE + data_size)
+            os.truncate(self.tensor_file, data_size)
+            os.truncate(self.metadata_file, progress['metadata_bytes'])
+            self._npy = open(self.npy_file, 'r+b')
+            self._npy.seek(0, os.SEEK_END)
+            self._bytes = open(self.tensor_file, 'ab')
+            self._metadata = open(self.metadata_file, 'a', encoding='utf-8')
+            self._tsv = None
+            if writer.write_tsv:
+                if self.tsv_file.exists() and progress.get('tsv_bytes') is not None:
+                    os.truncate(self.tsv_file, progress['tsv_bytes'])
+                    self._tsv = open(self.tsv_file, 'a', encoding='utf-8')
+                else:
+                    logger.warning("⚠️ No hay TSV parcial que reanudar; se omite la exportación TSV")
+        else:
+            self._npy = open(self.npy_file, 'wb')
+            self._npy.write(npy_header((0, dim)))
+            self._bytes = open(self.tensor_file, 'wb')
+            self._metadata = open(self.metadata_file, 'w', encoding='utf-8')
+            self._tsv = open(self.tsv_file, 'w', encoding='utf-8') if writer.write_tsv else None
+
+        # Tamaño de los archivos de texto, para contar solo lo que escribe cada lote
+        self._text_sizes = {f.name: os.fstat(f.fileno()).st_size for f in (self._metadata, self._tsv) if f}
+
+    def write(self, embeddings, tokens: list):
+        """Añade un lote de vectores y sus filas de metadatos y lo vuelca a disco"""
+        metrics = self.writer.metrics
+        with metrics.stage('host_copy'):
+            array = as_float32_array(embeddings)
+        if array.shape != (len(tokens), self.dim):
+            raise ValueError(
+                f"El lote tiene forma {array.shape}, se esperaba ({len(tokens)}, {self.dim})"
+            )
+
+        # Escritura directa del buffer contiguo, sin copias intermedias
+        with metrics.stage('write'):
+            self._npy.write(memoryview(array))
+            self._bytes.write(memoryview(array))
+        metrics.add('bytes_written', 2 * array.nbytes)
+        if self._tsv:
+            with metrics.stage('write_tsv'):
+                np.savetxt(self._tsv, array, delimiter='\t')
+        with metrics.stage('write_metadata'):
+            self._metadata.writelines(f"{escape_token(str(token))}\n" for token in tokens)
+        self.rows += len(tokens)
+
+        for f in self._files():
+            f.flush()
+        for f in (self._metadata, self._tsv):
+            if f:
+                # Los archivos de texto se miden por su crecimiento en disco
+                size = os.fstat(f.fileno()).st_size
+                metrics.add('bytes_written', size - self._text_sizes.get(f.name, 0))
+                self._text_sizes[f.name] = size
+
+        if self.checkpoint:
+            self._save_progress()
+
+    def close(self, keep_progress: bool = False) -> tuple:
+        """
+        Completa la cabecera del .npy y la configuración del proyector
+
+        Args:
+            keep_progress: Conserva el archivo de progreso para poder reanudar más tarde
+
+        Returns:
+            tuple: (tensor_file, metadata_file, config_file); si el contenido es idéntico a un
+                conjunto ya registrado, los de ese conjunto
+        """
+        self._npy.seek(0)
+        self._npy.write(npy_header((self.rows, self.dim)))
+        for f in self._files():
+            f.close()
+
+        projector_set = (self.tensor_file, self.metadata_file, (self.rows, self.dim))
+        if not keep_progress:
+            # Un conjunto interrumpido no se reduce ni se cuantiza hasta completarlo
+            projector_set = self.writer._finalize_set(self.tensor_file, self.metadata_file) or projector_set
+        self.writer._write_projector_config(self.config_file, *projector_set)
+
+        if keep_progress:
+            return self.writer._set_files(self.file_prefix)
+        if self.progress_file.exists():
+            self.progress_file.unlink()
+        files = self.writer._set_files(self.writer.register_set(self.file_prefix, self.info))
+        self.tensor_file, self.metadata_file, self.config_file = files
+        return files
+
+    def discard(self):
+        """Cierra y elimina los archivos del conjunto"""
+        for f in self._files():
+            f.close()
+        for path in (self.npy_file, self.tensor_file, self.tsv_file, self.metadata_file,
+                     self.config_file, self.progress_file):
+            if path.exists():
+                path.unlink()
+
+    def _save_progress(self):
+        """Registra las filas confirmadas y el tamaño de los archivos de texto"""
+        self.writer._save_progress(self.progress_file, {
+            'kind': 'stream',
+            'identity': self.checkpoint,
+            'info': self.info,
+            'dim': self.dim,
+            'rows': self.rows,
+            'metadata_bytes': self.metadata_file.stat().st_size,
+            'tsv_bytes': self.tsv_file.stat().st_size if self._tsv else None
+        })
+
+    def _files(self) -> list:
+        return [f for f in (self._npy, self._bytes, self._metadata, self._tsv) if f]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Aunque falle la extracción, las filas ya escritas quedan en un conjunto válido
+        # y, si hay progreso guardado, se puede reanudar
+        if not self._npy.closed:
+            self.close(keep_progress=exc_type is not None)
+        return False
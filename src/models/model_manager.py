@@ -1,115 +1,972 @@
 from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModel
 import torch
+import numpy as np
 import logging
+import hashlib
+import json
 from pathlib import Path
 import os
+import re
+import threading
+import time
 import tqdm
 
 from src.utils.config import Config
+from src.models.parallel_extractor import ParallelExtractor
+from src.models.embedding_cache import EmbeddingCache
+from src.models.corpus_accumulator import CorpusAccumulator
+from src.models.models import AVAILABLE_MODELS
+from src.models.model_registry import LoadedModel, ModelRegistry, module_size_bytes
+from src.utils.metrics import RunMetrics, profile_batches
 
 logger = logging.getLogger(__name__)
 
+
+def build_token_budget_batches(lengths: list[int], max_tokens: int, max_batch_size: int) -> list[list[int]]:
+    """
+    Agrupa entradas por longitud tokenizada y llena cada lote hasta el presupuesto de tokens
+
+    Args:
+        lengths: Longitud tokenizada de cada entrada
+        max_tokens: Máximo de tokens con padding (filas x longitud máxima) por lote
+        max_batch_size: Máximo de entradas por lote
+
+    Returns:
+        list: Lotes con los índices originales de cada entrada
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+
+    for idx in order:
+        # Al estar ordenadas, la entrada actual es la más larga del lote
+        padded_size = (len(current) + 1) * lengths[idx]
+        if current and (padded_size > max_tokens or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+        current.append(idx)
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def mean_pool(hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Media de los estados ocultos sobre los tokens reales (ignora el padding)"""
+    mask = attention_mask.unsqueeze(-1).to(hidden_state.dtype)
+    return (hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+
+def cls_pool(hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Estado oculto de la primera posición ([CLS] o <s>)"""
+    return hidden_state[:, 0]
+
+
+def max_pool(hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Máximo de cada dimensión sobre los tokens reales (ignora el padding)"""
+    padding = attention_mask.unsqueeze(-1) == 0
+    return hidden_state.masked_fill(padding, float('-inf')).max(dim=1).values
+
+
+POOLING_STRATEGIES = {
+    'mean': mean_pool,
+    'cls': cls_pool,
+    'max': max_pool
+}
+
+
+def bf16_supported() -> bool:
+    """Indica si la CPU tiene instrucciones bfloat16 que oneDNN pueda aprovechar"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def build_inference_model(model: torch.nn.Module, backend: str) -> torch.nn.Module:
+    """
+    Prepara el módulo que ejecuta la inferencia de un backend
+
+    El modelo fp32 original no se modifica: sigue sirviendo de referencia y para el modo estático.
+    """
+    if backend == 'int8':
+        # Cuantización dinámica: pesos de las capas Linear en int8, activaciones cuantizadas al vuelo
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'bf16':
+        if not bf16_supported():
+            raise RuntimeError("la CPU no soporta bfloat16")
+        # bf16 se aplica con autocast en cada forward pass
+        return model
+    if backend == 'compile':
+        return torch.compile(model)
+    return model
+
+
+def padding_stats(lengths: list[int], batches: list[list[int]], fixed_batch_size: int) -> dict:
+    """Calcula el padding de un plan de lotes frente a lotes fijos en orden de ID"""
+    real_tokens = sum(lengths)
+    processed = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+    fixed = sum(
+        len(chunk) * max(chunk)
+        for chunk in (lengths[i:i + fixed_batch_size] for i in range(0, len(lengths), fixed_batch_size))
+    )
+
+    return {
+        'batches': len(batches),
+        'real_tokens': real_tokens,
+        'processed_tokens': processed,
+        'padded_tokens': processed - real_tokens,
+        'padding_ratio': (processed - real_tokens) / processed if processed else 0.0,
+        'fixed_processed_tokens': fixed,
+        'saved_tokens': fixed - processed,
+        'saved_ratio': (fixed - processed) / fixed if fixed else 0.0
+    }
+
+
 class ModelManager:
     """Gestor de modelos de Hugging Face"""
     
-    AVAILABLE_MODELS = {
-        "sentence-transformers/all-MiniLM-L6-v2": "MiniLM-L6 - Modelo ligero (80MB) optimizado para embeddings",
-        "BAAI/bge-small-en-v1.5": "BGE-small - Modelo pequeño (120MB) con gran rendimiento",
-        "intfloat/multilingual-e5-small": "E5-small - Modelo multilingüe pequeño (140MB)",
-        "thenlper/gte-small": "GTE-small - General Text Embeddings pequeño (170MB)"
+    AVAILABLE_MODELS = AVAILABLE_MODELS
+
+    EXTRACTION_MODES = {
+        "contextual": "Contextual - Pasa cada token por el modelo completo",
+        "static": "Estático - Lee la matriz de embeddings de entrada (sin forward pass)"
+    }
+
+    BATCHING_MODES = {
+        "fixed": "Lotes de tamaño fijo en orden de ID",
+        "bucketed": "Lotes agrupados por longitud con presupuesto de tokens"
+    }
+
+    POOLING_MODES = {
+        "mean": "Media - Promedio de los tokens reales (sin padding)",
+        "cls": "CLS - Estado de la primera posición",
+        "max": "Máximo - Máximo de cada dimensión sobre los tokens reales"
+    }
+
+    INFERENCE_BACKENDS = {
+        "fp32": "FP32 - Precisión completa en modo eager",
+        "int8": "INT8 dinámico - Capas Linear cuantizadas a int8",
+        "bf16": "BF16 - Autocast a bfloat16 (requiere soporte de la CPU)",
+        "compile": "torch.compile - Grafo compilado con Inductor"
     }
     
     def __init__(self, config: Config = None):
         self.config = config or Config()
         self.model = None
+        self.model_name = None
         self.tokenizer = None
+        self.model_revision = None
+        self.inference_backend = 'fp32'
+        self.inference_model = None
+        self.backend_report = None
+        self.last_batching_stats = None
+        self.metrics = RunMetrics()
+        self.cache = EmbeddingCache.from_config(self.config)
+        self.registry = ModelRegistry(self.config, self._load_from_disk)
         self.downloads_dir = Path(__file__).parent / "downloads"
         self.downloads_dir.mkdir(exist_ok=True)
         
-    def load_model(self, model_name: str = None) -> bool:
-        """Carga el modelo y el tokenizer"""
+    def load_model(self, model_name: str = None, backend: str = None, verify: bool = None) -> bool:
+        """
+        Carga el modelo y el tokenizer
+
+        Args:
+            model_name: Modelo de Hugging Face (por defecto, el de config.json)
+            backend: Backend de inferencia (por defecto, inference.backend de config.json)
+            verify: Compara el backend con fp32 al cargar (por defecto, inference.verify)
+        """
         try:
             model_name = model_name or self.config.get_default_model()
-            
-            logger.info(f"Descargando modelo {model_name}...")
-            
-            cache_dir = str(self.downloads_dir / model_name.split('/')[-1])
-            
-            logger.info("Inicializando tokenizer...")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                model_name,
-                cache_dir=cache_dir
-            )
-            
-            logger.info("Cargando modelo...")
-            self.model = AutoModel.from_pretrained(
-                model_name,
-                cache_dir=cache_dir,
-                torch_dtype=torch.float32
-            )
-            
-            logger.info("✅ Modelo cargado correctamente")
+            backend = backend or self.config.get('inference.backend', 'fp32')
+            if backend not in self.INFERENCE_BACKENDS:
+                raise ValueError(f"Backend de inferencia desconocido: {backend}")
+
+            if self.registry.is_loaded(model_name, backend):
+                logger.info(f"Modelo {model_name} ya cargado en memoria")
+            entry = self.registry.get(model_name, backend)
+            self._activate(entry)
+
+            if verify is None:
+                verify = self.config.get('inference.verify', True)
+            if not entry.verified:
+                self._verify_entry(entry, verify)
             return True
-            
+
         except Exception as e:
             logger.error(f"❌ Error al cargar el modelo: {str(e)}")
             return False
 
+    def preload_model(self, model_name: str = None, backend: str = None):
+        """
+        Carga un modelo en segundo plano para que load_model lo encuentre ya en memoria
+
+        Returns:
+            threading.Thread: Hilo de la carga
+        """
+        return self.registry.preload(
+            model_name or self.config.get_default_model(),
+            backend or self.config.get('inference.backend', 'fp32')
+        )
+
     def get_embedding(self, text: str) -> torch.Tensor:
         """Obtiene el embedding de un texto usando el modelo cargado"""
+        return torch.from_numpy(self.encode_batch([text])[0])
+
+    def encode_query(self, text: str, entry: dict = None) -> np.ndarray:
+        """
+        Codifica un texto libre del mismo modo que se extrajo un conjunto guardado
+
+        En los conjuntos estáticos es la media de los vectores de entrada de sus tokens (la misma
+        lectura que la extracción, con su posición y LayerNorm), en las vistas la capa y el pooling
+        de la vista y en el resto la media de la última capa (get_embedding).
+
+        Args:
+            text: Texto a codificar
+            entry: Entrada del manifiesto del conjunto (mode, view...); sin ella, get_embedding
+
+        Raises:
+            ValueError: Si el conjunto no admite textos libres (conjuntos de corpus)
+        """
         if not self.model or not self.tokenizer:
             raise RuntimeError("No hay ningún modelo cargado")
-            
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=512
+
+        entry = entry or {}
+        mode = entry.get('mode')
+        if mode == 'corpus':
+            raise ValueError(
+                "Los conjuntos de corpus son medias de cada token en contexto y no admiten textos libres; consulta un token"
+            )
+
+        if mode == 'static':
+            options = self.resolve_extraction_options(
+                'static', include_position=entry.get('include_position'), include_layernorm=entry.get('include_layernorm')
+            )
+            input_ids = self.tokenizer(text, add_special_tokens=False, truncation=True, max_length=512)['input_ids']
+            if not input_ids:
+                raise ValueError(f"El texto '{text}' no tiene tokens")
+            lookup = self._static_lookup(options['include_position'], options['include_layernorm'])
+            with torch.no_grad():
+                return lookup(torch.tensor(input_ids)).mean(dim=0).numpy()
+
+        view = entry.get('view')
+        if view and view != 'static':
+            match = re.fullmatch(r'layer(\d+)_(\w+)', view)
+            if not match or match.group(2) not in POOLING_STRATEGIES:
+                raise ValueError(f"Vista desconocida: {view}")
+            [view] = self._resolve_views([int(match.group(1))], [match.group(2)])
+            input_ids = self.tokenizer(text, truncation=True, max_length=512)['input_ids']
+            return self.embed_vocabulary_batch([input_ids], [text], [view])[view[0]][0].numpy()
+
+        return self.get_embedding(text).numpy()
+
+    def encode_batch(self, texts: list[str], batch_size: int = None) -> np.ndarray:
+        """
+        Obtiene los embeddings de varios textos con un forward pass por lote
+
+        Args:
+            texts: Lista de textos
+            batch_size: Máximo de textos por forward pass (por defecto, todos a la vez)
+
+        Returns:
+            np.ndarray: Matriz float32 contigua de forma (len(texts), dim)
+        """
+        if not self.model or not self.tokenizer:
+            raise RuntimeError("No hay ningún modelo cargado")
+
+        embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype=np.float32)
+        missing = list(range(len(texts)))
+
+        if self.cache:
+            keys = [self._cache_key(text) for text in texts]
+            with self.metrics.stage('cache'):
+                cached = self.cache.get_many(keys)
+            missing = []
+            for i, key in enumerate(keys):
+                if key in cached:
+                    embeddings[i] = cached[key]
+                else:
+                    missing.append(i)
+
+        batch_size = batch_size or len(missing) or 1
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            with self.metrics.stage('tokenization'):
+                inputs = self.tokenizer(
+                    [texts[i] for i in batch],
+                    return_tensors="pt",
+                    padding=True,
+                    truncation=True,
+                    max_length=512
+                )
+
+            # Mean pooling sobre la última capa oculta, ignorando el padding
+            hidden_state = self._forward(inputs)
+            with self.metrics.stage('pooling'):
+                pooled = mean_pool(hidden_state, inputs['attention_mask'])
+
+            with self.metrics.stage('host_copy'):
+                embeddings[batch] = pooled.numpy()
+            if self.cache:
+                with self.metrics.stage('cache'):
+                    self.cache.put_many({keys[i]: embeddings[i] for i in batch})
+
+        self.metrics.add('rows', len(texts))
+        return embeddings
+
+    def extract_vocabulary_embeddings(self, mode: str = None, **options) -> tuple[torch.Tensor, list[str]]:
+        """
+        Extrae embeddings para todo el vocabulario del modelo en una matriz en memoria
+
+        Para vocabularios grandes es preferible consumir iter_vocabulary_embeddings
+        directamente con EmbeddingWriter.save_stream.
+
+        Args:
+            mode: 'contextual' (forward pass por token) o 'static' (matriz de embeddings de entrada)
+            **options: Opciones de iter_vocabulary_embeddings
+
+        Returns:
+            tuple: (embeddings_matrix, vocab_words) en el orden original de los IDs; si se
+                piden varias vistas (capas x pooling), embeddings_matrix es un dict {vista: matriz}
+        """
+        vocab_words = self.get_vocabulary_words()
+        dim = self.get_embedding_dim(mode)
+        views = self.extraction_views(mode, options.get('layers'), options.get('pooling'))
+        if len(views) > 1:
+            embeddings_matrix = {name: torch.empty(len(vocab_words), dim) for name, _, _ in views}
+        else:
+            embeddings_matrix = torch.empty(len(vocab_words), dim)
+
+        for rows, embeddings in self.iter_vocabulary_embeddings(mode, **options):
+            if isinstance(embeddings, dict):
+                for name, view_embeddings in embeddings.items():
+                    embeddings_matrix[name][rows] = view_embeddings
+            else:
+                embeddings_matrix[rows] = embeddings
+
+        return embeddings_matrix, vocab_words
+
+    def extract_static_embeddings(self, include_position: bool = None,
+                                  include_layernorm: bool = None) -> tuple[torch.Tensor, list[str]]:
+        """
+        Lee los embeddings del vocabulario directamente de la matriz de entrada del modelo
+
+        Args:
+            include_position: Suma el embedding de la primera posición (y del tipo de token 0)
+            include_layernorm: Aplica la LayerNorm de la capa de embeddings
+
+        Returns:
+            tuple: (embeddings_matrix, vocab_words) en el orden original de los IDs
+        """
+        return self.extract_vocabulary_embeddings(
+            'static',
+            include_position=include_position,
+            include_layernorm=include_layernorm
         )
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # Usamos mean pooling sobre la última capa oculta
-            embeddings = torch.mean(outputs.last_hidden_state, dim=1)
-            
-        return embeddings.squeeze()
-
-    def extract_vocabulary_embeddings(self) -> tuple[torch.Tensor, list[str]]:
-        """Extrae embeddings para todo el vocabulario del modelo"""
+
+    def iter_vocabulary_embeddings(self, mode: str = None, batching: str = None, batch_size: int = None,
+                                   max_tokens: int = None, include_position: bool = None,
+                                   include_layernorm: bool = None, layers: list = None,
+                                   pooling: list = None, start_batch: int = 0):
+        """
+        Genera los embeddings del vocabulario lote a lote
+
+        Args:
+            mode: 'contextual' (forward pass por token) o 'static' (matriz de embeddings de entrada)
+            batching: 'fixed' (lotes de tamaño fijo en orden de ID) o 'bucketed'
+                (lotes agrupados por longitud tokenizada y limitados por presupuesto de tokens)
+            batch_size: Número máximo de entradas por lote
+            max_tokens: Presupuesto de tokens (filas x longitud con padding) por lote en modo 'bucketed'
+            include_position: En modo 'static', suma el embedding de la primera posición
+            include_layernorm: En modo 'static', aplica la LayerNorm de la capa de embeddings
+            layers: En modo 'contextual', capas ocultas a extraer (0 es la salida de la capa de
+                embeddings, -1 la última)
+            pooling: En modo 'contextual', estrategias de pooling ('mean', 'cls', 'max')
+            start_batch: Primer lote a procesar (para reanudar una extracción interrumpida)
+
+        Yields:
+            tuple: (rows, embeddings) con las posiciones de cada fila en el vocabulario
+                ordenado por ID y un tensor float32 de forma (len(rows), dim). Si se piden
+                varias vistas (capas x pooling), embeddings es un dict {vista: tensor}
+                calculado con un solo forward pass por lote (ver extraction_views)
+        """
         if not self.model or not self.tokenizer:
             raise RuntimeError("No hay ningún modelo cargado")
-        
+
+        options = self.resolve_extraction_options(
+            mode, batching, batch_size, max_tokens, include_position, include_layernorm, layers, pooling
+        )
+
+        if options['mode'] == 'static':
+            yield from self._iter_static_embeddings(
+                options['include_position'], options['include_layernorm'], options['batch_size'], start_batch
+            )
+        else:
+            yield from self._iter_contextual_embeddings(
+                options['batching'], options['batch_size'], options['max_tokens'], start_batch,
+                self._resolve_views(options['layers'], options['pooling'])
+            )
+
+    def extraction_views(self, mode: str = None, layers: list = None, pooling: list = None) -> list:
+        """
+        Vistas (capa x pooling) que produce una extracción del vocabulario
+
+        Returns:
+            list: Tuplas (nombre, capa, pooling), p. ej. ('layer6_cls', 6, 'cls'); en modo
+                'static' hay una sola vista, la matriz de embeddings de entrada
+        """
+        options = self.resolve_extraction_options(mode, layers=layers, pooling=pooling)
+        if options['mode'] == 'static':
+            return [('static', 0, None)]
+        return self._resolve_views(options['layers'], options['pooling'])
+
+    def resolve_extraction_options(self, mode: str = None, batching: str = None, batch_size: int = None,
+                                   max_tokens: int = None, include_position: bool = None,
+                                   include_layernorm: bool = None, layers: list = None,
+                                   pooling: list = None) -> dict:
+        """Completa las opciones de extracción del vocabulario con los valores de config.json"""
+        mode = mode or self.config.get('extraction.mode', 'contextual')
+        if mode not in self.EXTRACTION_MODES:
+            raise ValueError(f"Modo de extracción desconocido: {mode}")
+
+        if mode == 'static':
+            return {
+                'mode': mode,
+                'batch_size': batch_size or self.config.get('extraction.static_chunk_size', 8192),
+                'include_position': bool(
+                    self.config.get('extraction.static_position', False)
+                    if include_position is None else include_position
+                ),
+                'include_layernorm': bool(
+                    self.config.get('extraction.static_layernorm', False)
+                    if include_layernorm is None else include_layernorm
+                )
+            }
+
+        batching = batching or self.config.get('extraction.batching', 'fixed')
+        if batching not in self.BATCHING_MODES:
+            raise ValueError(f"Modo de batching desconocido: {batching}")
+
+        pooling = list(pooling or self.config.get('extraction.pooling', ['mean']))
+        unknown = [name for name in pooling if name not in POOLING_STRATEGIES]
+        if unknown:
+            raise ValueError(f"Estrategia de pooling desconocida: {', '.join(unknown)}")
+
+        return {
+            'mode': mode,
+            'batching': batching,
+            'batch_size': batch_size or self.config.get('extraction.batch_size', 64),
+            'max_tokens': max_tokens or self.config.get('extraction.max_tokens', 8192),
+            'layers': list(layers or self.config.get('extraction.layers', [-1])),
+            'pooling': pooling
+        }
+
+    def vocabulary_fingerprint(self, mode: str = None, **options) -> str:
+        """
+        Huella de la entrada de una extracción del vocabulario
+
+        Combina el vocabulario y las opciones que determinan el reparto en lotes, de modo
+        que una extracción solo se reanuda si los lotes pendientes son los mismos.
+        """
+        resolved = self.resolve_extraction_options(mode, **options)
+        digest = hashlib.sha256(json.dumps(resolved, sort_keys=True).encode('utf-8'))
+        for word in self.get_vocabulary_words():
+            digest.update(word.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def get_vocabulary_words(self) -> list[str]:
+        """Devuelve los tokens del vocabulario ordenados por ID"""
+        if not self.tokenizer:
+            raise RuntimeError("No hay ningún modelo cargado")
+        return [word for word, _ in self._sorted_vocabulary()]
+
+    def get_embedding_dim(self, mode: str = None) -> int:
+        """Devuelve la dimensión de los embeddings que produce el modo de extracción"""
+        if not self.model:
+            raise RuntimeError("No hay ningún modelo cargado")
+
+        mode = mode or self.config.get('extraction.mode', 'contextual')
+        if mode == 'static':
+            return self.model.get_input_embeddings().weight.shape[1]
+        return self.model.config.hidden_size
+
+    def plan_vocabulary_batches(self, batching: str = None, batch_size: int = None,
+                                max_tokens: int = None) -> tuple[list[list[int]], list[list[int]]]:
+        """
+        Tokeniza todo el vocabulario una sola vez y lo reparte en lotes
+
+        Returns:
+            tuple: (batches, encoded) con las posiciones de cada lote y los input_ids de cada token
+        """
+        options = self.resolve_extraction_options('contextual', batching, batch_size, max_tokens)
+        batching, batch_size, max_tokens = options['batching'], options['batch_size'], options['max_tokens']
+
+        vocab_words = self.get_vocabulary_words()
+
+        # Tokenizar todo el vocabulario una sola vez
+        with self.metrics.stage('tokenization'):
+            encoded = self.tokenizer(vocab_words, truncation=True)['input_ids']
+        lengths = [len(ids) for ids in encoded]
+
+        if batching == 'bucketed':
+            batches = build_token_budget_batches(lengths, max_tokens, batch_size)
+        else:
+            batches = [list(range(i, min(i + batch_size, len(lengths))))
+                       for i in range(0, len(lengths), batch_size)]
+
+        self.last_batching_stats = padding_stats(lengths, batches, batch_size)
+        self.last_batching_stats['batching'] = batching
+        self.last_batching_stats['batch_size'] = batch_size
+
+        return batches, encoded
+
+    def embed_token_ids(self, input_ids: list[list[int]], views: list = None):
+        """
+        Rellena un lote de secuencias ya tokenizadas y lo pasa por el modelo
+
+        Args:
+            input_ids: Secuencias tokenizadas
+            views: Vistas (nombre, capa, pooling) de extraction_views; por defecto, la media
+                de la última capa
+
+        Returns:
+            torch.Tensor, o dict {vista: tensor} si se indican views
+        """
+        with self.metrics.stage('tokenization'):
+            inputs = self.tokenizer.pad({'input_ids': input_ids}, return_tensors="pt")
+        mask = inputs['attention_mask']
+
+        if views is None:
+            # Mean pooling sobre la última capa oculta, ignorando el padding para que
+            # el vector de cada token no dependa del resto del lote
+            hidden_state = self._forward(inputs)
+            with self.metrics.stage('pooling'):
+                return mean_pool(hidden_state, mask)
+
+        # Todas las vistas salen del mismo forward pass
+        hidden_states = self._forward(inputs, layers=sorted({layer for _, layer, _ in views}))
+        with self.metrics.stage('pooling'):
+            return {
+                name: POOLING_STRATEGIES[pooling](hidden_states[layer], mask)
+                for name, layer, pooling in views
+            }
+
+    def verify_backend(self, sample_size: int = None, batch_size: int = 64) -> dict:
+        """
+        Compara el backend de inferencia activo con fp32 sobre una muestra del vocabulario
+
+        Ambos se ejecutan sobre los mismos lotes (tras una pasada de calentamiento, que
+        en torch.compile incluye la compilación) y se mide el tiempo de cada uno.
+
+        Returns:
+            dict: Concordancia coseno (media y mínima) con fp32, tiempos y aceleración
+        """
+        sample_size = sample_size or self.config.get('inference.verify_samples', 256)
+        vocab_words = self.get_vocabulary_words()
+        rng = np.random.default_rng(0)
+        sample_rows = rng.choice(len(vocab_words), min(sample_size, len(vocab_words)), replace=False)
+        sample = [vocab_words[i] for i in sample_rows]
+        batches = [
+            self.tokenizer(sample[start:start + batch_size], return_tensors="pt", padding=True,
+                           truncation=True, max_length=512)
+            for start in range(0, len(sample), batch_size)
+        ]
+
+        def run(model, backend):
+            self._forward(batches[0], model, backend)
+            started = time.perf_counter()
+            pooled = torch.cat([
+                mean_pool(self._forward(inputs, model, backend), inputs['attention_mask'])
+                for inputs in batches
+            ])
+            return pooled, time.perf_counter() - started
+
+        reference, reference_time = run(self.model, 'fp32')
+        candidate, candidate_time = run(self.inference_model, self.inference_backend)
+        agreement = torch.nn.functional.cosine_similarity(reference, candidate, dim=1)
+
+        return {
+            'backend': self.inference_backend,
+            'samples': len(sample),
+            'cosine_mean': agreement.mean().item(),
+            'cosine_min': agreement.min().item(),
+            'fp32_seconds': reference_time,
+            'backend_seconds': candidate_time,
+            'speedup': reference_time / candidate_time if candidate_time else 0.0
+        }
+
+    def embed_vocabulary_batch(self, input_ids: list[list[int]], tokens: list[str], views: list = None):
+        """Como embed_token_ids, pero reutiliza de la caché los tokens ya calculados"""
+        self.metrics.add('rows', len(tokens))
+        if not self.cache:
+            return self.embed_token_ids(input_ids, views)
+
+        # Cada vista tiene sus propias entradas en la caché
+        keys = {
+            view: [self._cache_key(token, self._view_cache_pooling(view)) for token in tokens]
+            for view in (views or [None])
+        }
+        with self.metrics.stage('cache'):
+            cached = self.cache.get_many([key for view_keys in keys.values() for key in view_keys])
+        # Un token se recalcula si le falta alguna de sus vistas
+        missing = [i for i in range(len(tokens)) if any(view_keys[i] not in cached for view_keys in keys.values())]
+        computed = self.embed_token_ids([input_ids[i] for i in missing], views) if missing else None
+
+        results = {}
+        for view, view_keys in keys.items():
+            embeddings = torch.empty(len(tokens), self.model.config.hidden_size)
+            for i, key in enumerate(view_keys):
+                if key in cached:
+                    embeddings[i] = torch.from_numpy(cached[key])
+
+            if missing:
+                view_computed = computed if view is None else computed[view[0]]
+                embeddings[missing] = view_computed
+                with self.metrics.stage('cache'):
+                    self.cache.put_many({view_keys[i]: vector for i, vector in zip(missing, view_computed.numpy())})
+            results[view] = embeddings
+
+        if views is None:
+            return results[None]
+        return {view[0]: embeddings for view, embeddings in results.items()}
+
+    def accumulate_corpus_embeddings(self, batches, layer: int = None, include_special: bool = None,
+                                     variance: bool = None) -> CorpusAccumulator:
+        """
+        Pasa un corpus por el modelo y acumula el vector contextual de cada aparición de cada token
+
+        Los vectores no se guardan por aparición: se suman por ID del vocabulario en un
+        CorpusAccumulator preasignado, que da la media de cada token sobre el corpus.
+
+        Args:
+            batches: Iterable de lotes de textos (p. ej. líneas leídas en streaming)
+            layer: Capa oculta de la que se toman los vectores (por defecto corpus.layer; -1 es la última)
+            include_special: Acumula también los tokens especiales ([CLS], [SEP]...)
+            variance: Acumula también la suma de cuadrados para obtener la varianza por token
+
+        Returns:
+            CorpusAccumulator: Sumas y recuentos por ID
+        """
+        if not self.model or not self.tokenizer:
+            raise RuntimeError("No hay ningún modelo cargado")
+
+        layer = self.config.get('corpus.layer', -1) if layer is None else layer
+        if include_special is None:
+            include_special = self.config.get('corpus.include_special', False)
+        if variance is None:
+            variance = self.config.get('corpus.variance', False)
+
+        [(_, layer_index, _)] = self._resolve_views([layer], ['mean'])
+        last_layer = layer_index == self.model.config.num_hidden_layers
+        vocab_size = max(self.tokenizer.get_vocab().values()) + 1
+        accumulator = CorpusAccumulator(vocab_size, self.model.config.hidden_size, variance)
+        special_ids = torch.tensor(sorted(self.tokenizer.all_special_ids))
+
+        logger.info("Acumulando embeddings contextuales del corpus...")
+        for texts in tqdm.tqdm(batches, unit=" lotes"):
+            with self.metrics.stage('tokenization'):
+                inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+
+            if last_layer:
+                hidden_state = self._forward(inputs)
+            else:
+                hidden_state = self._forward(inputs, layers=[layer_index])[layer_index]
+
+            with self.metrics.stage('aggregation'):
+                # Solo las posiciones reales (sin padding) y, si se pide, sin tokens especiales
+                keep = inputs['attention_mask'].bool()
+                if not include_special:
+                    keep &= ~torch.isin(inputs['input_ids'], special_ids)
+                accumulator.add(inputs['input_ids'][keep], hidden_state[keep])
+
+            self.metrics.add('rows', len(texts))
+            self.metrics.add('occurrences', int(keep.sum()))
+
+        return accumulator
+
+    def log_cache_stats(self):
+        """Muestra los contadores de la caché de embeddings"""
+        if not self.cache:
+            return
+        stats = self.cache.stats()
+        logger.info(
+            f"Caché de embeddings: {stats['hits']} aciertos, {stats['misses']} fallos "
+            f"({stats['hit_rate']:.1%} de aciertos), {stats['entries']} entradas, "
+            f"{stats['size_bytes'] / 1024 / 1024:.1f} MB"
+        )
+
+    def _iter_contextual_embeddings(self, batching: str, batch_size: int, max_tokens: int, start_batch: int = 0,
+                                    views: list = None):
+        """Pasa el vocabulario por el modelo y genera (rows, embeddings) por lote"""
         logger.info("Extrayendo embeddings del vocabulario completo...")
-        
-        # Obtener todo el vocabulario
-        vocab = self.tokenizer.get_vocab()
-        vocab_tokens = sorted(vocab.items(), key=lambda x: x[1])  # Ordenar por ID
-        vocab_words = [word for word, _ in vocab_tokens]
-        
-        # Procesar en lotes para eficiencia
-        batch_size = 64
-        all_embeddings = []
-        
-        for i in tqdm.tqdm(range(0, len(vocab_words), batch_size)):
-            batch_tokens = vocab_words[i:i + batch_size]
-            inputs = self.tokenizer(
-                batch_tokens,
-                padding=True,
-                truncation=True,
-                return_tensors="pt"
+
+        batches, encoded = self.plan_vocabulary_batches(batching, batch_size, max_tokens)
+        vocab_words = self.get_vocabulary_words()
+        if start_batch:
+            logger.info(f"Reanudando desde el lote {start_batch + 1} de {len(batches)}...")
+
+        views = views or self._resolve_views([-1], ['mean'])
+        single_view = views[0][0] if len(views) == 1 else None
+        if views == self._resolve_views([-1], ['mean']):
+            # La media de la última capa no necesita output_hidden_states
+            views = None
+        else:
+            logger.info(f"Vistas por forward pass: {', '.join(name for name, _, _ in views)}")
+        tasks = (
+            (batch_ids, [encoded[i] for i in batch_ids], [vocab_words[i] for i in batch_ids], views)
+            for batch_ids in batches[start_batch:]
+        )
+
+        if ParallelExtractor.is_enabled(self.config):
+            # Las posiciones de cada fila viajan con el lote, así que el orden se conserva
+            extractor = ParallelExtractor(self.config, self.model_name, backend=self.inference_backend)
+            results = extractor.iter_vocabulary(tasks, self.cache, self.metrics)
+        else:
+            results = (
+                (batch_ids, self.embed_vocabulary_batch(input_ids, tokens, views))
+                for batch_ids, input_ids, tokens, views in tasks
             )
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                # Usamos mean pooling sobre la última capa oculta
-                embeddings = torch.mean(outputs.last_hidden_state, dim=1)
-                all_embeddings.append(embeddings)
-        
-        # Concatenar todos los embeddings
-        embeddings_matrix = torch.cat(all_embeddings, dim=0)
-        
-        return embeddings_matrix, vocab_words
+            if self.config.get('metrics.profile', False):
+                # El perfilador solo ve el proceso actual, así que no se usa con procesos de trabajo
+                results = profile_batches(
+                    results,
+                    self.config.get('metrics.profile_batches', 5),
+                    Path(self.config.get_output_dir()) / "profile_trace.json"
+                )
+
+        for batch_ids, embeddings in tqdm.tqdm(results, total=len(batches), initial=start_batch):
+            if views is not None and single_view:
+                # Con una sola vista se genera el tensor directamente, como con la vista por defecto
+                embeddings = embeddings[single_view]
+            # Las filas indican la posición original (orden de ID) de cada entrada
+            yield batch_ids, embeddings
+
+        stats = self.last_batching_stats
+        logger.info(
+            f"Padding: {stats['padded_tokens']} tokens de relleno "
+            f"({stats['padding_ratio']:.1%} del total procesado) en {stats['batches']} lotes"
+        )
+        if stats['batching'] == 'bucketed':
+            logger.info(
+                f"Ahorro frente a lotes fijos de {stats['batch_size']}: "
+                f"{stats['saved_tokens']} tokens ({stats['saved_ratio']:.1%} menos cómputo)"
+            )
+        self.log_cache_stats()
+
+    def _iter_static_embeddings(self, include_position: bool, include_layernorm: bool, chunk_size: int,
+                                start_batch: int = 0):
+        """Lee la matriz de embeddings de entrada y genera (rows, embeddings) por bloques"""
+        logger.info("Leyendo la matriz de embeddings de entrada...")
+
+        vocab_ids = torch.tensor([idx for _, idx in self._sorted_vocabulary()])
+        lookup = self._static_lookup(include_position, include_layernorm)
+
+        for start in tqdm.tqdm(range(start_batch * chunk_size, len(vocab_ids), chunk_size)):
+            rows = list(range(start, min(start + chunk_size, len(vocab_ids))))
+            self.metrics.add('rows', len(rows))
+
+            with self.metrics.stage('lookup'), torch.no_grad():
+                embeddings = lookup(vocab_ids[rows])
+
+            yield rows, embeddings
+
+    def _static_lookup(self, include_position: bool, include_layernorm: bool):
+        """Función que lee de la matriz de embeddings de entrada los vectores de unos IDs"""
+        weight = self.model.get_input_embeddings().weight
+        embeddings_layer = getattr(self.model, 'embeddings', None)
+        offset = None
+        layer_norm = None
+
+        if include_position:
+            position = getattr(embeddings_layer, 'position_embeddings', None)
+            token_type = getattr(embeddings_layer, 'token_type_embeddings', None)
+            if position is None:
+                logger.warning("⚠️ El modelo no tiene embeddings de posición absolutos, se omiten")
+            else:
+                # Los modelos tipo RoBERTa empiezan a contar posiciones tras padding_idx
+                padding_idx = getattr(embeddings_layer, 'padding_idx', None)
+                first_position = padding_idx + 1 if padding_idx is not None else 0
+                offset = position.weight[first_position].detach().float()
+            if token_type is not None:
+                token_type_offset = token_type.weight[0].detach().float()
+                offset = token_type_offset if offset is None else offset + token_type_offset
+
+        if include_layernorm:
+            layer_norm = getattr(embeddings_layer, 'LayerNorm', None)
+            if layer_norm is None:
+                logger.warning("⚠️ El modelo no tiene LayerNorm en la capa de embeddings, se omite")
+
+        def lookup(ids: torch.Tensor) -> torch.Tensor:
+            embeddings = weight[ids].float()
+            if offset is not None:
+                embeddings += offset
+            if layer_norm is not None:
+                embeddings = layer_norm(embeddings)
+            return embeddings
+
+        return lookup
+
+    def _resolve_views(self, layers: list, pooling: list) -> list:
+        """Combina capas y estrategias de pooling en vistas (nombre, capa absoluta, pooling)"""
+        num_layers = self.model.config.num_hidden_layers
+        views = []
+        for layer in layers:
+            # hidden_states tiene num_layers + 1 entradas: la capa de embeddings y cada capa oculta
+            index = layer if layer >= 0 else num_layers + 1 + layer
+            if not 0 <= index <= num_layers:
+                raise ValueError(f"Capa {layer} fuera de rango (el modelo tiene {num_layers} capas ocultas)")
+            for name in pooling:
+                view = (f"layer{index}_{name}", index, name)
+                if view not in views:
+                    views.append(view)
+        return views
+
+    def is_default_view(self, view: tuple) -> bool:
+        """Indica si una vista es la de por defecto (media de la última capa), la de encode_batch"""
+        _, layer, pooling = view
+        return layer == self.model.config.num_hidden_layers and pooling == 'mean'
+
+    def _view_cache_pooling(self, view: tuple) -> str:
+        """Modo de pooling de una vista en las claves de caché ('mean' para la vista por defecto)"""
+        if view is None or self.is_default_view(view):
+            return 'mean'
+        _, layer, pooling = view
+        return f"{pooling}@{layer}"
+
+    def _cache_key(self, text: str, pooling: str = 'mean') -> str:
+        """Clave de caché de un texto para el modelo, la revisión y el backend cargados"""
+        if self.inference_backend != 'fp32':
+            # Los backends aproximados no comparten entradas con fp32
+            pooling = f"{pooling}+{self.inference_backend}"
+        return EmbeddingCache.make_key(self.model_name, self.model_revision, pooling, text)
+
+    def _forward(self, inputs, model: torch.nn.Module = None, backend: str = None, layers: list = None):
+        """
+        Forward pass con el backend de inferencia
+
+        Returns:
+            torch.Tensor: Última capa oculta en float32, o dict {capa: estado oculto float32}
+                si se indican layers (índices de hidden_states)
+        """
+        if model is None:
+            model = self.model if self.inference_model is None else self.inference_model
+        backend = backend or self.inference_backend
+        with self.metrics.stage('forward'), torch.no_grad(), \
+                torch.autocast('cpu', dtype=torch.bfloat16, enabled=backend == 'bf16'):
+            outputs = model(**inputs, output_hidden_states=layers is not None)
+
+        mask = inputs['attention_mask']
+        self.metrics.add('batches')
+        self.metrics.add('tokens', int(mask.sum()))
+        self.metrics.add('processed_tokens', mask.numel())
+        if layers is not None:
+            return {layer: outputs.hidden_states[layer].float() for layer in layers}
+        return outputs.last_hidden_state.float()
+
+    def _load_from_disk(self, model_name: str, backend: str) -> LoadedModel:
+        """
+        Carga un modelo y su tokenizer desde disco (o el Hub) y prepara su backend
+
+        Puede ejecutarse en un hilo en segundo plano, así que no modifica el estado
+        del gestor: el modelo se activa después con _activate.
+        """
+        # Una precarga en segundo plano no debe escribir sobre el menú
+        log = logger.info if threading.current_thread() is threading.main_thread() else logger.debug
+        log(f"Descargando modelo {model_name}...")
+
+        cache_dir = str(self.downloads_dir / model_name.split('/')[-1])
+
+        log("Inicializando tokenizer...")
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_name,
+            cache_dir=cache_dir
+        )
+
+        log("Cargando modelo...")
+        model = AutoModel.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            torch_dtype=torch.float32
+        )
+
+        inference_model = model
+        if backend != 'fp32':
+            try:
+                inference_model = build_inference_model(model, backend)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo activar el backend {backend} ({str(e)}); se usa fp32")
+                backend = 'fp32'
+
+        log(f"✅ Modelo {model_name} cargado correctamente")
+        return LoadedModel(
+            model_name, tokenizer, model, self._resolve_revision(model, model_name), backend, inference_model
+        )
+
+    def _activate(self, entry: LoadedModel):
+        """Convierte un modelo del registro en el modelo activo"""
+        self.model = entry.model
+        self.tokenizer = entry.tokenizer
+        self.model_name = entry.name
+        self.model_revision = entry.revision
+        self.inference_model = entry.inference_model
+        self.inference_backend = entry.backend
+        self.backend_report = entry.backend_report
+
+    def _verify_entry(self, entry: LoadedModel, verify: bool):
+        """
+        Comprueba una sola vez que el backend del modelo activo concuerda con fp32
+
+        Si la concordancia no llega a inference.min_agreement o el backend falla,
+        el modelo queda registrado con fp32.
+        """
+        entry.verified = True
+        if not verify:
+            logger.info(f"Backend de inferencia: {entry.backend} (sin verificar)")
+            return
+
+        try:
+            report = self.verify_backend()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo activar el backend {entry.backend} ({str(e)}); se usa fp32")
+            report = None
+
+        if report:
+            entry.backend_report = report
+            logger.info(
+                f"🔎 Backend {entry.backend}: concordancia coseno con fp32 {report['cosine_mean']:.5f} "
+                f"(mínima {report['cosine_min']:.5f}) en {report['samples']} tokens, "
+                f"aceleración {report['speedup']:.2f}x"
+            )
+            min_agreement = self.config.get('inference.min_agreement', 0.99)
+            if report['cosine_mean'] >= min_agreement:
+                self._activate(entry)
+                return
+            logger.warning(f"⚠️ La concordancia media es inferior a {min_agreement}; se usa fp32")
+
+        entry.backend = 'fp32'
+        entry.inference_model = entry.model
+        entry.size_bytes = module_size_bytes(entry.model)
+        self._activate(entry)
+
+    def _resolve_revision(self, model: torch.nn.Module, model_name: str) -> str:
+        """Identifica la revisión del modelo (commit del Hub o fecha de los archivos locales)"""
+        commit_hash = getattr(model.config, '_commit_hash', None)
+        if commit_hash:
+            return commit_hash
+
+        model_path = Path(model_name)
+        if model_path.is_dir():
+            latest = max((f.stat().st_mtime for f in model_path.iterdir() if f.is_file()), default=0)
+            return f"local-{int(latest)}"
+
+        return "unknown"
+
+    def _sorted_vocabulary(self) -> list[tuple[str, int]]:
+        """Devuelve el vocabulario como pares (token, id) ordenados por ID"""
+        vocab = self.tokenizer.get_vocab()
+        return sorted(vocab.items(), key=lambda x: x[1])
 
     def list_available_models(self):
         """Lista los modelos disponibles con sus descripciones"""
@@ -0,0 +1,121 @@
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def module_size_bytes(module) -> int:
+    """Tamaño aproximado en memoria de los parámetros y buffers de un módulo"""
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for tensor in itertools.chain(module.parameters(), module.buffers())
+    )
+
+
+class LoadedModel:
+    """Modelo cargado en el registro, con su tokenizer y su módulo de inferencia"""
+
+    def __init__(self, name: str, tokenizer, model, revision: str, backend: str, inference_model):
+        self.name = name
+        self.tokenizer = tokenizer
+        self.model = model
+        self.revision = revision
+        self.backend = backend
+        self.inference_model = inference_model
+        self.backend_report = None
+        # El backend se compara con fp32 la primera vez que se activa el modelo
+        self.verified = backend == 'fp32'
+
+        self.size_bytes = module_size_bytes(model)
+        if backend == 'int8':
+            # Solo la cuantización dinámica copia los pesos; torch.compile y autocast (bf16)
+            # comparten los parámetros del modelo fp32 y no ocupan memoria adicional
+            self.size_bytes += module_size_bytes(inference_model)
+
+
+class ModelRegistry:
+    """
+    Mantiene varios modelos cargados en el proceso y expulsa el usado hace más tiempo
+
+    El número de modelos está limitado por models.max_loaded y su tamaño conjunto por
+    models.max_memory_mb. Si un modelo se está cargando en otro hilo (por ejemplo,
+    la precarga en segundo plano), get() espera a que termine en lugar de cargarlo dos veces.
+    """
+
+    def __init__(self, config: Config, loader):
+        """
+        Args:
+            config: Configuración del proyecto
+            loader: Función (model_name, backend) -> LoadedModel que carga un modelo desde disco
+        """
+        self.loader = loader
+        self.max_models = max(1, config.get('models.max_loaded', 2))
+        self.max_memory_bytes = int(config.get('models.max_memory_mb', 2048) * 1024 * 1024)
+        self._models = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, backend: str) -> LoadedModel:
+        """Devuelve un modelo cargado, cargándolo si no está en el registro"""
+        key = (model_name, backend)
+        while True:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Otro hilo lo está cargando; si falla, se reintenta aquí
+            logger.info(f"Esperando a que termine la carga de {model_name}...")
+            loading.wait()
+
+        entry = None
+        try:
+            entry = self.loader(model_name, backend)
+        finally:
+            with self._lock:
+                if entry is not None:
+                    self._models[key] = entry
+                    self._evict(keep=key)
+                del self._loading[key]
+            loading.set()
+        return entry
+
+    def preload(self, model_name: str, backend: str) -> threading.Thread:
+        """Carga un modelo en un hilo en segundo plano"""
+        def run():
+            try:
+                self.get(model_name, backend)
+                logger.debug(f"Modelo {model_name} precargado")
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo precargar {model_name}: {str(e)}")
+
+        thread = threading.Thread(target=run, name=f"preload-{model_name}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, model_name: str, backend: str) -> bool:
+        with self._lock:
+            return (model_name, backend) in self._models
+
+    def loaded_models(self) -> list:
+        """Modelos cargados, del usado hace más tiempo al más reciente"""
+        with self._lock:
+            return [entry.name for entry in self._models.values()]
+
+    def _evict(self, keep: tuple):
+        """Expulsa los modelos usados hace más tiempo hasta respetar los límites (con el lock tomado)"""
+        def over_budget():
+            total = sum(entry.size_bytes for entry in self._models.values())
+            return len(self._models) > self.max_models or total > self.max_memory_bytes
+
+        while len(self._models) > 1 and over_budget():
+            key = next(key for key in self._models if key != keep)
+            entry = self._models.pop(key)
+            logger.info(f"Liberando el modelo {entry.name} de memoria (menos usado recientemente)")
@@ -0,0 +1,13 @@
+"""
+Modelos de embeddings disponibles
+
+Módulo sin dependencias de torch ni transformers, para que los scripts que solo necesitan los
+nombres (p. ej. las etiquetas de un informe) no carguen el modelo.
+"""
+
+AVAILABLE_MODELS = {
+    "sentence-transformers/all-MiniLM-L6-v2": "MiniLM-L6 - Modelo ligero (80MB) optimizado para embeddings",
+    "BAAI/bge-small-en-v1.5": "BGE-small - Modelo pequeño (120MB) con gran rendimiento",
+    "intfloat/multilingual-e5-small": "E5-small - Modelo multilingüe pequeño (140MB)",
+    "thenlper/gte-small": "GTE-small - General Text Embeddings pequeño (170MB)"
+}
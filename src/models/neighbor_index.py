@@ -0,0 +1,179 @@
+import logging
+import time
+from pathlib import Path
+import numpy as np
+
+from src.models.embedding_reader import EmbeddingReader, read_metadata, read_metadata_tokens
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma L2 unidad (las filas nulas se dejan a cero)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices de las k puntuaciones más altas de cada fila, ordenados de mayor a menor"""
+    k = min(k, scores.shape[-1])
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def load_embedding_matrix(tensor_file: Path, metadata_file: Path = None) -> np.ndarray:
+    """
+    Abre la matriz de un conjunto guardado sin copiarla (ver EmbeddingReader)
+
+    Los tensores float16/int8 se descuantizan por bloques al acceder a sus filas.
+    """
+    return EmbeddingReader(tensor_file, metadata_file).matrix
+
+
+class NeighborIndex:
+    """Búsqueda de vecinos más cercanos por similitud coseno sobre un conjunto de embeddings"""
+
+    def __init__(self, embeddings: np.ndarray, tokens: list[str], block_rows: int = 65536):
+        if len(embeddings) != len(tokens):
+            raise ValueError(f"Hay {len(embeddings)} vectores y {len(tokens)} tokens")
+
+        self.tokens = tokens
+        self.block_rows = block_rows
+        self.token_rows = {}
+        for row, token in enumerate(tokens):
+            self.token_rows.setdefault(token, row)
+
+        # Normalizar una sola vez, por bloques, para que el producto escalar sea el coseno
+        self.vectors = np.empty(embeddings.shape, dtype=np.float32)
+        for start in range(0, len(embeddings), block_rows):
+            self.vectors[start:start + block_rows] = normalize_rows(embeddings[start:start + block_rows])
+
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+
+    @classmethod
+    def from_files(cls, tensor_file: Path, metadata_file: Path, **kwargs) -> 'NeighborIndex':
+        """Crea el índice a partir de los archivos de un conjunto guardado"""
+        logger.info(f"Cargando {tensor_file}...")
+        reader = EmbeddingReader(tensor_file, metadata_file)
+        return cls(reader.matrix, reader.tokens, **kwargs)
+
+    def build_ivf(self, nlist: int = None, iterations: int = 10, sample_size: int = 65536, seed: int = 0):
+        """
+        Construye un índice IVF: agrupa los vectores con k-means esférico y guarda una lista por grupo
+
+        Args:
+            nlist: Número de grupos (por defecto, unas 4 * sqrt(N))
+            iterations: Iteraciones de k-means sobre la muestra de entrenamiento
+            sample_size: Vectores usados para entrenar los centroides
+            seed: Semilla del muestreo
+        """
+        n = len(self.vectors)
+        nlist = min(nlist or int(4 * np.sqrt(n)), n)
+        rng = np.random.default_rng(seed)
+        started = time.perf_counter()
+
+        sample = self.vectors[np.sort(rng.choice(n, size=min(sample_size, n), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            # Los grupos vacíos conservan su centroide anterior
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, self.block_rows):
+            block = self.vectors[start:start + self.block_rows]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        # Listas invertidas en formato CSR: filas ordenadas por grupo y desplazamientos
+        self.list_rows = np.argsort(assignment, kind='stable')
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        self.centroids = centroids
+
+        logger.info(f"Índice IVF con {nlist} listas construido en {time.perf_counter() - started:.1f}s")
+
+    def search(self, vector: np.ndarray, k: int = 10, nprobe: int = None, exclude_row: int = None) -> list:
+        """
+        Busca los k vecinos más cercanos de un vector
+
+        Args:
+            vector: Vector de consulta (no hace falta normalizarlo)
+            k: Número de vecinos
+            nprobe: Listas a explorar si hay índice IVF (None: búsqueda exacta)
+            exclude_row: Fila a excluir de los resultados (el propio token consultado)
+
+        Returns:
+            list: Tuplas (token, similitud, fila) ordenadas de mayor a menor similitud
+        """
+        query = normalize_rows(np.asarray(vector, dtype=np.float32).reshape(-1))
+        if query.shape[0] != self.vectors.shape[1]:
+            raise ValueError(
+                f"La consulta tiene {query.shape[0]} dimensiones y el conjunto {self.vectors.shape[1]}; "
+                f"codifícala con el modelo con el que se extrajo el conjunto"
+            )
+        wanted = k + (exclude_row is not None)
+
+        if nprobe and self.centroids is not None:
+            rows, scores = self._search_ivf(query, wanted, nprobe)
+        else:
+            rows, scores = self._search_exact(query, wanted)
+
+        return [
+            (self.tokens[row], float(score), int(row))
+            for row, score in zip(rows, scores)
+            if row != exclude_row
+        ][:k]
+
+    def search_token(self, token: str, k: int = 10, nprobe: int = None) -> list:
+        """Busca los vecinos de un token del conjunto; devuelve None si no existe"""
+        row = self.token_rows.get(token)
+        if row is None:
+            return None
+        return self.search(self.vectors[row], k, nprobe, exclude_row=row)
+
+    def _search_exact(self, query: np.ndarray, k: int) -> tuple:
+        """Producto matricial por bloques con selección parcial de los k mejores de cada bloque"""
+        best_rows = []
+        best_scores = []
+        for start in range(0, len(self.vectors), self.block_rows):
+            scores = self.vectors[start:start + self.block_rows] @ query
+            local = top_k(scores, k)
+            best_rows.append(local + start)
+            best_scores.append(scores[local])
+
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        order = top_k(scores, k)
+        return rows[order], scores[order]
+
+    def _search_ivf(self, query: np.ndarray, k: int, nprobe: int) -> tuple:
+        """Explora solo las listas de los nprobe centroides más cercanos"""
+        lists = top_k(self.centroids @ query, nprobe)
+        rows = np.concatenate([
+            self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+        ])
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+
+        scores = self.vectors[rows] @ query
+        order = top_k(scores, k)
+        return rows[order], scores[order]
+
+
+def load_index(config: Config, tensor_file: Path, metadata_file: Path, use_ivf: bool = None) -> NeighborIndex:
+    """Carga un conjunto y construye el índice IVF si se pide o si el conjunto es grande"""
+    index = NeighborIndex.from_files(tensor_file, metadata_file)
+    if use_ivf is None:
+        use_ivf = len(index.tokens) >= config.get('neighbors.ivf_min_rows', 100000)
+    if use_ivf:
+        index.build_ivf(config.get('neighbors.nlist'))
+    return index
@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+import numpy as np
+import torch
+
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Gestor de modelos propio de cada proceso de trabajo (se carga una sola vez por proceso)
+_worker_manager = None
+
+
+def _init_worker(config: Config, model_name: str, threads: int, backend: str):
+    """Inicializa un proceso de trabajo: fija sus hilos y carga el modelo con el backend del proceso principal"""
+    global _worker_manager
+
+    # Importación diferida para evitar el ciclo con model_manager
+    from src.models.model_manager import ModelManager
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    manager = ModelManager(config)
+    # El proceso principal ya verificó el backend frente a fp32
+    if manager.load_model(model_name, backend=backend, verify=False):
+        _worker_manager = manager
+
+
+def _get_worker_manager():
+    if _worker_manager is None:
+        raise RuntimeError(f"No se pudo cargar el modelo en el proceso de trabajo {os.getpid()}")
+    return _worker_manager
+
+
+def _embed_vocabulary(task: tuple) -> tuple:
+    """Procesa un lote de tokens ya tokenizados en un proceso de trabajo"""
+    rows, input_ids, tokens, views = task
+    manager = _get_worker_manager()
+
+    cache = manager.cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    embeddings = manager.embed_vocabulary_batch(input_ids, tokens, views)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+
+    if isinstance(embeddings, dict):
+        embeddings = {name: view_embeddings.numpy() for name, view_embeddings in embeddings.items()}
+    else:
+        embeddings = embeddings.numpy()
+
+    # Las métricas del lote viajan con el resultado para sumarlas en el proceso principal
+    return rows, embeddings, hits, misses, manager.metrics.take()
+
+
+def _embed_texts(texts: list) -> tuple:
+    """Procesa un lote de textos en un proceso de trabajo"""
+    manager = _get_worker_manager()
+    embeddings = manager.encode_batch(texts)
+    return texts, embeddings, manager.metrics.take()
+
+
+class ParallelExtractor:
+    """Reparte la inferencia entre varios procesos, cada uno con su propia copia del modelo"""
+
+    def __init__(self, config: Config, model_name: str, workers: int = None, threads_per_worker: int = None,
+                 backend: str = 'fp32'):
+        self.config = config
+        self.model_name = model_name
+        self.backend = backend
+        self.prefetch = config.get('parallel.prefetch', 2)
+        self.workers = workers or config.get('parallel.workers', 1)
+        self.threads_per_worker = (
+            threads_per_worker
+            or config.get('parallel.threads_per_worker')
+            or max(1, (os.cpu_count() or 1) // self.workers)
+        )
+
+    @staticmethod
+    def is_enabled(config: Config) -> bool:
+        """Indica si la configuración pide más de un proceso de trabajo"""
+        return (config.get('parallel.workers', 1) or 1) > 1
+
+    def iter_vocabulary(self, tasks, cache=None, metrics=None):
+        """
+        Procesa lotes de (rows, input_ids, tokens, views) en paralelo
+
+        Args:
+            tasks: Iterable de lotes del vocabulario
+            cache: Caché del proceso principal donde acumular los aciertos de los procesos de trabajo
+            metrics: RunMetrics del proceso principal donde sumar las etapas de los procesos de trabajo
+
+        Yields:
+            tuple: (rows, embeddings) en el mismo orden que los lotes de entrada; embeddings
+                es un dict {vista: tensor} si el lote pide varias vistas
+        """
+        for rows, embeddings, hits, misses, snapshot in self._imap(_embed_vocabulary, tasks):
+            if cache:
+                cache.record(hits, misses)
+            if metrics:
+                metrics.merge(snapshot)
+            if isinstance(embeddings, dict):
+                yield rows, {name: torch.from_numpy(view_embeddings) for name, view_embeddings in embeddings.items()}
+            else:
+                yield rows, torch.from_numpy(embeddings)
+
+    def iter_texts(self, batches, metrics=None):
+        """
+        Procesa lotes de textos en paralelo
+
+        Args:
+            batches: Iterable de lotes de textos
+            metrics: RunMetrics del proceso principal donde sumar las etapas de los procesos de trabajo
+
+        Yields:
+            tuple: (texts, embeddings) de cada lote, en el mismo orden que la entrada
+        """
+        for texts, embeddings, snapshot in self._imap(_embed_texts, batches):
+            if metrics:
+                metrics.merge(snapshot)
+            yield texts, embeddings
+
+    def _imap(self, function, tasks):
+        """
+        Ejecuta function sobre cada tarea en el pool y devuelve los resultados en orden
+
+        Solo se adelantan prefetch tareas por proceso, de modo que una entrada en
+        streaming no se lee entera en memoria si el modelo va más lento que la lectura.
+        """
+        logger.info(
+            f"Iniciando {self.workers} procesos de trabajo con {self.threads_per_worker} hilos cada uno..."
+        )
+
+        # 'spawn' evita heredar el estado de los hilos de PyTorch del proceso principal
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(self.config, self.model_name, self.threads_per_worker, self.backend)
+        ) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(function, (task,)))
+                if len(pending) >= self.workers * self.prefetch:
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
@@ -0,0 +1,100 @@
+import logging
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Formatos de almacenamiento: float32 sin cambios, float16, o int8 con escala por fila o por dimensión
+STORAGE_MODES = ('float32', 'float16', 'int8_row', 'int8_dim')
+
+
+def scales_file(npy_file: Path) -> Path:
+    """Archivo con las escalas de un tensor int8"""
+    npy_file = Path(npy_file)
+    return npy_file.with_name(f"{npy_file.stem}_scales.npy")
+
+
+def quantization_file(npy_file: Path) -> Path:
+    """Archivo JSON con el formato y el error de reconstrucción de un tensor"""
+    npy_file = Path(npy_file)
+    return npy_file.with_name(f"{npy_file.stem}_quantization.json")
+
+
+class QuantizedMatrix:
+    """
+    Vista de solo lectura sobre un tensor float16/int8 que descuantiza solo las filas pedidas
+
+    Admite los mismos accesos por filas que un array (enteros, slices, arrays de índices),
+    de modo que se puede recorrer por bloques igual que un .npy float32 mapeado en memoria.
+    """
+
+    def __init__(self, data: np.ndarray, scales: np.ndarray = None):
+        self.data = data
+        self.scales = scales
+        self.shape = data.shape
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, index) -> np.ndarray:
+        block = np.asarray(self.data[index], dtype=np.float32)
+        if self.scales is None:
+            return block
+        if self.scales.shape[0] == 1:
+            # Escala por dimensión: la misma fila de escalas para todas las filas
+            return block * self.scales[0]
+        return block * self.scales[index]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        array = self[:]
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+
+def open_stored_matrix(npy_file: Path):
+    """
+    Abre un tensor guardado mapeado en memoria
+
+    Returns:
+        np.ndarray si está en float32; QuantizedMatrix si está en float16 o int8
+    """
+    data = np.load(npy_file, mmap_mode='r')
+    if data.dtype == np.int8:
+        return QuantizedMatrix(data, np.load(scales_file(npy_file)))
+    if data.dtype != np.float32:
+        return QuantizedMatrix(data)
+    return data
+
+
+def quantize_chunk(chunk: np.ndarray, mode: str, dim_scales: np.ndarray = None) -> tuple:
+    """
+    Cuantiza un bloque de filas float32
+
+    Returns:
+        tuple: (datos cuantizados, escalas por fila o None)
+    """
+    if mode == 'float16':
+        return chunk.astype('<f2'), None
+
+    if mode == 'int8_row':
+        scales = np.abs(chunk).max(axis=1, keepdims=True) / 127
+    else:
+        scales = dim_scales
+    safe_scales = np.where(scales > 0, scales, 1)
+    data = np.clip(np.rint(chunk / safe_scales), -127, 127).astype(np.int8)
+    return data, (safe_scales.astype('<f4') if mode == 'int8_row' else None)
+
+
+def dimension_scales(matrix: np.ndarray, chunk_rows: int) -> np.ndarray:
+    """Escala int8 de cada dimensión (máximo absoluto / 127), calculada por bloques"""
+    peak = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, len(matrix), chunk_rows):
+        np.maximum(peak, np.abs(matrix[start:start + chunk_rows]).max(axis=0), out=peak)
+    return np.where(peak > 0, peak / 127, 1).astype('<f4')[np.newaxis, :]
+
+
+def cosine_drift(original: np.ndarray, restored: np.ndarray) -> np.ndarray:
+    """1 - coseno entre cada fila original y su reconstrucción (0 para filas nulas)"""
+    dots = np.einsum('ij,ij->i', original, restored, dtype=np.float64)
+    norms = np.linalg.norm(original, axis=1) * np.linalg.norm(restored, axis=1)
+    return np.where(norms > 0, 1 - dots / np.maximum(norms, 1e-30), 0.0)
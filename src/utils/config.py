@@ -28,10 +28,18 @@ class Config:
             return value
         return self.config.get(key, default)
     
+    def get_default_model(self):
+        """Obtiene el modelo por defecto"""
+        return self.get('default_model', 'sentence-transformers/all-MiniLM-L6-v2')
+
     def get_output_dir(self):
         """Obtiene el directorio de salida"""
         return self.get('output_dir', 'embeddings_output')
         
+    def set_output_dir(self, output_dir: str):
+        """Cambia el directorio de salida para esta ejecución"""
+        self.config['output_dir'] = str(output_dir)
+
     def get_log_dir(self):
         """Obtiene el directorio de logs"""
         return self.get('tensorboard.log_dir', 'logs')
@@ -0,0 +1,220 @@
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "vector_explorer"
+
+
+def peak_rss_bytes() -> int:
+    """Memoria residente máxima del proceso, o None si la plataforma no la expone"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux la da en KiB y macOS en bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss)
+    except ImportError:
+        return None
+
+
+class RunMetrics:
+    """
+    Tiempos por etapa y contadores de una ejecución de extracción
+
+    Las etapas (tokenización, forward pass, pooling, copias a numpy, escritura...) se miden
+    con stage(); los contadores (filas, tokens, bytes escritos...) se suman con add().
+    """
+
+    def __init__(self, labels: dict = None):
+        self.labels = dict(labels or {})
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Acumula el tiempo del bloque en la etapa indicada"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, counter: str, value: int = 1):
+        """Suma value al contador indicado"""
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def take(self) -> dict:
+        """Devuelve y reinicia etapas y contadores (para enviarlos desde un proceso de trabajo)"""
+        snapshot = {
+            'stages': {name: (seconds, self.calls[name]) for name, seconds in self.stages.items()},
+            'counters': self.counters
+        }
+        self.stages = {}
+        self.calls = {}
+        self.counters = {}
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        """Suma las etapas y los contadores medidos en otro proceso"""
+        for name, (seconds, calls) in snapshot['stages'].items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + calls
+        for counter, value in snapshot['counters'].items():
+            self.add(counter, value)
+
+    def finish(self):
+        """Marca el final de la ejecución"""
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        """Resumen de la ejecución: etapas, contadores, ritmos, padding y memoria"""
+        duration = (self.finished or time.perf_counter()) - self.started
+        rows = self.counters.get('rows', 0)
+        tokens = self.counters.get('tokens', 0)
+        processed = self.counters.get('processed_tokens', 0)
+
+        return {
+            'labels': self.labels,
+            'duration_s': duration,
+            'stages': {
+                name: {
+                    'seconds': seconds,
+                    'calls': self.calls[name],
+                    'share': seconds / duration if duration else 0.0
+                }
+                for name, seconds in sorted(self.stages.items(), key=lambda item: -item[1])
+            },
+            'counters': dict(self.counters),
+            'rows_per_s': rows / duration if duration else 0.0,
+            'tokens_per_s': tokens / duration if duration else 0.0,
+            'padding_ratio': (processed - tokens) / processed if processed else 0.0,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'bytes_written': self.counters.get('bytes_written', 0)
+        }
+
+    def to_prometheus(self, summary: dict = None) -> str:
+        """Resumen en formato de texto de Prometheus"""
+        summary = summary or self.summary()
+        labels = ','.join(f'{key}="{self._escape_label(value)}"' for key, value in self.labels.items())
+
+        def sample(name: str, value, extra: dict = None) -> str:
+            all_labels = labels
+            if extra:
+                extra_labels = ','.join(f'{key}="{self._escape_label(val)}"' for key, val in extra.items())
+                all_labels = f"{labels},{extra_labels}" if labels else extra_labels
+            return f"{PROMETHEUS_PREFIX}_{name}{{{all_labels}}} {value}" if all_labels else f"{PROMETHEUS_PREFIX}_{name} {value}"
+
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Tiempo acumulado por etapa",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge"
+        ]
+        lines += [sample('stage_seconds', stage['seconds'], {'stage': name}) for name, stage in summary['stages'].items()]
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_calls Llamadas por etapa",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_calls gauge"
+        ]
+        lines += [sample('stage_calls', stage['calls'], {'stage': name}) for name, stage in summary['stages'].items()]
+
+        for counter, value in sorted(summary['counters'].items()):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter", sample(f"{counter}_total", value)]
+
+        gauges = {
+            'duration_seconds': summary['duration_s'],
+            'rows_per_second': summary['rows_per_s'],
+            'tokens_per_second': summary['tokens_per_s'],
+            'padding_ratio': summary['padding_ratio'],
+            'peak_rss_bytes': summary['peak_rss_bytes']
+        }
+        for name, value in gauges.items():
+            if value is not None:
+                lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge", sample(name, value)]
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, config: Config, prefix: str = None) -> dict:
+        """
+        Escribe el resumen como JSON y, si metrics.prometheus está activado, en formato Prometheus
+
+        Returns:
+            dict: Resumen escrito
+        """
+        if self.finished is None:
+            self.finish()
+        summary = self.summary()
+
+        output_dir = Path(config.get_output_dir())
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{prefix}_metrics" if prefix else "metrics"
+
+        with open(output_dir / f"{stem}.json", 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        if config.get('metrics.prometheus', False):
+            with open(output_dir / f"{stem}.prom", 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus(summary))
+
+        self.log_summary(summary)
+        return summary
+
+    def log_summary(self, summary: dict = None):
+        """Muestra el resumen de la ejecución"""
+        summary = summary or self.summary()
+        logger.info(
+            f"📈 {summary['counters'].get('rows', 0)} filas en {summary['duration_s']:.1f}s "
+            f"({summary['rows_per_s']:.0f} filas/s, {summary['tokens_per_s']:.0f} tokens/s, "
+            f"padding {summary['padding_ratio']:.1%})"
+        )
+        for name, stage in summary['stages'].items():
+            logger.info(f"   {name:<16} {stage['seconds']:8.2f}s  {stage['share']:6.1%}  ({stage['calls']} llamadas)")
+        if summary['peak_rss_bytes']:
+            logger.info(f"   Memoria máxima: {summary['peak_rss_bytes'] / 2**20:.0f} MiB")
+        if summary['bytes_written']:
+            logger.info(f"   Escrito en disco: {summary['bytes_written'] / 2**20:.1f} MiB")
+
+    @staticmethod
+    def _escape_label(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def profile_batches(iterable, batches: int, trace_file: Path):
+    """
+    Ejecuta torch.profiler mientras se consumen los primeros lotes de un iterable
+
+    Al terminar la muestra guarda una traza de Chrome en trace_file y muestra las
+    operaciones más costosas; el resto de lotes se genera sin perfilar.
+    """
+    from torch.profiler import ProfilerActivity, profile
+
+    iterator = iter(iterable)
+    with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as profiler:
+        for _ in range(batches):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            yield item
+
+    Path(trace_file).parent.mkdir(parents=True, exist_ok=True)
+    profiler.export_chrome_trace(str(trace_file))
+    logger.info(f"Perfil de {batches} lotes guardado en {trace_file}")
+    logger.info("\n" + profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+
+    yield from iterator
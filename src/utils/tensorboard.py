@@ -2,44 +2,167 @@ import subprocess
 import webbrowser
 from pathlib import Path
 import logging
-from time import sleep
+from time import monotonic, sleep
 import os
+import re
+import json
+import socket
+import urllib.request
+import numpy as np
 
+from src.models.embedding_catalog import EmbeddingCatalog
+from src.models.embedding_reader import EmbeddingReader
 from src.utils.config import Config
 
 logger = logging.getLogger(__name__)
 
+
+def projector_embedding_entry(tensor_name: str, tensor_path: str, metadata_path: str = None,
+                              tensor_shape: tuple = None) -> str:
+    """
+    Genera una entrada 'embeddings {}' para projector_config.pbtxt
+
+    Si se indica tensor_shape, el proyector lee tensor_path como float32 binario little-endian.
+    """
+    lines = [
+        'embeddings {',
+        f'  tensor_name: "{tensor_name}"',
+        f'  tensor_path: "{tensor_path}"'
+    ]
+    if metadata_path:
+        lines.append(f'  metadata_path: "{metadata_path}"')
+    if tensor_shape:
+        lines.extend(f'  tensor_shape: {dim}' for dim in tensor_shape)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
 class TensorBoardManager:
-    """Gestiona la visualización con TensorBoard"""
+    """
+    Gestiona la visualización con TensorBoard
+
+    TensorBoard se inicia una sola vez y se reutiliza entre sesiones de la CLI: su PID y su
+    puerto se guardan en tensorboard.pid dentro del directorio de salida, y antes de lanzar
+    otro se comprueba si ya hay uno sirviendo ese directorio. Como el proyector lee
+    projector_config.pbtxt al cargar la página, para cambiar de conjuntos basta con
+    reescribir la configuración y recargar el navegador.
+    """
     
     def __init__(self, config: Config):
         self.config = config
         self.output_dir = Path(self.config.get('output_dir', 'embeddings_output'))
         self.output_dir.mkdir(exist_ok=True)
+        self.pid_file = self.output_dir / "tensorboard.pid"
         self.process = None
 
-    def prepare_projector_config(self):
-        """Prepara el archivo de configuración para TensorBoard"""
-        if not (self.output_dir / "tensor.tsv").exists() or not (self.output_dir / "metadata.tsv").exists():
+    def prepare_projector_config(self, config_files: list = None, sets: list = None):
+        """
+        Prepara el archivo de configuración para TensorBoard con varios conjuntos a la vez
+
+        Cada conjunto aparece como un tensor propio en el desplegable del proyector. Si existe
+        una versión reducida de un conjunto (generada por EmbeddingWriter según reduction.*),
+        el proyector carga esa.
+
+        Args:
+            config_files: projector_config.pbtxt concretos que combinar (p. ej. las vistas de
+                una extracción por capas y pooling)
+            sets: Nombres de conjuntos del manifiesto; si no se indican ni estos ni config_files,
+                se incluyen los tensorboard.max_sets conjuntos más recientes
+        """
+        if config_files:
+            labelled = [(Path(config_file).stem.rsplit('_projector_config', maxsplit=1)[0], Path(config_file))
+                        for config_file in config_files]
+        else:
+            entries = EmbeddingCatalog(self.output_dir).entries()
+            if sets is not None:
+                wanted = set(sets)
+                entries = [entry for entry in entries if entry['name'] in wanted]
+            else:
+                entries = entries[:self.config.get('tensorboard.max_sets', 20)]
+            labelled = [
+                (entry['name'], self.output_dir / entry['config'])
+                for entry in entries
+                if entry.get('config') and (self.output_dir / entry['config']).exists()
+            ]
+
+        content = [self._relabel(Path(config_file).read_text(encoding='utf-8'), label)
+                   for label, config_file in labelled]
+        if not config_files and sets is None:
+            # El conjunto sin nombre (tensor.* / metadata.tsv) de versiones anteriores
+            unnamed = self._unnamed_set_entry()
+            if unnamed:
+                content.append(unnamed)
+        if not content:
             raise FileNotFoundError("No se encontraron archivos de embeddings. Extrae embeddings primero.")
-            
-        # Crear archivo de configuración
-        config_content = '''embeddings {
-  tensor_name: "embeddings"
-  tensor_path: "tensor.tsv"
-  metadata_path: "metadata.tsv"
-}'''
+        for entry in content:
+            self._ensure_projector_tensors(entry)
+
         with open(self.output_dir / "projector_config.pbtxt", 'w') as f:
-            f.write(config_content)
+            f.write(''.join(content))
+        logger.info(f"Proyector configurado con {len(content)} conjuntos")
 
-    def start_tensorboard(self):
-        """Inicia TensorBoard con la configuración actual, detectando el entorno automáticamente"""
+    def _ensure_projector_tensors(self, config_content: str):
+        """
+        Genera los .bytes float32 que la configuración necesita y no existen
+
+        Los conjuntos cuantizados solo guardan el .npy compacto; la copia float32 que lee
+        el proyector se escribe por bloques (descuantizada) al visualizarlos por primera vez.
+        """
+        chunk_rows = self.config.get('output.chunk_rows', 65536)
+        for tensor_path in re.findall(r'tensor_path: "((?:[^"\\]|\\.)*)"', config_content):
+            bytes_file = self.output_dir / tensor_path
+            if bytes_file.suffix != '.bytes' or bytes_file.exists() or not bytes_file.with_suffix('.npy').exists():
+                continue
+            logger.info(f"Generando {bytes_file.name} (float32) para el proyector...")
+            reader = EmbeddingReader(bytes_file.with_suffix('.npy'), config=self.config)
+            tmp_file = bytes_file.with_name(f"{bytes_file.name}.tmp")
+            with open(tmp_file, 'wb') as f:
+                for _, chunk in reader.iter_chunks(chunk_rows):
+                    f.write(np.ascontiguousarray(chunk, dtype='<f4').tobytes())
+            reader.close()
+            os.replace(tmp_file, bytes_file)
+
+    def _unnamed_set_entry(self) -> str:
+        """Entrada del conjunto sin nombre, o None si no existe"""
+        for prefix in ("reduced_", ""):
+            tensor_bytes = self.output_dir / f"{prefix}tensor.bytes"
+            tensor_npy = tensor_bytes.with_suffix('.npy')
+            tensor_tsv = self.output_dir / f"{prefix}tensor.tsv"
+            metadata = self.output_dir / f"{prefix}metadata.tsv"
+            if (tensor_bytes.exists() or tensor_npy.exists() or tensor_tsv.exists()) and metadata.exists():
+                break
+        else:
+            return None
+
+        if tensor_npy.exists():
+            # El .bytes de un tensor cuantizado se genera en prepare_projector_config
+            # La forma se lee de la cabecera del .npy gemelo sin cargar los datos
+            shape = np.load(tensor_bytes.with_suffix('.npy'), mmap_mode='r').shape
+            return projector_embedding_entry("embeddings", tensor_bytes.name, metadata.name, shape)
+        return projector_embedding_entry("embeddings", tensor_tsv.name, metadata.name)
+
+    @staticmethod
+    def _relabel(config_content: str, label: str) -> str:
+        """Sustituye el tensor_name de la configuración de un conjunto por su nombre"""
+        label = label.replace('\\', '\\\\').replace('"', '\\"')
+        return re.sub(r'tensor_name: "(?:[^"\\]|\\.)*"', lambda _: f'tensor_name: "{label}"', config_content)
+
+    def start_tensorboard(self, config_files: list = None, sets: list = None):
+        """
+        Muestra los conjuntos en TensorBoard, reutilizando el proceso si ya está en marcha
+
+        Args:
+            config_files: projector_config.pbtxt concretos que mostrar
+            sets: Nombres de conjuntos del manifiesto que mostrar (por defecto, los más recientes)
+        """
         try:
-            self.prepare_projector_config()
-            if self.process:
-                logger.info("TensorBoard ya está corriendo")
+            self.prepare_projector_config(config_files, sets)
+            port = self._running_port()
+            if port:
+                logger.info(f"TensorBoard ya está corriendo: recarga http://localhost:{port}/#projector para ver los conjuntos")
                 return
-            port = self.config.get('tensorboard', {}).get('default_port', 6006)
+
+            port = self._free_port(self.config.get('tensorboard.default_port', 6006))
+            logdir = str(self.output_dir.resolve())
             # Detección automática de comando para Windows
             tb_cmd = None
             if os.name == 'nt':
@@ -47,32 +170,39 @@ class TensorBoardManager:
                 venv_tb = Path('territory') / 'Scripts' / 'tensorboard.exe'
                 venv_py = Path('territory') / 'Scripts' / 'python.exe'
                 if venv_tb.exists():
-                    tb_cmd = [str(venv_tb), '--logdir', str(self.output_dir), '--port', str(port)]
+                    tb_cmd = [str(venv_tb), '--logdir', logdir, '--port', str(port)]
                 elif venv_py.exists():
-                    tb_cmd = [str(venv_py), '-m', 'tensorboard.main', '--logdir', str(self.output_dir), '--port', str(port)]
+                    tb_cmd = [str(venv_py), '-m', 'tensorboard.main', '--logdir', logdir, '--port', str(port)]
                 else:
-                    tb_cmd = ['tensorboard', '--logdir', str(self.output_dir), '--port', str(port)]
+                    tb_cmd = ['tensorboard', '--logdir', logdir, '--port', str(port)]
             else:
-                tb_cmd = ['tensorboard', '--logdir', str(self.output_dir), '--port', str(port)]
+                tb_cmd = ['tensorboard', '--logdir', logdir, '--port', str(port)]
             logger.info(f"Iniciando TensorBoard en el puerto {port}...")
             startupinfo = None
+            popen_options = {}
             if os.name == 'nt':
                 startupinfo = subprocess.STARTUPINFO()
                 startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                popen_options['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+            else:
+                # Sesión propia: TensorBoard sigue en marcha al salir de la CLI
+                popen_options['start_new_session'] = True
             try:
-                self.process = subprocess.Popen(
-                    tb_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    startupinfo=startupinfo
-                )
+                # La salida va a un archivo: con PIPE, TensorBoard se bloquearía al llenarse el búfer
+                with open(self.output_dir / "tensorboard.log", 'w') as log_file:
+                    self.process = subprocess.Popen(
+                        tb_cmd,
+                        stdout=log_file,
+                        stderr=subprocess.STDOUT,
+                        startupinfo=startupinfo,
+                        **popen_options
+                    )
             except FileNotFoundError:
                 logger.error("❌ TensorBoard no está instalado o no se encuentra en el entorno. Por favor, instala TensorBoard con 'pip install tensorboard'.")
                 return
-            sleep(2)
-            if self.process.poll() is not None:
-                stderr = self.process.stderr.read().decode()
-                raise RuntimeError(f"TensorBoard falló al iniciar: {stderr}")
+            self._wait_until_ready(port)
+            with open(self.pid_file, 'w', encoding='utf-8') as f:
+                json.dump({'pid': self.process.pid, 'port': port, 'logdir': logdir}, f)
             url = f"http://localhost:{port}/#projector"
             logger.info(f"\n✨ TensorBoard iniciado en {url}")
             logger.info("Abriendo navegador...")
@@ -84,3 +214,90 @@ class TensorBoardManager:
             if self.process:
                 self.process.kill()
                 self.process = None
+
+    def stop_tensorboard(self):
+        """Detiene el TensorBoard registrado en tensorboard.pid, si sigue en marcha"""
+        port = self._running_port()
+        if port:
+            pid = self._read_pid_file()['pid']
+            try:
+                os.kill(pid, 15)
+                logger.info(f"TensorBoard (PID {pid}) detenido")
+            except OSError as e:
+                logger.error(f"❌ No se pudo detener TensorBoard: {str(e)}")
+        if self.pid_file.exists():
+            self.pid_file.unlink()
+        self.process = None
+
+    def _running_port(self) -> int:
+        """
+        Puerto de un TensorBoard que ya sirve el directorio de salida, o None
+
+        Primero se prueba el registrado en tensorboard.pid (si el proceso sigue vivo) y
+        luego el puerto por defecto, por si lo inició otra sesión sin dejar registro.
+        """
+        candidates = []
+        saved = self._read_pid_file()
+        if saved and self._pid_alive(saved.get('pid')):
+            candidates.append(saved['port'])
+        elif saved:
+            # Registro obsoleto: el proceso ya no existe
+            self.pid_file.unlink()
+        candidates.append(self.config.get('tensorboard.default_port', 6006))
+
+        for port in candidates:
+            if self._served_logdir(port) == self.output_dir.resolve():
+                return port
+        return None
+
+    def _free_port(self, port: int, attempts: int = 20) -> int:
+        """Primer puerto libre a partir de port (el por defecto puede estar ocupado por otro servicio)"""
+        for candidate in range(port, port + attempts):
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                if sock.connect_ex(('127.0.0.1', candidate)) != 0:
+                    return candidate
+        raise RuntimeError(f"No hay puertos libres entre {port} y {port + attempts - 1}")
+
+    def _wait_until_ready(self, port: int):
+        """Espera a que TensorBoard responda por HTTP (en lugar de una pausa fija)"""
+        timeout = self.config.get('tensorboard.start_timeout', 60)
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            if self.process.poll() is not None:
+                log = (self.output_dir / "tensorboard.log").read_text(encoding='utf-8', errors='replace')
+                raise RuntimeError(f"TensorBoard falló al iniciar: {log[-2000:]}")
+            if self._served_logdir(port) is not None:
+                return
+            sleep(0.2)
+        raise RuntimeError(f"TensorBoard no respondió en {timeout} s (ver {self.output_dir / 'tensorboard.log'})")
+
+    @staticmethod
+    def _served_logdir(port: int) -> Path:
+        """Directorio que sirve el TensorBoard del puerto, o None si no hay un TensorBoard escuchando"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/data/environment", timeout=1) as response:
+                environment = json.load(response)
+        except (OSError, ValueError):
+            return None
+        location = environment.get('data_location') or ''
+        return Path(location).resolve() if location else Path()
+
+    def _read_pid_file(self) -> dict:
+        try:
+            with open(self.pid_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        if not pid:
+            return False
+        if os.name == 'nt':
+            # En Windows os.kill termina el proceso: basta con la comprobación HTTP del puerto
+            return True
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
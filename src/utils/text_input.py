@@ -0,0 +1,17 @@
+def iter_input_batches(source, batch_size: int = 32, skip: int = 0):
+    """Lee líneas no vacías de un archivo abierto y las agrupa en lotes, sin cargarlo entero"""
+    batch = []
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+        if skip:
+            # Líneas ya procesadas en una ejecución anterior
+            skip -= 1
+            continue
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,33 @@
+import re
+import numpy as np
+
+# Tokens especiales habituales: [CLS], [SEP], [unused12], <s>, </s>, <pad>...
+SPECIAL_TOKEN_PATTERN = re.compile(r'^(\[[^\[\]]+\]|<[^<>]+>)$')
+
+# Marcadores de inicio de palabra de SentencePiece y de BPE a nivel de byte
+WORD_START_MARKERS = ('▁', 'Ġ')
+
+TOKEN_KINDS = ('special', 'subword', 'word')
+
+
+def token_kinds(tokens: list) -> np.ndarray:
+    """
+    Clasifica cada token como 'special', 'subword' o 'word'
+
+    En vocabularios WordPiece las continuaciones empiezan por '##'. En vocabularios
+    SentencePiece/BPE son las palabras las que llevan marcador ('▁', 'Ġ'), por lo que
+    los tokens sin marcador se consideran continuaciones.
+    """
+    tokens = [str(token) for token in tokens]
+    marked = sum(token.startswith(WORD_START_MARKERS) for token in tokens)
+    uses_markers = marked > len(tokens) // 10
+
+    kinds = []
+    for token in tokens:
+        if SPECIAL_TOKEN_PATTERN.match(token):
+            kinds.append('special')
+        elif token.startswith('##') or (uses_markers and not token.startswith(WORD_START_MARKERS)):
+            kinds.append('subword')
+        else:
+            kinds.append('word')
+    return np.array(kinds)
@@ -0,0 +1,58 @@
+"""
+Lectura de conjuntos guardados con el formato original (tensor.tsv y metadata.tsv con encabezado "token")
+
+Ejecutar desde la raíz del repositorio: python -m unittest discover tests
+"""
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+
+from src.models.embedding_reader import EmbeddingReader, read_metadata
+
+
+def write_baseline_set(output_dir: Path, embeddings: np.ndarray, tokens: list, prefix: str = 'legacy') -> tuple:
+    """Escribe un conjunto como lo hacía la primera versión de EmbeddingWriter.save_embeddings"""
+    tensor_file = output_dir / f"{prefix}_tensor.tsv"
+    metadata_file = output_dir / f"{prefix}_metadata.tsv"
+    np.savetxt(tensor_file, embeddings, delimiter='\t')
+    with open(metadata_file, 'w', encoding='utf-8') as f:
+        f.write("token\n")  # Encabezado
+        for token in tokens:
+            f.write(f"{token}\n")
+    return tensor_file, metadata_file
+
+
+class BaselineSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self._tmp.name)
+        self.embeddings = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_legacy_header_is_skipped(self):
+        tokens = ['hola', '[CLS]', '##s', 'mundo']
+        tensor_file, metadata_file = write_baseline_set(self.output_dir, self.embeddings, tokens)
+
+        self.assertEqual(read_metadata(metadata_file), (tokens, {}))
+
+        reader = EmbeddingReader(tensor_file, metadata_file)
+        self.assertEqual(reader.shape, (4, 3))
+        self.assertEqual(reader.tokens, tokens)
+        np.testing.assert_array_equal(reader.read_rows(0, 4), self.embeddings)
+
+    def test_token_named_token_is_kept(self):
+        # Sin encabezado, el primer token puede ser "token": el número de líneas coincide con las filas
+        tokens = ['token', 'hola', 'mundo', 'adiós']
+        tensor_file, metadata_file = write_baseline_set(self.output_dir, self.embeddings, tokens)
+        metadata_file.write_text(''.join(f"{token}\n" for token in tokens), encoding='utf-8')
+
+        self.assertEqual(read_metadata(metadata_file)[0], tokens)
+        self.assertEqual(EmbeddingReader(tensor_file, metadata_file).tokens, tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()